@@ -0,0 +1,390 @@
+
+import mglib.engine.commitment as commitment
+import mglib.engine.numbers as numbers
+import mglib.engine.exponents as exponents
+import mglib.engine.parallel as parallel
+import mglib.engine.shamir as shamir
+import mglib.network.codec as codec
+from mglib.network.peer import SocketPeer
+from mglib.network.loopback import runPair
+import mglib.protocol.random as random
+import mglib.protocol.tpp as tpp
+
+import mglib.engine.utils as utils
+import mglib.progress as progress
+import interface.steam as steam
+import http.server
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+def timed(f, *args):
+	start = time.perf_counter()
+	result = f(*args)
+	return (result, time.perf_counter() - start)
+
+def benchCodec(elementCount : int = 100000, securities = (128, 512, 2048)):
+	"""
+	Encode and decode time, and bytes on the wire, of a list of DH ciphertexts,
+	the kind of payload received with peer.recv([range(dhPrime)] * elementCount).
+	"""
+	print(f"{'codec':>8} {'bits':>6} {'bytes':>12} {'encode s':>10} {'decode s':>10}")
+	for security in securities:
+		payload = [numbers.randomBelow(1 << security) for _ in range(elementCount)]
+		for c in codec.codecs.values():
+			try:
+				(raw, encodeTime) = timed(c.encode, payload)
+				(decoded, decodeTime) = timed(c.decode, raw)
+			except ValueError:
+				print(f"{c.name:>8} {security:>6} {'int-string digit limit exceeded':>34}")
+				continue
+			assert decoded == payload
+			print(f"{c.name:>8} {security:>6} {len(raw):>12} {encodeTime:>10.3f} {decodeTime:>10.3f}")
+
+def benchSocketThroughput(sizes = (1 << 20, 100 << 20, 1 << 30)):
+	"""
+	Raw message throughput of a pair of SocketPeers over a local socketpair.
+	"""
+	(a, b) = socket.socketpair()
+	peers = [None, None]
+	connectB = threading.Thread(target = lambda: peers.__setitem__(1, SocketPeer(b)))
+	connectB.start()
+	peers[0] = SocketPeer(a)
+	connectB.join()
+	(sender, receiver) = peers
+
+	print(f"{'bytes':>12} {'seconds':>10} {'MB/s':>10}")
+	for size in sizes:
+		payload = bytearray(size)
+		start = time.perf_counter()
+		t = threading.Thread(target = sender.sendBytes, args = (payload,))
+		t.start()
+		received = receiver.recvBytes()
+		t.join()
+		elapsed = time.perf_counter() - start
+		assert len(received) == size
+		del received
+		print(f"{size:>12} {elapsed:>10.3f} {size / elapsed / 1e6:>10.1f}")
+
+	sender.close()
+	receiver.close()
+
+def benchRoundTrips(security : int = 128, latency : float = 0.025):
+	"""
+	Simulated network time, and number of times a side had to wait for the peer,
+	of the protocol primitives over a link with the given one way latency.
+	"""
+	protocols = {
+		"coinFlip" : (lambda p: random.coinFlip(p, security),) * 2,
+		"sharedRandom" : (lambda p: random.sharedRandom(p, [6] * 100, security),) * 2,
+		"sharedRandomProbablePrime" : (lambda p: random.sharedRandomProbablePrime(p, security),) * 2,
+		"oblivious transfer" : (
+			lambda p: tpp.obliviousSend(p, list(range(100)), 2, security),
+			lambda p: tpp.obliviousReceive(p, 100, {3, 5}, security)),
+		"psi" : (lambda p: tpp.psi(p, set(range(100)), 100, True, True, security),) * 2,
+	}
+	print(f"{'protocol':>26} {'network s':>10} {'waits':>6} {'bytes':>10} {'wall s':>8}")
+	for (name, (sideA, sideB)) in protocols.items():
+		start = time.perf_counter()
+		(_, _, peerA, peerB) = runPair(sideA, sideB, latency = latency)
+		elapsed = time.perf_counter() - start
+		clock = max(peerA.clock, peerB.clock)
+		print(f"{name:>26} {clock:>10.3f} {peerA.stalls:>6} {peerA.bytesSent + peerB.bytesSent:>10} {elapsed:>8.3f}")
+
+def benchBatchExponents(elementCount : int = 4000, security : int = 512):
+	"""
+	Throughput of Cipher.encryptMany with 1 to N worker processes.
+	"""
+	cipher = exponents.commutative(numbers.randomProbablePrime(security, 40)).keygen()
+	values = [numbers.randomBelow(cipher.getModulus()) for _ in range(elementCount)]
+	expected = None
+	print(f"{'workers':>8} {'seconds':>10} {'per second':>12}")
+	for workers in range(1, (os.cpu_count() or 1) + 1):
+		parallel.setWorkers(workers)
+		cipher.encryptMany(values[:parallel.minimumBatch]) # Start the workers.
+		(result, elapsed) = timed(cipher.encryptMany, values)
+		assert expected is None or result == expected
+		expected = result
+		print(f"{workers:>8} {elapsed:>10.3f} {elementCount / elapsed:>12.0f}")
+	parallel.setWorkers(os.cpu_count() or 1)
+
+def benchCrt(elementCount : int = 200, securities = (512, 1024, 2048)):
+	"""
+	Private key operations of asymmetric keys, plain versus through the Chinese Remainder Theorem.
+	Also verifies that both give the same results.
+	"""
+	print(f"{'bits':>6} {'plain s':>10} {'crt s':>10} {'speedup':>8}")
+	for security in securities:
+		cipher = exponents.asymmetric(security).keygen()
+		key = cipher.toJson()
+		plain = exponents.Cipher(key["m"], key["e"], key["d"])
+		values = [numbers.randomBelow(cipher.getModulus()) for _ in range(elementCount)]
+		(expected, plainTime) = timed(lambda: [plain.decrypt(c) for c in values])
+		(result, crtTime) = timed(lambda: [cipher.decrypt(c) for c in values])
+		assert result == expected
+		assert cipher.decryptMany(values) == expected
+		assert [cipher.encrypt(m) for m in result] == values
+		print(f"{security:>6} {plainTime:>10.3f} {crtTime:>10.3f} {plainTime / crtTime:>8.2f}")
+
+def benchArithmetic(securities = (512, 1024, 2048), count : int = 50):
+	"""
+	Modular exponentiation and prime search of every available arithmetic backend.
+	"""
+	assert numbers.selfTest()
+	print(f"{'backend':>8} {'bits':>6} {'powmod ms':>10} {'nextPrime ms':>13}")
+	for security in securities:
+		values = [numbers.randomBelow(1 << security) for _ in range(count)]
+		modulus = numbers.randomBelow(1 << security) | 1 << (security - 1) | 1
+		for backend in numbers.backends.values():
+			(_, powTime) = timed(lambda: [backend.powmod(v, v, modulus) for v in values])
+			starts = values[:max(count // 10, 1)]
+			(_, primeTime) = timed(lambda: [backend.nextPrime(v, 40) for v in starts])
+			print(f"{backend.name:>8} {security:>6} {powTime / count * 1000:>10.3f} {primeTime / len(starts) * 1000:>13.1f}")
+
+def benchPrimes(securities = (256, 512, 1024, 2048), count : int = 3):
+	"""
+	Random prime search and asymmetric key generation, with the default number of Miller Rabin rounds.
+	"""
+	print(f"{'bits':>6} {'rounds':>7} {'prime s':>10} {'asymmetric s':>13}")
+	for security in securities:
+		(_, primeTime) = timed(lambda: [numbers.randomProbablePrime(security) for _ in range(count)])
+		(_, keyTime) = timed(lambda: [exponents.asymmetric(security) for _ in range(count)])
+		print(f"{security:>6} {numbers.millerRabinRounds(security):>7} {primeTime / count:>10.3f} {keyTime / count:>13.3f}")
+
+def benchKeygen(securities = (1024, 2048), count : int = 3):
+	"""
+	Latency of asymmetric key generation with 1 to N worker processes racing for the primes.
+	"""
+	print(f"{'bits':>6} {'workers':>8} {'seconds':>10}")
+	for security in securities:
+		for workers in range(1, (os.cpu_count() or 1) + 1):
+			parallel.setWorkers(workers)
+			exponents.asymmetric(security, workers) # Start the workers.
+			(_, elapsed) = timed(lambda: [exponents.asymmetric(security, workers) for _ in range(count)])
+			print(f"{security:>6} {workers:>8} {elapsed / count:>10.3f}")
+	parallel.setWorkers(os.cpu_count() or 1)
+
+def benchShatter(thresholds = (10, 100, 300), counts = (10000, 100000), bits : int = 127):
+	"""
+	Shard generation throughput, Shamir.shatter one shard at a time versus Shamir.shatterMany.
+	"""
+	modulus = numbers.randomProbablePrime(bits)
+	print(f"{'threshold':>10} {'count':>8} {'shatter s':>10} {'many s':>10} {'shards/s':>10}")
+	for threshold in thresholds:
+		context = shamir.Shamir(modulus, threshold)
+		for count in counts:
+			secret = numbers.randomBelow(modulus)
+			(_, oneTime) = timed(lambda: list(context.shatter(secret, count)))
+			((xs, ys), manyTime) = timed(context.shatterMany, secret, count)
+			sample = list(zip(xs, ys))[:threshold + 10]
+			assert context.recover(sample) == secret
+			print(f"{threshold:>10} {count:>8} {oneTime:>10.3f} {manyTime:>10.3f} {count / manyTime:>10.0f}")
+
+def benchPermutation(sizes = (1600000, 16000000)):
+	"""
+	Memory and time of shuffling an app space and inverting the shuffle,
+	as a list of ints versus a Permutation.
+	The draws are made up front with a fast insecure generator, they are not what is measured.
+	Memory is the peak traced while building the values and their inverse, measured in a separate
+	run, as tracing slows everything down.
+	"""
+	import random as insecure
+	print(f"{'size':>9} {'kind':>12} {'MB':>8} {'build s':>8} {'swaps s':>8} {'inverse s':>10}")
+	for size in sizes:
+		draws = [int(insecure.random() * k) for k in range(2, size + 1)]
+
+		def asList():
+			values = list(range(size))
+			return values
+
+		def invertList(values):
+			positions = [None] * len(values)
+			for (i,v) in enumerate(values):
+				positions[v] = i
+			return positions
+
+		for (kind, build, invert) in (("list", asList, invertList), ("Permutation", lambda: utils.Permutation(size), lambda p: p.inverse())):
+			(values, buildTime) = timed(build)
+			(_, swapTime) = timed(utils.performSwaps, values, zip(range(1, size), draws))
+			(inverse, inverseTime) = timed(invert, values)
+			assert inverse[values[size // 2]] == size // 2
+			del values, inverse
+			tracemalloc.start()
+			inverse = invert(build())
+			(_, peak) = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+			print(f"{size:>9} {kind:>12} {peak / (1 << 20):>8.1f} {buildTime:>8.3f} {swapTime:>8.3f} {inverseTime:>10.3f}")
+			del inverse
+
+def benchSharedShuffle(sizes = (10000, 1600000), security : int = 128):
+	"""
+	Bytes sent and time of the draws of a shared shuffle, with a value per draw from each side
+	versus expanding a shared seed. Both sides run in this process.
+	"""
+	assert numbers.selfTest(rounds = 1, bits = (64,))
+	print(f"{'size':>9} {'kind':>10} {'bytes':>10} {'seconds':>8}")
+	for size in sizes:
+		protocols = {
+			"per value" : lambda p: random.sharedRandom(p, list(range(2, size + 1)), security),
+			"seeded" : lambda p: random.sharedFisherYates(p, size, security),
+		}
+		for (kind, protocol) in protocols.items():
+			start = time.perf_counter()
+			(a, b, peerA, peerB) = runPair(protocol, protocol)
+			elapsed = time.perf_counter() - start
+			assert list(a) == list(b)
+			print(f"{size:>9} {kind:>10} {peerA.bytesSent + peerB.bytesSent:>10} {elapsed:>8.3f}")
+
+def benchCommitment(sizes = (100000, 1600000), bits : int = 2048, security : int = 128):
+	"""
+	Time and peak traced memory of committing to a list of ints, as one string of hex digits
+	versus streamed with a Committer. Memory is measured in a separate run.
+	"""
+	print(f"{'size':>9} {'kind':>8} {'seconds':>8} {'MB':>8}")
+	for size in sizes:
+		values = [numbers.randomBelow(1 << bits) for _ in range(size)]
+		kinds = {
+			"string" : lambda: commitment.commit(" ".join(hex(k) for k in values), security),
+			"stream" : lambda: commitment.commitInts(values, security),
+		}
+		for (kind, f) in kinds.items():
+			(_, elapsed) = timed(f)
+			tracemalloc.start()
+			f()
+			(_, peak) = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+			print(f"{size:>9} {kind:>8} {elapsed:>8.3f} {peak / (1 << 20):>8.1f}")
+
+def benchOpening(elementCount : int = 1600000, finalCount : int = 60, security : int = 128):
+	"""
+	Bytes of phases 10 and 11 of secretChoice, with the binary codec, sending the whole shard map
+	versus opening the shards of the result in a Merkle tree. Also the time to build the tree.
+	"""
+	shards = [numbers.randomBelow(1 << (security + 1)) for _ in range(elementCount)]
+	finalItems = set(numbers.randomBelow(elementCount) for _ in range(finalCount))
+	finalShards = [shards[i] for i in finalItems]
+	binary = codec.BinaryCodec()
+	size = lambda *messages: sum(len(binary.encode(m)) for m in messages)
+
+	stream = commitment.commitInts(shards, security)
+	finalCommitment = commitment.commitInts(finalShards, security)
+	(tree, buildTime) = timed(commitment.MerkleTree, shards, security)
+	opening = tree.open(finalItems)
+	assert commitment.MerkleCommitment(**tree.phaseOne()).verifyOpening(**opening) == {i : shards[i] for i in finalItems}
+
+	print(f"{'mode':>8} {'phase 2':>10} {'phase 10':>10} {'phase 11':>10} {'build s':>8}")
+	print(f"{'full':>8} {size(stream.phaseOne()):>10} {size(shards, stream.phaseTwo()):>10} {size(finalShards, finalCommitment.phaseTwo()):>10} {'':>8}")
+	# The opening sender also reveals the seed of the shard locations in phase 2.
+	print(f"{'opening':>8} {size(tree.phaseOne(), bytes(random.seedBits // 8).hex()):>10} {size(finalShards, finalCommitment.phaseTwo()):>10} {size(opening):>10} {buildTime:>8.3f}")
+
+class SteamStub(http.server.BaseHTTPRequestHandler):
+	"""
+	Answers like the Steam store: an app page is 200, or a 302 to another app, or a 302 to the
+	home page for apps that do not exist. Every tenth id exists, and every tenth plus one redirects to it.
+
+	Each request takes the latency, and a new connection three times that, standing in for
+	the TCP and TLS handshakes.
+	"""
+	protocol_version = "HTTP/1.1"
+	# Headers and page go out as two writes, Nagle would hold the page back for the ACK.
+	disable_nagle_algorithm = True
+	latency = 0.02
+	requests = 0
+	connections = 0
+	lock = threading.Lock()
+
+	def setup(self):
+		super().setup()
+		with SteamStub.lock:
+			SteamStub.connections = SteamStub.connections + 1
+		time.sleep(3 * self.latency)
+
+	def respond(self, body : bool):
+		with SteamStub.lock:
+			SteamStub.requests = SteamStub.requests + 1
+		time.sleep(self.latency)
+		id = int(self.path.split("/")[2])
+		page = f"<html>App {id}</html>".encode() if body else b""
+		if id % 10 == 0:
+			self.send_response(200)
+		elif id % 10 == 1:
+			self.send_response(302)
+			self.send_header("Location", f"https://store.steampowered.com/app/{id - 1}/")
+		else:
+			self.send_response(302)
+			self.send_header("Location", "https://store.steampowered.com/")
+		self.send_header("Content-Length", str(len(page)))
+		self.end_headers()
+		self.wfile.write(page)
+
+	def do_HEAD(self):
+		self.respond(False)
+
+	def do_GET(self):
+		self.respond(True)
+
+	def log_message(self, format, *args):
+		pass
+
+def benchSteam(count : int = 200, hits : int = 10):
+	"""
+	Checking apps against a local stand-in for the store, see SteamStub: a new connection per
+	check, as urllib does, versus a StoreClient with one or more workers. Then filterThenSlice
+	stopping after the hits.
+	"""
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SteamStub)
+	server.daemon_threads = True
+	threading.Thread(target = server.serve_forever, daemon = True).start()
+	port = server.server_address[1]
+	ids = list(range(count))
+	expected = [id % 10 in (0, 1) for id in ids]
+
+	def fresh(id):
+		with steam.opener.open(f"http://127.0.0.1:{port}/app/{id}") as response:
+			return steam.appExistsFromResponse(id, response.code, response.getheader("Location"))
+
+	client = steam.StoreClient("127.0.0.1", port, https = False)
+	headClient = steam.StoreClient("127.0.0.1", port, https = False, method = "HEAD")
+	runs = {
+		"new connections" : lambda: [fresh(id) for id in ids],
+		"pooled, 1 worker" : lambda: client.appsExist(ids, 1),
+		f"pooled, {steam.checkWorkers} workers" : lambda: client.appsExist(ids),
+		f"HEAD, {steam.checkWorkers} workers" : lambda: headClient.appsExist(ids),
+	}
+	print(f"{'mode':>20} {'checks':>7} {'seconds':>8} {'requests':>9} {'connections':>12}")
+	for (name, run) in runs.items():
+		(SteamStub.requests, SteamStub.connections) = (0, 0)
+		(result, elapsed) = timed(run)
+		assert result == expected
+		print(f"{name:>20} {count:>7} {elapsed:>8.3f} {SteamStub.requests:>9} {SteamStub.connections:>12}")
+
+	(SteamStub.requests, SteamStub.connections) = (0, 0)
+	(found, elapsed) = timed(progress.filterThenSlice, ids, client.appExists, hits, steam.checkWorkers)
+	assert found == [id for id in ids if id % 10 in (0, 1)][:hits]
+	print(f"{'filterThenSlice':>20} {hits:>7} {elapsed:>8.3f} {SteamStub.requests:>9} {SteamStub.connections:>12}")
+	server.shutdown()
+
+benchmarks = {
+	"codec" : benchCodec,
+	"socket" : benchSocketThroughput,
+	"rounds" : benchRoundTrips,
+	"modexp" : benchBatchExponents,
+	"crt" : benchCrt,
+	"arithmetic" : benchArithmetic,
+	"primes" : benchPrimes,
+	"keygen" : benchKeygen,
+	"shatter" : benchShatter,
+	"permutation" : benchPermutation,
+	"shuffle" : benchSharedShuffle,
+	"commitment" : benchCommitment,
+	"opening" : benchOpening,
+	"steam" : benchSteam,
+}
+
+if __name__ == "__main__":
+	for name in sys.argv[1:] or benchmarks:
+		print(f"== {name}")
+		benchmarks[name]()
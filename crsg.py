@@ -2,6 +2,8 @@
 from mglib.network.peer import *
 from mglib.protocol.choices import *
 from mglib.progress import filterAll, filterThenSlice
+from mglib.engine.primes import PrimePool
+import mglib.network.codec as codec
 
 import time
 
@@ -10,11 +12,12 @@ import itertools
 
 appSpaceModulus = 1600000
 testsPerApp = 25
+eliminationRounds = 2
 
 def soloMode(count : int):
 	idspace = utils.shuffle(list(range(appSpaceModulus)))
 
-	for k in filterThenSlice(idspace, steam.checkSteamAppExists, count):
+	for k in filterThenSlice(idspace, steam.checkSteamAppExists, count, steam.checkWorkers):
 		print(f"https://store.steampowered.com/app/{k}")
 
 
@@ -25,8 +28,19 @@ def crsgGame(peer : Peer | str, randomAppCount : int, secretAppIds : Set[int], s
 
 	secretAppIds = set(secretAppIds)
 
+	# Assuming the peer uses the same settings, start on the first elimination round while we wait for them.
+	prepareSecretChoice(appSpaceModulus,
+		(len(secretAppIds) * 2 + randomAppCount) * testsPerApp,
+		len(secretAppIds),
+		len(secretAppIds),
+		security)
+
 	if isinstance(peer,str):
-		peer = SocketPeer(peer)
+		# Both players run this game, so both can take a faster codec than JSON.
+		peer = SocketPeer(peer, tuple(codec.codecs))
+
+	if peer.primePool is None:
+		peer.primePool = PrimePool()
 	
 	basic.agreeOn(peer,"CRSG Game",randomAppCount,len(secretAppIds))
 
@@ -41,9 +55,12 @@ def crsgGame(peer : Peer | str, randomAppCount : int, secretAppIds : Set[int], s
 
 	print(f"Modulus {usingAppSpaceModulus} with TPA {usingTestsPerApp}")
 
-	idspace = list(range(usingAppSpaceModulus))
+	idspace = utils.Permutation(usingAppSpaceModulus)
 
-	random.sharedShuffle(peer, idspace, security)
+	# Every elimination round is a secretChoice, find the shared primes they draw while shuffling.
+	basic.concurrently(peer,
+		lambda p: random.sharedShuffle(p, idspace, security),
+		lambda p: random.fillPrimePool(p, security, eliminationRounds * primesPerSecretChoice))
 
 	totalAppsToChoose = len(secretAppIds) * 2 + randomAppCount
 
@@ -54,7 +71,8 @@ def crsgGame(peer : Peer | str, randomAppCount : int, secretAppIds : Set[int], s
 		  totalAppsToChoose * usingTestsPerApp,
 		  set(idspace.index(id) for id in secretAppIds),
 		  len(secretAppIds),
-		  security)
+		  security,
+		  opening = True)
 
 	print("Elimination round 1 End")
 
@@ -75,24 +93,28 @@ def crsgGame(peer : Peer | str, randomAppCount : int, secretAppIds : Set[int], s
 	
 	print("Filtering pass 1 of 2")
 	
-	myFoundApps = filterAll(myTask,checkSteamAppExists)
+	myFoundApps = filterAll(myTask,checkSteamAppExists,steam.checkWorkers)
 
 	peer.send(myFoundApps)
 	peerFoundApps = peer.recv(list)
 
-	assert all(k in peerTask for k in peerFoundApps)
+	peerTaskSet = set(peerTask)
+	assert all(k in peerTaskSet for k in peerFoundApps)
 
-	peerMissedApps = [k for k in peerTask if k not in peerFoundApps]
-	myMissedApps = [k for k in myTask if k not in myFoundApps]
+	peerFoundSet = set(peerFoundApps)
+	myFoundSet = set(myFoundApps)
+	peerMissedApps = [k for k in peerTask if k not in peerFoundSet]
+	myMissedApps = [k for k in myTask if k not in myFoundSet]
 	
 	print("Filtering pass 2 of 2")
 
-	myFoundApps2 = filterAll(peerMissedApps,checkSteamAppExists)
+	myFoundApps2 = filterAll(peerMissedApps,checkSteamAppExists,steam.checkWorkers)
 
 	peer.send(myFoundApps2)
 	peerFoundApps2 = peer.recv(list)
 
-	assert all(k in myMissedApps for k in peerFoundApps2)
+	myMissedSet = set(myMissedApps)
+	assert all(k in myMissedSet for k in peerFoundApps2)
 
 	idspace = list(set(myFoundApps + myFoundApps2 + peerFoundApps))
 
@@ -100,6 +122,8 @@ def crsgGame(peer : Peer | str, randomAppCount : int, secretAppIds : Set[int], s
 
 	basic.agreeOn(peer,idspace)
 
+	idspace = utils.IndexedSequence(idspace)
+
 	random.sharedShuffle(peer,idspace,security)
 
 	print("Elimination round 2 Begin")
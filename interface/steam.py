@@ -1,5 +1,12 @@
 
 from http.client import HTTPResponse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List
+import http.client
+import itertools
+import threading
+import time
+import urllib.parse
 import urllib.request as r
 import re
 
@@ -22,18 +29,117 @@ opener = r.build_opener(NoRedirect,NoError)
 storefrontRedirect = re.compile(r".*/store.steampowered.com/$")
 redirectToExisting = re.compile(r".*/store.steampowered.com/app/(.*)$")
 
+appPathPattern = re.compile(r"/app/(.*)")
+
+# Number of checks made at the same time, unless told otherwise.
+# Kept modest, the store answers too many requests with 429.
+checkWorkers = 4
+
+def transient(code : int) -> bool:
+	"""
+	Whether the response code means the store could not answer right now: rate limited or failing.
+	"""
+	return code == 429 or 500 <= code < 600
+
+def retryDelay(attempt : int, retryAfter : str | None, backoff : float) -> float:
+	"""
+	Seconds to wait before the next attempt: the Retry-After of the store if it gave seconds,
+	otherwise exponential backoff. At most a minute.
+	"""
+	if retryAfter is not None and retryAfter.strip().isdigit():
+		return min(60, int(retryAfter))
+	return min(60, backoff * (1 << attempt))
+
+def appExistsFromResponse(id : int, code : int, location : str | None) -> bool:
+	if transient(code):
+		# Not an answer about the app. Counting it as missing would silently drop existing apps.
+		raise ConnectionError(f"The store answered {code} for id {id}")
+	if code == 200:
+		return True
+	if code == 302 and location is not None:
+		path = urllib.parse.urlsplit(location).path
+		if path == "/":
+			return False # App doesn't exist. Steam redirects to home page.
+		if appPathPattern.fullmatch(path):
+			return True # Steam redirects to a different app.
+	print(f"Unknown response code: {code} for id {id}")
+	return False
+
+class StoreClient():
+	"""
+	Checks apps in the store, over persistent keep-alive connections, one for each thread.
+
+	Every check is a GET request, the same request a browser makes. A HEAD request would skip
+	downloading the page, but is not yet known to get the same answers from the store.
+	A connection closed by the server is opened again. Answers that the store is rate limiting
+	or failing are retried, with backoff, up to retries times, then raise ConnectionError.
+
+	Safe to use from several threads. The host and port can point at a stand-in server for testing.
+	"""
+	def __init__(self, host : str = "store.steampowered.com", port : int | None = None, https : bool = True, timeout : float = 30,
+			method : str = "GET", retries : int = 5, backoff : float = 1) -> None:
+		self.host = host
+		self.port = port
+		self.https = https
+		self.timeout = timeout
+		self.method = method
+		self.retries = retries
+		self.backoff = backoff
+		self.__local = threading.local()
+
+	def __connection(self) -> http.client.HTTPConnection:
+		connection = getattr(self.__local, "connection", None)
+		if connection is None:
+			kind = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+			connection = kind(self.host, self.port, timeout = self.timeout)
+			self.__local.connection = connection
+		return connection
+
+	def __drop(self):
+		self.__local.connection.close()
+		self.__local.connection = None
+
+	def request(self, path : str):
+		"""
+		The status code and the Location and Retry-After headers of the response to the path.
+		"""
+		for attempt in range(2):
+			connection = self.__connection()
+			try:
+				connection.request(self.method, path)
+				response = connection.getresponse()
+				# The response must be finished before the next request.
+				response.read()
+				if response.will_close:
+					self.__drop()
+				return (response.status, response.getheader("Location"), response.getheader("Retry-After"))
+			except (http.client.HTTPException, OSError):
+				# The server may close an idle connection before we use it again. Retry once on a new one.
+				self.__drop()
+				if attempt > 0:
+					raise
+
+	def appExists(self, id : int) -> bool:
+		for attempt in itertools.count():
+			(code, location, retryAfter) = self.request(f"/app/{id}")
+			if not transient(code) or attempt >= self.retries:
+				return appExistsFromResponse(id, code, location)
+			time.sleep(retryDelay(attempt, retryAfter, self.backoff))
+
+	def appsExist(self, ids : Iterable[int], workers : int | None = None) -> List[bool]:
+		"""
+		appExists for each of the ids, in the same order, checking up to workers of them at a time.
+		"""
+		with ThreadPoolExecutor(max_workers = workers or checkWorkers) as executor:
+			return list(executor.map(self.appExists, ids))
+
+store = StoreClient()
+
 def checkSteamAppExists(id : int):
-	with opener.open(r.Request(f"https://store.steampowered.com/app/{id}")) as response:
-		if response.code == 200:
-			return True
-		if response.code == 302:
-			location = response.getheader("Location")
-			if storefrontRedirect.fullmatch(location):
-				return False # App doesn't exist. Steam redirects to home page.
-			if redirectToExisting.fullmatch(location):
-				return True # Steam redirects to a different app.
-		print(f"Unknown response code: {response.code} for id {id}")
-		return False
+	return store.appExists(id)
+
+def checkSteamAppsExist(ids : Iterable[int], workers : int | None = None) -> List[bool]:
+	return store.appsExist(ids, workers)
 
 xmlEntityRef = {"lt":"<","gt":">","amp":"&","apos":"'","quot":"\""}
 xmlEntityPattern = re.compile(r"&(\w+);")
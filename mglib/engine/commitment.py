@@ -1,7 +1,22 @@
 
 from hashlib import sha256
+import mglib.engine.padding as padding
+import mglib.engine.precompute as precompute
 import base64
+import itertools
 import secrets
+from typing import Dict, Iterable, List
+
+# Ints are hashed this many at a time, so a long sequence is never encoded all at once.
+chunkSize = 4096
+
+def hashInts(h, values : Iterable[int]):
+	values = iter(values)
+	while True:
+		chunk = list(itertools.islice(values, chunkSize))
+		if len(chunk) == 0:
+			return
+		h.update(padding.encodeInts(chunk))
 
 def combine(a, b):
 	if a == None:
@@ -59,13 +74,29 @@ class Commitment:
 		"""
 		Tests if this commitment is valid for the given value.
 		"""
+		if isinstance(value,str):
+			value = value.encode()
+		self.verifyHash(sha256(value))
+
+	def verifyInts(self, values : Iterable[int]):
+		"""
+		Tests if this commitment is valid for the sequence of ints. See Committer.
+		"""
+		self.verifier().update(values).finalize()
+
+	def verifier(self) -> 'Verifier':
+		"""
+		Verifies this commitment for a sequence of ints fed a few at a time. See Committer.
+		"""
+		return Verifier(self)
+
+	def verifyHash(self, h):
+		"""
+		Tests if this commitment is valid for the value already fed to the sha256 hash h.
+		"""
 		assert isinstance(self.__proof,bytes)
 		assert isinstance(self.__salt,bytes)
 		assert b"\00" not in self.__salt
-		h = sha256()
-		if isinstance(value,str):
-			value = value.encode()
-		h.update(value)
 		h.update(b"\00")
 		h.update(self.__salt)
 		assert h.digest() == self.__proof
@@ -84,6 +115,15 @@ class Commitment:
 			d["p"] = decanonicalize(self.__proof)
 		return d
 
+def randomSalt(security : int) -> bytes:
+	"""
+	A random salt for a commitment, free of zero bytes.
+	"""
+	salt = secrets.token_bytes((security + 7) // 8)
+	while b"\00" in salt:
+		salt = salt.replace(b"\00",bytes([secrets.randbelow(0x100)]))
+	return salt
+
 def commit(value, security : int) -> Commitment:
 	"""
 	Produces a proof of independence from the value. The commitment uniquely identifies the value.
@@ -97,11 +137,173 @@ def commit(value, security : int) -> Commitment:
 	h = sha256()
 	if isinstance(value,str):
 		value = value.encode()
-	salt = secrets.token_bytes((security + 7) // 8)
-	while b"\00" in salt:
-		salt = salt.replace(b"\00",bytes([secrets.randbelow(0x100)]))
+	salt = precompute.draw(randomSalt, security)
 
 	h.update(value)
 	h.update(b"\00")
 	h.update(salt)
 	return Commitment(salt,h.digest())
+
+class Committer():
+	"""
+	Commits to a sequence of ints, fed a few at a time with update, in place of
+	building a single value out of all of them. finalize gives the commitment.
+
+	The committed value is the canonical encoding of the ints, see padding.encodeInts.
+	The peer verifies it the same way, with Commitment.verifier or Commitment.verifyInts.
+	"""
+	def __init__(self, security : int) -> None:
+		self.__hash = sha256()
+		self.__security = security
+
+	def update(self, values : Iterable[int]) -> 'Committer':
+		hashInts(self.__hash, values)
+		return self
+
+	def finalize(self) -> Commitment:
+		salt = precompute.draw(randomSalt, self.__security)
+		self.__hash.update(b"\00")
+		self.__hash.update(salt)
+		return Commitment(salt,self.__hash.digest())
+
+class Verifier():
+	"""
+	The verifying side of a Committer. Feed it the same ints with update, finalize checks them.
+
+	The ints may be fed before the salt of the commitment arrives, only finalize needs it.
+	"""
+	def __init__(self, commitment : Commitment) -> None:
+		self.__commitment = commitment
+		self.__hash = sha256()
+
+	def update(self, values : Iterable[int]) -> 'Verifier':
+		hashInts(self.__hash, values)
+		return self
+
+	def finalize(self):
+		self.__commitment.verifyHash(self.__hash)
+
+def commitInts(values : Iterable[int], security : int) -> Commitment:
+	"""
+	Commits to a sequence of ints. Same as Committer(security).update(values).finalize().
+	"""
+	return Committer(security).update(values).finalize()
+
+# Domain tags of the hashes of a Merkle tree, so a leaf can never pass for a node or a root.
+MERKLE_LEAF = b"\00"
+MERKLE_NODE = b"\01"
+MERKLE_ROOT = b"\02"
+
+def merkleLeaf(salt : bytes, value : int) -> bytes:
+	width = (value.bit_length() + 7) // 8
+	return sha256(MERKLE_LEAF + salt + padding.lengthPrefix(width) + value.to_bytes(width, "big")).digest()
+
+def merkleParent(left : bytes, right : bytes | None) -> bytes:
+	# An unpaired last node moves up a level unchanged.
+	if right is None:
+		return left
+	return sha256(MERKLE_NODE + left + right).digest()
+
+def merkleRoot(count : int, top : bytes) -> bytes:
+	return sha256(MERKLE_ROOT + padding.lengthPrefix(count) + top).digest()
+
+def merkleLevels(count : int, indices : List[int]):
+	"""
+	Walks up a Merkle tree of count leaves from the leaves at the sorted indices.
+	Yields, for each level below the root, the width of the level, the known nodes,
+	and the siblings of the known nodes that cannot be computed from them.
+	"""
+	width = count
+	while width > 1:
+		known = set(indices)
+		siblings = [k ^ 1 for k in indices if (k ^ 1) < width and (k ^ 1) not in known]
+		yield (width, indices, siblings)
+		indices = sorted(set(k >> 1 for k in indices))
+		width = (width + 1) // 2
+
+class MerkleTree():
+	"""
+	Commits to a vector of ints with a single root hash, and opens any subset of its entries
+	without revealing the others.
+
+	Every entry is hashed with a salt of its own, so the hashes sent along with an opening say
+	nothing about the entries not opened. An opening of k of n entries carries the k entries,
+	their salts, and at most k * log2(n) hashes, shared between the entries wherever their paths meet.
+
+	Send phaseOne to commit, then open. The peer checks openings with MerkleCommitment.
+	"""
+	def __init__(self, values : List[int], security : int) -> None:
+		assert len(values) > 0
+		self.__values = values
+		self.__saltWidth = (security + 7) // 8
+		self.__salts = secrets.token_bytes(self.__saltWidth * len(values))
+		w = self.__saltWidth
+		level = b"".join(merkleLeaf(self.__salts[k * w:(k + 1) * w], v) for (k,v) in enumerate(values))
+		# Each level is kept as the concatenation of its 32 byte nodes.
+		self.__levels = [level]
+		while len(level) > 32:
+			end = len(level) - len(level) % 64
+			level = b"".join(sha256(MERKLE_NODE + level[k:k + 64]).digest() for k in range(0, end, 64)) + level[end:]
+			self.__levels.append(level)
+		self.__root = merkleRoot(len(values), level)
+
+	def getRoot(self) -> bytes:
+		return self.__root
+
+	def phaseOne(self):
+		return {"r" : decanonicalize(self.__root), "n" : len(self.__values), "w" : self.__saltWidth}
+
+	def open(self, indices : Iterable[int]):
+		"""
+		An opening of the entries at the indices, for MerkleCommitment.verifyOpening.
+		"""
+		indices = sorted(set(indices))
+		assert all(0 <= i < len(self.__values) for i in indices)
+		w = self.__saltWidth
+		hashes = b"".join(
+			self.__levels[depth][32 * k:32 * (k + 1)]
+			for (depth, (_, _, siblings)) in enumerate(merkleLevels(len(self.__values), indices))
+			for k in siblings)
+		return {
+			"i" : indices,
+			"v" : [self.__values[i] for i in indices],
+			"s" : decanonicalize(b"".join(self.__salts[i * w:(i + 1) * w] for i in indices)),
+			"h" : decanonicalize(hashes),
+		}
+
+class MerkleCommitment():
+	"""
+	The root of a MerkleTree of the peer, that openings of its entries are checked against.
+	"""
+	def __init__(self, r = None, n = None, w = None) -> None:
+		assert isinstance(n,int) and n > 0
+		assert isinstance(w,int) and w > 0
+		self.__root = canonicalize(r)
+		assert isinstance(self.__root,bytes)
+		self.count = n
+		self.__saltWidth = w
+
+	def verifyOpening(self, i = None, v = None, s = None, h = None) -> Dict[int,int]:
+		"""
+		Checks an opening made by MerkleTree.open. Returns the opened entries, by index.
+		"""
+		(indices, values, salts, hashes) = (i, v, canonicalize(s), canonicalize(h))
+		assert isinstance(indices,list) and isinstance(values,list) and len(indices) == len(values) > 0
+		assert all(isinstance(k,int) for k in indices) and all(isinstance(k,int) and k >= 0 for k in values)
+		assert indices == sorted(set(indices)) and 0 <= indices[0] and indices[-1] < self.count
+		w = self.__saltWidth
+		assert isinstance(salts,bytes) and len(salts) == w * len(indices)
+		assert isinstance(hashes,bytes) and len(hashes) % 32 == 0
+
+		nodes = {k : merkleLeaf(salts[j * w:(j + 1) * w], value) for (j, (k, value)) in enumerate(zip(indices, values))}
+		used = 0
+		for (width, known, siblings) in merkleLevels(self.count, indices):
+			for k in siblings:
+				assert used + 32 <= len(hashes), "Opening is missing hashes"
+				nodes[k] = hashes[used:used + 32]
+				used = used + 32
+			nodes = {p : merkleParent(nodes[2 * p], nodes.get(2 * p + 1) if 2 * p + 1 < width else None)
+				for p in set(k >> 1 for k in known)}
+		assert used == len(hashes), "Opening has extra hashes"
+		assert merkleRoot(self.count, nodes[0]) == self.__root
+		return dict(zip(indices, values))
@@ -1,12 +1,31 @@
 
 import mglib.engine.padding as padding
+import mglib.engine.parallel as parallel
 from mglib.engine.numbers import *
+from typing import List
+
+def encryptWith(m, modulus, public, private, crt):
+	# Batch workers get the whole key with every chunk, see Cipher.batchKey.
+	return powmod(m, public, modulus)
+
+def decryptWith(c, modulus, public, private, crt):
+	if crt is not None:
+		return crtPow(c, *crt)
+	return powmod(c, private, modulus)
 
 class Cipher:
-	def __init__(self, m, e, d = None):
+	def __init__(self, m, e, d = None, f = None):
 		self.__modulus : int = m
 		self.__public : int = e
 		self.__private : int = d
+		self.__factors : List[int] | None = f
+		self.__crt = None
+		if d is not None and f is not None:
+			# Chinese Remainder Theorem parameters, for private operations
+			# on the two half sized factors instead of the full modulus.
+			(p,q) = f
+			assert p * q == m
+			self.__crt = (d % (p - 1), d % (q - 1), p, q, discreteInverse(q, p) % p)
 	
 	def getModulus(self):
 		return self.__modulus
@@ -15,10 +34,28 @@ class Cipher:
 		return self.__modulus.bit_length()
 	
 	def encrypt(self, m):
-		return pow(m,self.__public,self.__modulus)
+		return powmod(m,self.__public,self.__modulus)
 
 	def decrypt(self, c):
-		return pow(c,self.__private,self.__modulus)
+		if self.__crt is not None:
+			return crtPow(c, *self.__crt)
+		return powmod(c,self.__private,self.__modulus)
+
+	def batchKey(self) -> tuple:
+		# The key as batch workers take it. Every key shares the one pool of mglib.engine.parallel.
+		return (self.__modulus, self.__public, self.__private, self.__crt)
+
+	def encryptMany(self, ms : List[int]) -> List[int]:
+		"""
+		Encrypts a batch, spread over the worker processes if it is large.
+		"""
+		return parallel.mapInts(encryptWith, ms, *self.batchKey())
+
+	def decryptMany(self, cs : List[int]) -> List[int]:
+		"""
+		Decrypts a batch, spread over the worker processes if it is large.
+		"""
+		return parallel.mapInts(decryptWith, cs, *self.batchKey())
 
 	def toJson(self, includePrivate : bool = True):
 		d = dict()
@@ -26,12 +63,15 @@ class Cipher:
 		d["e"] = self.__public
 		if includePrivate:
 			d["d"] = self.__private
+			if self.__factors is not None:
+				d["f"] = list(self.__factors)
 		return d
 
 class Keygen:
-	def __init__(self, m, p) -> None:
+	def __init__(self, m, p, f = None) -> None:
 		self.__modulus = m
 		self.__phi = p
+		self.__factors = f
 	
 	def keygen(self):
 		# Need e * d such that x ** (e * d) % modulus == x
@@ -49,16 +89,18 @@ class Keygen:
 		# ====>   x ** (phi * k + 1) % modulus == x
 		# ====>   x ** (e * d)       % modulus == x
 
-		return Cipher(self.__modulus,e,d)
+		return Cipher(self.__modulus,e,d,self.__factors)
 	
 	def toJson(self,includePrivate : bool = True):
 		d = dict()
 		d["m"] = self.__modulus
 		if includePrivate:
 			d["p"] = self.__phi
+			if self.__factors is not None:
+				d["f"] = list(self.__factors)
 		return d
 
-def asymmetric(strength : int = 0x100):
+def asymmetric(strength : int = 0x100, workers : int = 1):
 	"""
 	Returns an asymmetric key generator.
 
@@ -66,14 +108,14 @@ def asymmetric(strength : int = 0x100):
 	to calculate one key from the other.
 
 	Thus, they are ideal for public-key private-key cryptography.
+
+	With more than one worker, p and q are searched for at the same time in worker processes.
 	"""
 	sa = strength // 2 + 1
-	sb = strength // 2 + 2
-	p = nextProbablePrime(randomBetween(leastWithBits(sa),leastWithBits(sb)), strength)
-	q = nextProbablePrime(randomBetween(leastWithBits(sa),leastWithBits(sb)), strength)
+	(p, q) = randomProbablePrimes(sa, 2, millerRabinRounds(sa), workers)
 
 	phi = lcm(p - 1,q - 1)
-	return Keygen(p * q, phi)
+	return Keygen(p * q, phi, [p, q])
 
 def commutative(prime : int):
 	"""
@@ -1,6 +1,12 @@
 
-from typing import Tuple
-
+from typing import Iterable, Iterator, List, Tuple
+
+import mglib.engine.parallel as parallel
+import contextlib
+import functools
+import hashlib
+import itertools
+import math
 import secrets
 
 def randomBelow(limit : int) -> int:
@@ -15,6 +21,65 @@ def randomBelow(limit : int) -> int:
 				return k
 	return secrets.randbelow(limit)
 
+def randomsBelow(limit : int, count : int) -> List[int]:
+	"""
+	Many random integers between 0 (inclusive) and the limit (exclusive).
+
+	The random bytes for all of them are drawn at once, which is much faster than randomBelow in a loop.
+	"""
+	bits = limit.bit_length()
+	width = (bits + 7) // 8
+	shift = width * 8 - bits
+	result = []
+	while len(result) < count:
+		# Each value is accepted with at least 1/2 probability, draw a bit more than we need.
+		wanted = (count - len(result)) * 2 + 16
+		raw = secrets.token_bytes(wanted * width)
+		values = (int.from_bytes(raw[i:i + width], "big") >> shift for i in range(0, len(raw), width))
+		result.extend(v for v in values if v < limit)
+	del result[count:]
+	return result
+
+# Seed expansion, see expandSeed. Changing any of these changes every result expanded from a seed.
+seedDomain = b"MindGamers expandSeed v1"
+seedBlockSize = 1 << 16
+
+def seedBlocks(seed : bytes) -> Iterator[bytes]:
+	# Block k is SHAKE256(seedDomain || seed || k as 8 bytes, big endian), seedBlockSize bytes long.
+	for counter in itertools.count():
+		yield hashlib.shake_256(seedDomain + seed + counter.to_bytes(8, "big")).digest(seedBlockSize)
+
+def expandSeed(seed : bytes, limits : Iterable[int]) -> Iterator[int]:
+	"""
+	Random integers below each of the limits, derived from the seed alone.
+
+	Anyone holding the same seed gets the same integers, so two peers who agreed on a random seed
+	can draw any number of shared random integers without talking any further.
+
+	The stream of bytes is the concatenation of the blocks of seedBlocks. For a limit L,
+	we take the next ceil(b / 8) bytes of the stream, where b is the bit count of L - 1,
+	read them as a big endian integer, and keep its top b bits. If that is less than L,
+	it is the result, otherwise we draw again. A limit of 1 takes no bytes and gives 0.
+	Known answers are in tests/test_numbers.py.
+	"""
+	blocks = seedBlocks(seed)
+	buffer = b""
+	offset = 0
+	for limit in limits:
+		assert limit >= 1
+		bits = (limit - 1).bit_length()
+		width = (bits + 7) // 8
+		shift = width * 8 - bits
+		while True:
+			if offset + width > len(buffer):
+				buffer = buffer[offset:] + next(blocks)
+				offset = 0
+			value = int.from_bytes(buffer[offset:offset + width], "big") >> shift
+			offset = offset + width
+			if value < limit:
+				yield value
+				break
+
 def randomBetween(startInclusive : int,endExclusive : int) -> int:
 	"""
 	A random integer between the two arguments.
@@ -34,7 +99,14 @@ def millerRabin(p: int,passes = 1) -> int | None:
 	If p passes all tests, None is returned.
 
 	Prime numbers always pass all tests. All composite numbers have AT LEAST a 3/4 chance to fail a test.
-	The more tests the better, but take longer.
+	The more tests the better, but take longer. See millerRabinRounds for how many are enough.
+	"""
+	return millerRabinWitnesses(p, (randomBetween(2,p) for _ in range(passes)))
+
+def millerRabinWitnesses(p : int, witnesses : Iterable[int]) -> int | None:
+	"""
+	Performs Miller Rabin tests on p with each of the given bases.
+	Returns the first base that proves p composite, or None if p passes all tests.
 	"""
 	k = p - 1
 	d = k
@@ -44,10 +116,8 @@ def millerRabin(p: int,passes = 1) -> int | None:
 		d = d >> 1
 		s = s + 1
 	
-	for _ in range(passes):
-		a = randomBetween(2,p)
-		
-		z = pow(a,d,p)
+	for a in witnesses:
+		z = powmod(a,d,p)
 
 		if z == 1:
 			continue
@@ -58,7 +128,7 @@ def millerRabin(p: int,passes = 1) -> int | None:
 			r = r + 1
 			if r == s:
 				return a
-			z = pow(z,2,p)
+			z = powmod(z,2,p)
 
 	return None
 
@@ -86,7 +156,7 @@ def testCompositeWitness(p : int, witness: int) -> bool:
 	
 	a = witness
 	
-	z = pow(a,d,p)
+	z = powmod(a,d,p)
 
 	if z == 1:
 		return False
@@ -97,34 +167,82 @@ def testCompositeWitness(p : int, witness: int) -> bool:
 		r = r + 1
 		if r == s:
 			return True
-		z = pow(z,2,p)
+		z = powmod(z,2,p)
 	
 	return False
 
+def smallPrimesBelow(limit : int) -> List[int]:
+	"""
+	All primes below the limit, with the sieve of Eratosthenes.
+	"""
+	sieve = bytearray([1]) * limit
+	sieve[0:2] = bytes(2)
+	for p in range(2, math.isqrt(limit) + 1):
+		if sieve[p]:
+			sieve[p * p::p] = bytes(len(range(p * p, limit, p)))
+	return [p for p in range(limit) if sieve[p]]
+
+# Odd primes used for sieving and trial division.
+smallPrimes = smallPrimesBelow(1 << 14)[1:]
+smallPrimeSet = set(smallPrimes)
+smallPrimeProduct = math.prod(smallPrimes)
+
+# Testing with each of these bases proves primality of any number below about 3.18 * 10**23, so below 2**64.
+# The least composite passing all of them is 318665857834031151167461.
+deterministicWitnesses = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+# The error we accept when testing random candidates.
+targetErrorBits = 100
+
+@functools.cache
+def millerRabinRounds(bits : int, errorBits : int = targetErrorBits) -> int:
+	"""
+	The number of random Miller Rabin rounds after which a random odd candidate of
+	the specified size that passes all of them is composite with probability below 2 ** -errorBits.
+
+	Uses the bound of Damgard, Landrock and Pomerance, the one behind the tables of FIPS 186-4 Appendix C.3:
+
+		p(k, t) <= k ** 1.5 * 2 ** t * t ** -0.5 * 4 ** (2 - sqrt(t * k))    for k >= 21, 3 <= t <= k / 9
+
+	Some values, for errorBits = 100:
+
+		bits      256  512  1024  2048  4096
+		rounds     17    8     4     3     3
+
+	Smaller candidates, and cases outside the bound, get the worst case 4 ** -t.
+	This only holds for candidates the adversary did not choose. For those use errorBits // 2 rounds.
+	"""
+	worstCase = (errorBits + 1) // 2
+	if bits < 21:
+		return worstCase
+	for t in range(3, min(bits // 9, worstCase) + 1):
+		log2Error = 1.5 * math.log2(bits) + t - 0.5 * math.log2(t) + 2 * (2 - math.sqrt(t * bits))
+		if log2Error <= -errorBits:
+			return t
+	return worstCase
+
+def smallFactor(v : int) -> int | None:
+	"""
+	A small prime that divides v, other than v itself, or None if there is none.
+
+	A divisor is also a valid witness of compositeness for testCompositeWitness.
+	"""
+	if v > 2 and v & 1 == 0:
+		return 2
+	if math.gcd(v, smallPrimeProduct) == 1:
+		return None
+	for p in smallPrimes:
+		if v % p == 0 and v != p:
+			return p
+	return None
+
 def isProbablePrime(v : int, passes : int) -> bool:
 	"""
 	Returns True if the first argument is probably a prime, False if it is definitely composite.
 
 	Higher number of passes results in fewer false positives, but longer runtime.
 	"""
-	# Trivial case
-	if v < 2:
-		return False
-	
-	# 2 is a prime
-	if v == 2:
-		return True
-	
-	# An important check
-	if (v & 1 == 0):
-		return False
-	
-	# For numbers below 100000 just check for divisors.
-	if v < 100000:
-		return (v & 1 == 1) and all(v % t != 0 for t in range(3,v,2))
-	
-	# Otherwise perform the specified number of Miller Rabin tests.
-	return millerRabin(v, passes) == None
+	return backend.isProbablePrime(v, passes)
 
 def nextProbablePrime(v : int, p : int) -> int:
 	"""
@@ -133,36 +251,58 @@ def nextProbablePrime(v : int, p : int) -> int:
 	This method has a negligible chance to return a composite number, but will never skip a prime
 	while searching.
 	"""
-	v = v + 1
+	return backend.nextPrime(v, p)
 
-	if v == 2:
-		return v
-	
-	v = v | 0x1
+def randomProbablePrime(bits : int,p : int = ...,workers : int = 1) -> int:
+	"""
+	A random prime number with the specified number of bits.
 
-	while not isProbablePrime(v,p):
-		v = v + 2
-	
-	return v
+	With more than one worker, the search is spread over the worker processes. See randomProbablePrimes.
+	"""
+	return randomProbablePrimes(bits,1,p,workers)[0]
 
-def randomProbablePrime(bits : int,p : int = ...) -> int:
+def randomProbablePrimes(bits : int,count : int,p : int = ...,workers : int = 1) -> List[int]:
 	"""
-	A random prime number with the specified number of bits.
+	Distinct random prime numbers with the specified number of bits.
+
+	With more than one worker, that many windows of candidates, each from a random starting point,
+	are searched at the same time in as many worker processes, see parallel.race. The first primes found win.
 	"""
 	if p is ...:
-		p = bits * 2
-	return nextProbablePrime(randomBetween(leastWithBits(bits),1 << bits),p)
+		p = millerRabinRounds(bits)
+	primes = []
+	if workers <= 1:
+		while len(primes) < count:
+			prime = nextProbablePrime(randomBetween(leastWithBits(bits),1 << bits),p)
+			if prime not in primes:
+				primes.append(prime)
+		return primes
+	window = max(64, bits)
+	windows = ((randomBetween(leastWithBits(bits),1 << bits) | 1, window, p) for _ in itertools.count())
+	with contextlib.closing(parallel.race(primeInWindow, windows, workers)) as found:
+		for prime in found:
+			if prime not in primes:
+				primes.append(prime)
+			if len(primes) == count:
+				return primes
+
+def primeInWindow(start : int, count : int, passes : int) -> int | None:
+	"""
+	The first probable prime among the odd numbers start, start + 2, ... start + 2 * (count - 1), or None.
+	Also None if run in a race that is already over.
+	"""
+	for c in sievedCandidates(start, count):
+		if parallel.lost():
+			return None
+		if backend.isProbablePrime(c, passes):
+			return c
+	return None
 
 def gcd(a : int, b : int):
 	"""
 	Greatest Common Divisor
 	"""
-	while True:
-		if a == 0:
-			return b
-		c = b % a
-		b = a
-		a = c
+	return backend.gcd(a, b)
 
 def lcm(a : int, b : int):
 	"""
@@ -177,22 +317,40 @@ def discreteInverse(r0,r1) -> int | None:
 	This (r2) is an integer that acts as the reciprocal of r0, satisfying the equation 
 	(r2 * r0) % r1 == 1. If such number doesn't exist, None is returned.
 	"""
-	s0 = 1
-	s1 = 0
-	while r1 != 0:
+	return backend.invert(r0, r1)
 
-		s2 = s0 - (r0 // r1) * s1
-		s0 = s1
-		s1 = s2
+def batchInverse(values : List[int], m : int) -> List[int] | None:
+	"""
+	The discrete inverses of all the values modulo m, or None if any of them has none.
 
-		r2 = r0 % r1
-		r0 = r1
-		r1 = r2
-	
-	if r0 == 1:
-		return s0
-	else:
+	Takes a single discreteInverse and three multiplications per value (Montgomery's trick):
+	invert the product of all values, then peel the values off one by one.
+	"""
+	prefix = []
+	product = 1
+	for v in values:
+		prefix.append(product)
+		product = product * v % m
+	inverse = discreteInverse(product, m)
+	if inverse is None:
 		return None
+	result = [0] * len(values)
+	for i in range(len(values) - 1, -1, -1):
+		result[i] = inverse * prefix[i] % m
+		inverse = inverse * values[i] % m
+	return result
+
+def crtPow(c : int, dP : int, dQ : int, p : int, q : int, qInv : int) -> int:
+	"""
+	pow(c, d, p * q) for distinct primes p and q, using the Chinese Remainder Theorem.
+
+	Takes dP = d % (p - 1), dQ = d % (q - 1) and qInv, the discrete inverse of q modulo p.
+	Two exponentiations on half sized numbers are several times faster than one on the full modulus.
+	"""
+	m1 = powmod(c, dP, p)
+	m2 = powmod(c, dQ, q)
+	h = (qInv * (m1 - m2)) % p
+	return m2 + h * q
 
 def randomDiscreteInversePair(mod) -> Tuple[int,int]:
 	"""
@@ -207,4 +365,214 @@ def randomDiscreteInversePair(mod) -> Tuple[int,int]:
 		if d is None:
 			continue
 		assert (e * d) % mod == 1
-		return (e,d % mod)
\ No newline at end of file
+		return (e,d % mod)
+
+def powmod(b : int, e : int, m : int) -> int:
+	"""
+	pow(b, e, m) with the current arithmetic backend.
+	"""
+	return backend.powmod(b, e, m)
+
+class Backend():
+	"""
+	The big integer arithmetic used by this module. See setBackend.
+	"""
+	name = None
+
+	def powmod(self, b : int, e : int, m : int) -> int:
+		raise Exception("Not implemented")
+
+	def invert(self, a : int, m : int) -> int | None:
+		"""
+		The discrete inverse of a modulo m, between 0 and m, or None.
+		"""
+		raise Exception("Not implemented")
+
+	def gcd(self, a : int, b : int) -> int:
+		raise Exception("Not implemented")
+
+	def isProbablePrime(self, v : int, passes : int) -> bool:
+		raise Exception("Not implemented")
+
+	def nextPrime(self, v : int, passes : int) -> int:
+		raise Exception("Not implemented")
+
+def sieveWindow(start : int, count : int) -> bytearray:
+	"""
+	Flags for the odd candidates start, start + 2, ... start + 2 * (count - 1),
+	cleared where the candidate has a small prime factor. The start must be odd and
+	above all the small primes.
+	"""
+	flags = bytearray([1]) * count
+	for p in smallPrimes:
+		# First i such that p divides start + 2 * i. The inverse of 2 modulo p is (p + 1) // 2.
+		i = (-start * ((p + 1) // 2)) % p
+		if i < count:
+			flags[i::p] = bytes(len(range(i, count, p)))
+	return flags
+
+def sievedCandidates(start : int, count : int) -> List[int]:
+	"""
+	The odd numbers start, start + 2, ... start + 2 * (count - 1) that have no small prime factor.
+
+	The result only depends on the arguments, so two parties sieving the same window get the same list.
+	"""
+	if start <= smallPrimes[-1]:
+		return [v for v in range(start, start + 2 * count, 2) if smallFactor(v) is None]
+	flags = sieveWindow(start, count)
+	return [start + 2 * i for i in range(count) if flags[i]]
+
+class PythonBackend(Backend):
+	"""
+	Plain Python. Always available.
+	"""
+	name = "python"
+
+	def powmod(self, b : int, e : int, m : int) -> int:
+		return pow(b, e, m)
+
+	def invert(self, r0 : int, r1 : int) -> int | None:
+		m = r1
+		s0 = 1
+		s1 = 0
+		while r1 != 0:
+
+			s2 = s0 - (r0 // r1) * s1
+			s0 = s1
+			s1 = s2
+
+			r2 = r0 % r1
+			r0 = r1
+			r1 = r2
+	
+		if r0 == 1:
+			return s0 % m
+		else:
+			return None
+
+	def gcd(self, a : int, b : int) -> int:
+		while True:
+			if a == 0:
+				return b
+			c = b % a
+			b = a
+			a = c
+
+	def isProbablePrime(self, v : int, passes : int) -> bool:
+		# Trivial case
+		if v < 2:
+			return False
+	
+		# 2 is a prime
+		if v == 2:
+			return True
+	
+		# An important check
+		if (v & 1 == 0):
+			return False
+	
+		if v in smallPrimeSet:
+			return True
+	
+		# Most composites have a small factor, one gcd finds it.
+		if smallFactor(v) is not None:
+			return False
+	
+		# Below the square of the largest small prime that leaves only primes.
+		if v < smallPrimes[-1] ** 2:
+			return True
+	
+		# Below 2**64 a fixed set of bases gives a definite answer.
+		if v < 1 << 64:
+			return millerRabinWitnesses(v, deterministicWitnesses) == None
+	
+		# Otherwise perform the specified number of Miller Rabin tests.
+		return millerRabin(v, passes) == None
+
+	def nextPrime(self, v : int, p : int) -> int:
+		v = v + 1
+
+		if v == 2:
+			return v
+	
+		v = v | 0x1
+
+		while v <= smallPrimes[-1]:
+			if self.isProbablePrime(v,p):
+				return v
+			v = v + 2
+
+		# Sieve a window of candidates at once, and only test the ones without small factors.
+		# Primes are about ln(v) apart, so a window of bit length odd candidates usually holds one.
+		count = max(64, v.bit_length())
+		while True:
+			flags = sieveWindow(v, count)
+			i = flags.find(1)
+			while i >= 0:
+				if v + 2 * i < 1 << 64:
+					if millerRabinWitnesses(v + 2 * i, deterministicWitnesses) == None:
+						return v + 2 * i
+				elif millerRabin(v + 2 * i, p) == None:
+					return v + 2 * i
+				i = flags.find(1, i + 1)
+			v = v + 2 * count
+
+try:
+	import gmpy2
+except ImportError:
+	gmpy2 = None
+
+class GmpBackend(Backend):
+	"""
+	The GMP library through gmpy2, if it is installed. Several times faster for big numbers.
+
+	Results are converted back to int, so they can go anywhere a Python int can.
+	"""
+	name = "gmpy2"
+
+	def powmod(self, b : int, e : int, m : int) -> int:
+		return int(gmpy2.powmod(b, e, m))
+
+	def invert(self, a : int, m : int) -> int | None:
+		try:
+			return int(gmpy2.invert(a, m))
+		except ZeroDivisionError:
+			return None
+
+	def gcd(self, a : int, b : int) -> int:
+		return int(gmpy2.gcd(a, b))
+
+	def isProbablePrime(self, v : int, passes : int) -> bool:
+		return bool(gmpy2.is_prime(v, max(passes, 1)))
+
+	def nextPrime(self, v : int, passes : int) -> int:
+		return int(gmpy2.next_prime(v))
+
+backends = {b.name : b for b in [PythonBackend()] + ([GmpBackend()] if gmpy2 is not None else [])}
+
+backend : Backend = backends[GmpBackend.name] if GmpBackend.name in backends else backends[PythonBackend.name]
+
+def setBackend(name : str):
+	"""
+	Switches the arithmetic backend. "python" is always available, "gmpy2" if gmpy2 is installed.
+
+	Worker processes already started by mglib.engine.parallel keep the backend they started with.
+	"""
+	global backend
+	backend = backends[name]
+
+def selfTest(rounds : int = 20, bits = (64, 256, 1024)) -> bool:
+	"""
+	Checks that all available backends produce identical results on random inputs.
+	"""
+	for size in bits:
+		primes = [backends[PythonBackend.name].nextPrime(randomBelow(1 << size), 40) for _ in range(2)]
+		for _ in range(rounds):
+			(a, b, m) = (randomBelow(1 << size), randomBelow(1 << size), randomBelow(1 << size) | 1)
+			cases = [("powmod", (a, b, m)), ("invert", (a, m)), ("gcd", (a, b)), ("nextPrime", (a, 40))] \
+				+ [("isProbablePrime", (p, 40)) for p in primes] \
+				+ [("isProbablePrime", (primes[0] * primes[1], 40)), ("isProbablePrime", (a | 1, 40))]
+			for (method, args) in cases:
+				results = set(getattr(b, method)(*args) for b in backends.values())
+				assert len(results) == 1, f"Backends disagree on {method}{args}: {results}"
+	return True
@@ -1,4 +1,7 @@
 
+from typing import Iterable, List, Tuple
+import functools
+
 def intToBytes(v : int, least : int = 0):
 
 	assert isinstance(v,int)
@@ -40,3 +43,42 @@ def simpleUnpad(message):
 	except StopIteration:
 		raise Exception("Inconsistent")
 	yield from message
+
+def packInts(values, width : int = ...) -> Tuple[int, bytes]:
+	"""
+	Packs non-negative ints into fixed width big-endian limbs.
+
+	Returns the width along with the bytes, the width is the smallest that fits
+	unless one is specified.
+	"""
+	if width is ...:
+		width = max((max(values, default = 0).bit_length() + 7) // 8, 1)
+	return (width, b"".join(v.to_bytes(width, "big") for v in values))
+
+def unpackInts(width : int, raw : bytes) -> List[int]:
+	"""
+	The reverse of packInts.
+	"""
+	return [int.from_bytes(raw[k:k + width], "big") for k in range(0, len(raw), width)]
+
+@functools.cache
+def lengthPrefix(length : int) -> bytes:
+	# A little-endian base 128 varint, as in the binary codec.
+	out = bytearray()
+	while length >= 0x80:
+		out.append((length & 0x7f) | 0x80)
+		length = length >> 7
+	out.append(length)
+	return bytes(out)
+
+def encodeInts(values : Iterable[int]) -> bytes:
+	"""
+	A canonical encoding of a sequence of non-negative ints: each is its byte count as a varint,
+	followed by its big-endian magnitude. Encodings of sequences can be concatenated.
+	"""
+	parts = []
+	for v in values:
+		width = (v.bit_length() + 7) // 8
+		parts.append(lengthPrefix(width))
+		parts.append(v.to_bytes(width, "big"))
+	return b"".join(parts)
@@ -0,0 +1,158 @@
+
+import mglib.engine.padding as padding
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List
+
+# Batches smaller than this are computed inline, shipping them to a worker costs more than it saves.
+minimumBatch = 256
+
+# Each worker gets a few chunks, so a slow chunk does not leave the others idle.
+chunksPerWorker = 4
+
+workers = os.cpu_count() or 1
+# Threads running inline, see inline.
+local = threading.local()
+executor : ProcessPoolExecutor | None = None
+executorSize = 0
+executorLock = threading.Lock()
+
+# One flag per race that may run at the same time, shared with every worker. Set once the race is over.
+maxRaces = 64
+raceFlags = None
+freeRaceSlots = list(range(maxRaces))
+raceSlotsLock = threading.Lock()
+
+# Workers start from a clean process. Forking a process that runs threads, as protocols
+# do, can leave the child holding locks no thread will ever release.
+# The main module of a program using the pool must therefore be safe to import.
+if "forkserver" in multiprocessing.get_all_start_methods():
+	context = multiprocessing.get_context("forkserver")
+else:
+	context = multiprocessing.get_context("spawn")
+
+def setWorkers(count : int):
+	"""
+	Sets the number of worker processes used for batches. 1 computes everything inline.
+	"""
+	global workers, executor
+	assert count >= 1
+	with executorLock:
+		if executor is not None:
+			executor.shutdown()
+			executor = None
+		workers = count
+
+def getExecutor(size : int = 0) -> ProcessPoolExecutor:
+	"""
+	The pool of worker processes, with at least the workers and at least size processes.
+	A larger size replaces the pool with a larger one, work already submitted still runs.
+	"""
+	global executor, executorSize, raceFlags
+	with executorLock:
+		size = max(size, workers)
+		if executor is None or executorSize < size:
+			if raceFlags is None:
+				raceFlags = context.RawArray("b", maxRaces)
+			if executor is not None:
+				executor.shutdown(wait = False)
+			executor = ProcessPoolExecutor(max_workers = size, mp_context = context,
+				initializer = setRaceFlags, initargs = (raceFlags,))
+			executorSize = size
+		return executor
+
+def mapChunk(function : Callable, width : int, raw : bytes, args):
+	# Runs in a worker. Chunks travel as packed bytes, far smaller to pickle than lists of ints.
+	return padding.packInts([function(v, *args) for v in padding.unpackInts(width, raw)])
+
+def mapInts(function : Callable, values : List[int], *args) -> List[int]:
+	"""
+	[function(v, *args) for v in values], spread over the worker processes.
+
+	The function must be picklable, such as a builtin or a module level function,
+	and must map non-negative ints to non-negative ints. Results keep the order of the values.
+	The args travel with every chunk, so batches with different args share the one pool.
+	"""
+	values = list(values)
+	if workers <= 1 or len(values) < minimumBatch or getattr(local, "inline", False):
+		return [function(v, *args) for v in values]
+	chunkSize = max(minimumBatch // 2, -(-len(values) // (workers * chunksPerWorker)))
+	chunks = [padding.packInts(values[k:k + chunkSize]) for k in range(0, len(values), chunkSize)]
+	futures = [getExecutor().submit(mapChunk, function, width, raw, args) for (width, raw) in chunks]
+	result = []
+	for f in futures:
+		result.extend(padding.unpackInts(*f.result()))
+	return result
+
+def inline(function : Callable, *args):
+	"""
+	function(*args), with every batch in it computed in the calling thread.
+
+	For tasks run by a pool other than ours. Its workers must not start a pool of their own.
+	"""
+	local.inline = True
+	try:
+		return function(*args)
+	finally:
+		local.inline = False
+
+# In a worker, the slot of the race whose task it runs.
+raceSlot = None
+
+def setRaceFlags(flags):
+	global raceFlags
+	raceFlags = flags
+
+def raceTask(slot : int, function : Callable, args : tuple):
+	# Runs in a worker.
+	global raceSlot
+	raceSlot = slot
+	try:
+		return function(*args)
+	finally:
+		raceSlot = None
+
+def lost() -> bool:
+	"""
+	In a task of race, whether the race is already over. Long tasks should check it and give up.
+	"""
+	return raceSlot is not None and raceFlags[raceSlot] != 0
+
+def race(function : Callable, tasks : Iterable[tuple], workers : int) -> Iterator:
+	"""
+	Runs function(*args) for the argument tuples of the tasks in the worker processes,
+	workers of them at a time, and yields the results other than None as soon as they arrive.
+	The pool grows to at least workers processes, and is kept for later races and batches.
+
+	Meant for searches: stop iterating, or close the iterator, once enough was found.
+	Tasks not yet started are then cancelled, and running ones see lost() turn True.
+	"""
+	getExecutor(workers)
+	with raceSlotsLock:
+		assert len(freeRaceSlots) > 0, "Too many races at the same time"
+		slot = freeRaceSlots.pop()
+	raceFlags[slot] = 0
+	tasks = iter(tasks)
+	running = set()
+	try:
+		while True:
+			for args in itertools.islice(tasks, workers - len(running)):
+				# Another race may have grown the pool meanwhile, submit to the current one.
+				running.add(getExecutor(workers).submit(raceTask, slot, function, args))
+			if len(running) == 0:
+				return
+			(done, running) = wait(running, return_when = FIRST_COMPLETED)
+			for f in done:
+				if f.result() is not None:
+					yield f.result()
+	finally:
+		raceFlags[slot] = 1
+		for f in running:
+			f.cancel()
+		# The slot is free again only once no task of ours can read it.
+		wait(running)
+		with raceSlotsLock:
+			freeRaceSlots.append(slot)
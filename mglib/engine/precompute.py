@@ -0,0 +1,60 @@
+
+import queue
+import threading
+from typing import Callable, Dict, List
+
+# Values computed ahead of time, by function and arguments.
+store : Dict[tuple, List] = dict()
+storeLock = threading.Lock()
+
+jobs = queue.Queue()
+worker : threading.Thread | None = None
+
+def work():
+	while True:
+		(key, count) = jobs.get()
+		try:
+			(function, args) = key
+			for _ in range(count):
+				value = function(*args)
+				with storeLock:
+					store.setdefault(key, []).append(value)
+		finally:
+			jobs.task_done()
+
+def prepare(function : Callable, *args, count : int = 1):
+	"""
+	Computes function(*args) count times in a background thread, and keeps the results for draw.
+
+	The function must take no input other than the arguments, and every call must give a fresh
+	random value, such as a new key. A value is never handed out twice.
+	"""
+	global worker
+	with storeLock:
+		if worker is None:
+			worker = threading.Thread(target = work, daemon = True)
+			worker.start()
+	jobs.put(((function, args), count))
+
+def draw(function : Callable, *args):
+	"""
+	A value prepared for function(*args), or if there is none, a value computed right away.
+	"""
+	with storeLock:
+		values = store.get((function, args))
+		if values:
+			return values.pop(0)
+	return function(*args)
+
+def available(function : Callable, *args) -> int:
+	"""
+	The number of values ready for function(*args).
+	"""
+	with storeLock:
+		return len(store.get((function, args), []))
+
+def join():
+	"""
+	Waits until everything prepared so far is ready.
+	"""
+	jobs.join()
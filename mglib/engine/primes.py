@@ -0,0 +1,73 @@
+
+import json
+import os
+import threading
+from mglib.engine.numbers import millerRabin, targetErrorBits
+from typing import Dict, List
+
+class PrimePool():
+	"""
+	Shared primes put aside for later use, by security level.
+
+	A prime of security level k has k + 1 bits, as made by random.sharedRandomProbablePrime.
+	Only primes generated together with a peer belong here: a prime picked by a single party
+	could be picked to be weak. Each prime is used once, then dropped.
+
+	If a path is given, the pool is loaded from and saved to that JSON file, so it lasts between runs.
+	Loaded primes are tested again, with as many rounds as for numbers chosen by an adversary.
+
+	Safe to use from several threads.
+	"""
+	def __init__(self, path : str | None = None) -> None:
+		self.__lock = threading.Lock()
+		self.__primes : Dict[int, List[int]] = dict()
+		self.path = path
+		if path is not None and os.path.exists(path):
+			with open(path) as file:
+				stored = json.load(file)
+			for prime in (p for primes in stored.values() for p in primes):
+				assert isinstance(prime,int) and prime > 2
+				assert millerRabin(prime, targetErrorBits // 2) is None, "Composite number in the prime pool"
+				self.__insert(prime)
+
+	def __insert(self, prime : int):
+		primes = self.__primes.setdefault(prime.bit_length() - 1, [])
+		if prime not in primes:
+			primes.append(prime)
+
+	def count(self, security : int) -> int:
+		with self.__lock:
+			return len(self.__primes.get(security, []))
+
+	def offer(self, security : int) -> List[int]:
+		"""
+		The primes we could use at the security level, in ascending order.
+		"""
+		with self.__lock:
+			return sorted(self.__primes.get(security, []))
+
+	def add(self, prime : int):
+		with self.__lock:
+			self.__insert(prime)
+			self.__save()
+
+	def take(self, prime : int) -> bool:
+		"""
+		Removes the prime from the pool. Returns False if it was not in it.
+		"""
+		with self.__lock:
+			primes = self.__primes.get(prime.bit_length() - 1, [])
+			if prime not in primes:
+				return False
+			primes.remove(prime)
+			self.__save()
+			return True
+
+	def __save(self):
+		if self.path is None:
+			return
+		temporary = self.path + ".tmp"
+		with open(temporary, "w") as file:
+			json.dump({str(k) : v for (k,v) in self.__primes.items() if len(v) > 0}, file)
+		# Replacing is atomic, a crash leaves either the old or the new pool.
+		os.replace(temporary, self.path)
@@ -1,8 +1,20 @@
 import mglib.engine.numbers as numbers
 import mglib.engine.padding as padding
+import operator
 import secrets as secrets
 from typing import Iterable, Tuple, List
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Locations evaluated together by polynomMany.
+chunkSize = 4096
+
+# Powers of the locations kept at a time by polynomCombination.
+powerBlock = 8
+
 def polynom(modulus : int, coefficents : Iterable[int], x : int):
 	"""
 	Simple polynom evaluation.
@@ -18,38 +30,168 @@ def polynom(modulus : int, coefficents : Iterable[int], x : int):
 
 	return v
 
+def polynomMany(modulus : int, coefficents : List[int], locations : List[int]) -> List[int]:
+	"""
+	The polynom evaluated at every location.
+
+	Uses Horner's rule one step at a time over a chunk of locations, so the inner loop is a
+	single list comprehension. Each step takes two coefficients, as a polynom of x * x, which
+	halves the number of modulo operations. If numpy is installed and the modulus is below 2**32,
+	so products fit in 64 bits, the chunks are evaluated with numpy instead.
+	"""
+	result = []
+	# Pairs of coefficients (c0, c1), highest first. Odd counts get a leading zero.
+	pairs = list(zip(coefficents[0::2], coefficents[1::2] + [0]))[::-1]
+	for start in range(0, len(locations), chunkSize):
+		chunk = locations[start:start + chunkSize]
+		if numpy is not None and modulus < 1 << 32:
+			xs = numpy.array(chunk, dtype = numpy.uint64)
+			ys = numpy.full(len(chunk), coefficents[-1] % modulus, dtype = numpy.uint64)
+			for c in reversed(coefficents[:-1]):
+				# The secret may be any int, reduce it to fit 64 bits.
+				ys = (ys * xs + numpy.uint64(c % modulus)) % numpy.uint64(modulus)
+			result.extend(int(y) for y in ys)
+		else:
+			squares = [x * x % modulus for x in chunk]
+			ys = [0] * len(chunk)
+			for (c0,c1) in pairs:
+				ys = [(y * s + c1 * x + c0) % modulus for (y,x,s) in zip(ys,chunk,squares)]
+			result.extend(ys)
+	return result
+
+def polynomCombination(modulus : int, coefficents : List[int], locations : List[int], weights : List[int]) -> int:
+	"""
+	sum(w * polynom(modulus, coefficents, x)) over the locations and weights, modulo the modulus.
+
+	Computed as sum(c_k * sum(w * x ** k)), with the powers of the locations kept in blocks.
+	This is still O(n * t) multiplications, the same as evaluating the polynom at each location.
+	It is faster only because the sums over the locations run in builtins instead of a Python loop.
+	"""
+	m = modulus
+	powers = [[1] * len(locations), list(locations)]
+	while len(powers) < powerBlock:
+		powers.append([p * x % m for (p,x) in zip(powers[-1],locations)])
+	step = [p * x % m for (p,x) in zip(powers[-1],locations)]
+	# Holds w * x ** k for the first k of the block.
+	v = list(weights)
+	result = 0
+	for start in range(0, len(coefficents), powerBlock):
+		for (c,power) in zip(coefficents[start:start + powerBlock],powers):
+			result = (result + c * sum(map(operator.mul, v, power))) % m
+		v = [p * s % m for (p,s) in zip(v,step)]
+	return result
+
 def lagrange(modulus : int, points : Iterable[Tuple[int,int]], x : int):
 	"""
 	Simple polynom interpolation.
 
 	Find a least order polynom that contains all points in the iterable, and evaluate it at location x.
+	To evaluate the same polynom at many locations, use an Interpolator.
 	"""
-	if not isinstance(points,tuple | list | set):
-		points = set(points)
-	
-	# The interpolated polynom can be thought of as a sum of "Lagrange Polynoms".
-	# Each Lagrange Polynom f has the property that f(x) = y for one (x,y) pair,
-	# while f(x) = 0 for any other (x,y) pair in the set of points.
-	# Find the Lagrange Polynom for all points in the set, and sum the values.
-
-	k = 0
-	for (xn,yn) in points:
-
-		m = yn # Need f(xn) == yn so we start with it.
-
-		for (xk,yk) in points:
-			if xn != xk:
-				# Need f(xk) == 0, so we multiply by (x - xk)
-				m = m * (x - xk) % modulus
-				# This will multiply f(xn) by (xn - xk) so we divide the
-				# whole function by that value to restore the original f(xn) == yn
-				# We do not ever divide by zero because of the xn != xk check.
-				m = m * numbers.discreteInverse((xn - xk) / modulus,modulus) % modulus
-				m = m % modulus
-		
-		k = (k + m) % modulus
-	
-	return k
+	return Interpolator(modulus, points).evaluate(x)
+
+class Interpolator():
+	"""
+	The least order polynom that contains all the points, over a prime modulus,
+	ready to be evaluated at any number of locations.
+
+	The interpolated polynom can be thought of as a sum of "Lagrange Polynoms".
+	Each Lagrange Polynom f has the property that f(x) = y for one (x,y) pair,
+	while f(x) = 0 for any other (x,y) pair in the set of points.
+
+	We use the barycentric form of that sum:
+
+		f(x) = l(x) * sum(w_j * y_j / (x - x_j))
+		l(x) = prod(x - x_j)
+		w_j  = 1 / prod(x_j - x_k for k != j)
+
+	The weights do not depend on x, they are computed once, with a single inversion for all of them.
+	After that every evaluation takes O(t) multiplications and one more inversion.
+	"""
+	def __init__(self, modulus : int, points : Iterable[Tuple[int,int]]) -> None:
+		m = modulus
+		points = dict((x % m, y % m) for (x,y) in points)
+		self.__modulus = m
+		self.__points = points
+		self.__xs = list(points.keys())
+		denominators = []
+		for xj in self.__xs:
+			d = 1
+			for xk in self.__xs:
+				if xj != xk:
+					d = d * (xj - xk) % m
+			denominators.append(d)
+		weights = numbers.batchInverse(denominators, m)
+		assert weights is not None, "The modulus must be prime"
+		self.__weightedYs = [w * points[x] % m for (w,x) in zip(weights,self.__xs)]
+		self.__coefficents = None
+
+	def coefficents(self) -> List[int]:
+		"""
+		The coefficents of the polynom, lowest order first. Computed once, in O(t * t).
+		"""
+		if self.__coefficents is None:
+			m = self.__modulus
+			count = len(self.__xs)
+			# l(x) = prod(x - x_j), lowest order first.
+			l = [1]
+			for xj in self.__xs:
+				l = [(a - xj * b) % m for (a,b) in zip([0] + l, l + [0])]
+			# f(x) = sum(w_j * y_j * l(x) / (x - x_j)), each quotient by synthetic division.
+			result = [0] * count
+			for (xj,wy) in zip(self.__xs,self.__weightedYs):
+				r = l[count]
+				for i in range(count - 1, -1, -1):
+					result[i] = result[i] + wy * r
+					r = (l[i] + r * xj) % m
+			self.__coefficents = [c % m for c in result]
+		return self.__coefficents
+
+	def evaluate(self, x : int) -> int:
+		return self.evaluateMany([x])[0]
+
+	def evaluateMany(self, locations : Iterable[int]) -> List[int]:
+		"""
+		Evaluates the polynom at each location. All the divisions share a single inversion.
+		"""
+		m = self.__modulus
+		xs = self.__xs
+		count = len(xs)
+		locations = [x % m for x in locations]
+		# At the points themselves the formula would divide by zero, but we know the value anyway.
+		unknown = [x for x in locations if x not in self.__points]
+		inverses = numbers.batchInverse([x - xj for x in unknown for xj in xs], m)
+		values = dict()
+		for (i,x) in enumerate(unknown):
+			l = 1
+			s = 0
+			for (xj,wy,inverse) in zip(xs,self.__weightedYs,inverses[i * count:(i + 1) * count]):
+				l = l * (x - xj) % m
+				s = (s + wy * inverse) % m
+			values[x] = l * s % m
+		return [self.__points[x] if x in self.__points else values[x] for x in locations]
+
+	def contains(self, points : Iterable[Tuple[int,int]], rounds : int = 1, exact : bool = False) -> bool:
+		"""
+		Tests if every point lies on the polynom.
+
+		By default this is a randomized test: for random weights w, sum(w * f(x)) == sum(w * y).
+		If any point is off, a round passes with probability 1 / modulus, so a false True
+		has probability modulus ** -rounds. With exact, every point is evaluated and compared instead.
+		"""
+		m = self.__modulus
+		points = list(points)
+		xs = [x for (x,_) in points]
+		ys = [y for (_,y) in points]
+		if exact:
+			return self.evaluateMany(xs) == ys
+		if len(ys) > 0 and not (0 <= min(ys) and max(ys) < m):
+			return False
+		for _ in range(rounds):
+			weights = numbers.randomsBelow(m, len(points))
+			if polynomCombination(m, self.coefficents(), xs, weights) != sum(map(operator.mul, weights, ys)) % m:
+				return False
+		return True
 
 class Shamir():
 	"""
@@ -84,11 +226,12 @@ class Shamir():
 		
 		return tuple(points.items())
 
-	def shatter(self,message : int | Iterable[Tuple[int,int]],count : int = ...,verify = True):
+	def shatter(self,message : int | Iterable[Tuple[int,int]],count : int = ...,verify = True,exact = False):
 		"""
 		Shatters the secret input into the specified number of cryptographic shards.
 
 		Alternatively if input is a sufficient collection of shards, makes more shards.
+		The shards beyond the threshold are verified as with recover.
 		"""
 
 		if count is ...:
@@ -106,16 +249,15 @@ class Shamir():
 		else:
 			points = self.__recover(message)
 
-			f = lambda x: lagrange(self.__modulus, points, x)
+			interpolator = Interpolator(self.__modulus, points)
+
+			f = interpolator.evaluate
+
+			extra = list(message)
+			assert not verify or interpolator.contains(extra, exact = exact), "Inconsistent!"
 
 			locations = set(k for (k,_) in points)
-			try:
-				while True:
-					(x,y) = next(message)
-					assert not verify or f(x) == y, "Inconsistent!"
-					locations.add(x)
-			except StopIteration:
-				pass
+			locations.update(x for (x,_) in extra)
 
 		# Evaluate the polynom at many distinct procedurally generated locations.
 
@@ -126,28 +268,51 @@ class Shamir():
 				yield (x,f(x))
 				count = count - 1
 	
+	def shatterMany(self, secret : int, count : int, locations : Iterable[int] | None = None) -> Tuple[List[int],List[int]]:
+		"""
+		Shatters the secret into the specified number of shards at once.
+		Returns the x and the y values of the shards, as two lists.
+
+		Same as shatter with an int, but the locations are drawn and the polynom is evaluated in batches.
+		If locations are given, they are the x values instead, distinct and not 0.
+		"""
+		coefficents = [secret] + numbers.randomsBelow(self.__modulus, self.__threshold - 1)
+		assert count < self.__modulus
+		if locations is not None:
+			xs = list(locations)
+			assert len(xs) == count and len(set(xs)) == count
+			assert all(0 < x < self.__modulus for x in xs)
+			return (xs, polynomMany(self.__modulus, coefficents, xs))
+		locations = set()
+		xs = []
+		while len(xs) < count:
+			for x in numbers.randomsBelow(self.__modulus, count - len(xs)):
+				if x != 0 and x not in locations:
+					locations.add(x)
+					xs.append(x)
+		return (xs, polynomMany(self.__modulus, coefficents, xs))
+
 	def getModulus(self):
 		return self.__modulus
 	
-	def recover(self,shards,verify = True):
+	def recover(self,shards,verify = True,exact = False,rounds = 1):
 		"""
 		Recover the secret from the shards, and optionally verify their integrity.
+
+		The shards beyond the threshold are verified all at once with a randomized test,
+		that misses inconsistent shards with probability modulus ** -rounds. See Interpolator.contains.
+		With exact, every shard is checked on its own.
 		"""
 		shards = iter(shards)
 		
 		points = self.__recover(shards)
 
-		f = lambda x: lagrange(self.__modulus, points, x)
+		f = Interpolator(self.__modulus, points)
 
 		if verify:
-			try:
-				while True:
-					(x,y) = next(shards)
-					assert f(x) == y, "Inconsistent!"
-			except StopIteration:
-				pass
+			assert f.contains(shards, rounds, exact), "Inconsistent!"
 
-		return f(0)
+		return f.evaluate(0)
 
 	def toJson(self):
 		d = dict()
@@ -1,15 +1,135 @@
 
 import mglib.engine.numbers as numbers
-from typing import List,Iterable,Tuple
+import mglib.engine.precompute as precompute
+from array import array
+from typing import Dict,List,Iterable,Tuple
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Permutations are stored as arrays of this type, 4 bytes per element instead of a list of int objects.
+indexType = "I"
+
+class IndexedSequence():
+	"""
+	A list of distinct values that also knows the position of each value,
+	so index and the in operator take O(1) instead of a scan.
+
+	Assigning an element keeps the positions in sync, and performSwaps and shuffle work on it as on a list.
+	"""
+	def __init__(self, values : Iterable) -> None:
+		self.values : List = list(values)
+		self.reindex()
+		assert len(self.positions) == len(self.values), "The values must be distinct"
+
+	def reindex(self):
+		"""
+		Rebuilds the positions after the values were changed directly.
+		"""
+		self.positions : Dict = {v : i for (i,v) in enumerate(self.values)}
+
+	def __len__(self) -> int:
+		return len(self.values)
+
+	def __iter__(self):
+		return iter(self.values)
+
+	def __getitem__(self, i):
+		return self.values[i]
+
+	def __setitem__(self, i : int, value):
+		old = self.values[i]
+		# The old value may already have moved elsewhere, as in the middle of a swap.
+		if self.positions.get(old) == i:
+			del self.positions[old]
+		self.values[i] = value
+		self.positions[value] = i
+
+	def __contains__(self, value) -> bool:
+		return value in self.positions
+
+	def index(self, value) -> int:
+		if value not in self.positions:
+			raise ValueError(f"{value} is not in the sequence")
+		return self.positions[value]
+
+class Permutation(IndexedSequence):
+	"""
+	A permutation of range(n), by default the identity.
+
+	Both the values and the positions are compact arrays. Elements read as plain ints,
+	so it can stand in for a list of indices.
+	"""
+	def __init__(self, values : int | Iterable[int]) -> None:
+		if isinstance(values,int):
+			assert values < 1 << (8 * array(indexType).itemsize)
+			self.values = array(indexType, range(values))
+			self.positions = array(indexType, self.values)
+		else:
+			self.values = array(indexType, values)
+			self.reindex()
+
+	def reindex(self):
+		"""
+		Rebuilds the positions by scattering: positions[values[i]] = i.
+		With numpy this is a single vectorized assignment.
+		"""
+		n = len(self.values)
+		if numpy is not None:
+			positions = numpy.full(n, n, dtype = numpy.uint32)
+			positions[numpy.frombuffer(self.values, dtype = numpy.uint32)] = numpy.arange(n, dtype = numpy.uint32)
+			self.positions = array(indexType, positions.tobytes())
+		else:
+			positions = array(indexType, [n]) * n
+			for (i,v) in enumerate(self.values):
+				positions[v] = i
+			self.positions = positions
+		# A value missing from the values leaves its position unset.
+		assert n not in self.positions, "Not a permutation"
+
+	def __setitem__(self, i : int, value : int):
+		self.values[i] = value
+		self.positions[value] = i
+
+	def __contains__(self, value) -> bool:
+		return isinstance(value,int) and 0 <= value < len(self.values)
+
+	def index(self, value : int) -> int:
+		if value not in self:
+			raise ValueError(f"{value} is not in the permutation")
+		return self.positions[value]
+
+	def inverse(self) -> 'Permutation':
+		"""
+		The permutation that undoes this one: p.inverse()[p[i]] == i.
+		"""
+		# Our positions are its values and the other way around, no need to scatter again.
+		inverse = Permutation(0)
+		inverse.values = array(indexType, self.positions)
+		inverse.positions = array(indexType, self.values)
+		return inverse
 
 def shuffleSeq(count : int):
 	return (numbers.randomBelow(k) for k in range(2,count + 1))
 
+def shuffleDraws(count : int) -> List[int]:
+	"""
+	The random draws of a shuffle of the specified number of elements, as a list. See shufflingSwaps.
+	"""
+	return list(shuffleSeq(count))
+
 def performSwaps(perm : List,s : Iterable[Tuple[int,int]]):
 	"""
 	Iterates the index pairs in the second argument
 	and swaps them in the first argument.
 	"""
+	if isinstance(perm,IndexedSequence):
+		# Swap the plain values, then rebuild the positions once.
+		performSwaps(perm.values, s)
+		perm.reindex()
+		return perm
 	for (a,b) in s:
 		x = perm[a]
 		y = perm[b]
@@ -21,8 +141,10 @@ def shufflingSwaps(count : int):
 	"""
 	Produces a sequence of index pairs corresponding to swaps in a shuffle of the
 	specified number of elements.
+
+	Uses draws prepared ahead of time with mglib.engine.precompute, if there are any.
 	"""
-	return zip(range(1,count),shuffleSeq(count))
+	return zip(range(1,count),precompute.draw(shuffleDraws, count))
 
 def shuffle(perm : List):
 	"""
@@ -0,0 +1,242 @@
+
+import asyncio
+import functools
+import threading
+import mglib.engine.parallel as parallel
+import mglib.network.basic as basic
+import mglib.network.codec as codec
+import mglib.network.schema as schema
+from mglib.network.peer import Peer, Transcript, addressPattern, frameLength
+
+# Messages at least this large are decoded in a thread, so the event loop keeps serving other sessions meanwhile.
+offloadSize = 1 << 16
+
+class AsyncPeer():
+	"""
+	A peer connection built on asyncio streams, speaking the same wire format as SocketPeer.
+
+	Many AsyncPeers can share one event loop, so one process can drive many sessions.
+	See mglib.protocol.aio for protocols written against it.
+	"""
+	def __init__(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter) -> None:
+		self.__reader = reader
+		self.__writer = writer
+		self.__codec = codec.codecs[codec.JsonCodec.name]
+		self.transcript = Transcript()
+		self.primePool = None
+
+	async def handshake(self, codecs = tuple(codec.codecs)):
+		"""
+		Agrees with the peer on a codec. Same as the hello of SocketPeer.
+		"""
+		await self.send({"codecs" : list(codecs)})
+		hello = await self.recv(dict)
+		self.__codec = codec.negotiate(codecs, hello.get("codecs", []))
+
+	def getCodec(self) -> codec.Codec:
+		return self.__codec
+
+	async def sendBytes(self, *messages):
+		"""
+		Sends messages of raw bytes, bypassing the codec.
+		"""
+		for raw in messages:
+			self.__writer.write(frameLength(len(raw)))
+			self.__writer.write(raw)
+		await self.__writer.drain()
+
+	async def recvBytes(self) -> bytes:
+		"""
+		Receives one message of raw bytes, bypassing the codec.
+		"""
+		count = int.from_bytes(bytes = await self.__reader.readexactly(4), byteorder = "big", signed = False)
+		return await self.__reader.readexactly(count)
+
+	async def send(self, data):
+		await self.sendBytes(self.__codec.encode(data))
+
+	async def recv(self, *typePattern):
+		raw = await self.recvBytes()
+		if len(typePattern) > 0:
+			decode = functools.partial(self.__codec.decodeChecked, raw, schema.compile(typePattern))
+		else:
+			decode = functools.partial(self.__codec.decode, raw)
+		if len(raw) < offloadSize:
+			return decode()
+		return await asyncio.get_running_loop().run_in_executor(None, decode)
+
+	async def run(self, protocol, *args, executor = None, **kwargs):
+		"""
+		Runs a blocking protocol function from mglib.protocol against this peer,
+		without blocking the event loop.
+
+		This is a thread adapter: the protocol runs in a thread of its own, or in the executor
+		if one is given, which must be a thread pool. The thread holds the GIL while it computes,
+		so prefer a protocol written as steps, see fromSteps, where there is one.
+		"""
+		loop = asyncio.get_running_loop()
+		task = functools.partial(protocol, ThreadedPeer(self, loop), *args, **kwargs)
+		if executor is not None:
+			return await loop.run_in_executor(executor, task)
+		# A thread per session. A shared pool could starve, if both ends of a session run in this process.
+		result = loop.create_future()
+		def runTask():
+			try:
+				value = task()
+				loop.call_soon_threadsafe(lambda: result.done() or result.set_result(value))
+			except BaseException as e:
+				loop.call_soon_threadsafe(lambda e = e: result.done() or result.set_exception(e))
+		threading.Thread(target = runTask, daemon = True).start()
+		return await result
+
+	async def close(self):
+		self.__writer.close()
+		await self.__writer.wait_closed()
+
+class ThreadedPeer(Peer):
+	"""
+	A blocking Peer for a worker thread, that forwards to an AsyncPeer on its event loop.
+
+	Messages are encoded and decoded in the worker thread, so the event loop only moves bytes.
+	"""
+	def __init__(self, peer : AsyncPeer, loop : asyncio.AbstractEventLoop) -> None:
+		super().__init__()
+		self.__peer = peer
+		self.__loop = loop
+		self.__pending = []
+		# The transcript belongs to the session, not to a single protocol run.
+		self.transcript = peer.transcript
+		self.primePool = peer.primePool
+
+	def __call(self, coroutine):
+		return asyncio.run_coroutine_threadsafe(coroutine, self.__loop).result()
+
+	def send(self, data):
+		raw = self.__peer.getCodec().encode(data)
+		with self.sendLock:
+			self.__pending.append(raw)
+			if not self.isCorked():
+				self.flush()
+
+	def flush(self):
+		with self.sendLock:
+			if len(self.__pending) > 0:
+				pending = self.__pending
+				self.__pending = []
+				self.__call(self.__peer.sendBytes(*pending))
+
+	def recv(self, *typePattern):
+		self.flush()
+		raw = self.__call(self.__peer.recvBytes())
+		if len(typePattern) > 0:
+			return self.__peer.getCodec().decodeChecked(raw, schema.compile(typePattern))
+		return self.__peer.getCodec().decode(raw)
+
+async def connect(config : str, codecs = None) -> AsyncPeer:
+	"""
+	Connects to a peer at the address "host:port".
+
+	As with SocketPeer, codecs are only negotiated if codecs are given.
+	"""
+	match = addressPattern.match(config)
+	(reader, writer) = await asyncio.open_connection(match[1], match[2])
+	peer = AsyncPeer(reader, writer)
+	if codecs is not None:
+		await peer.handshake(codecs)
+	return peer
+
+async def serve(config : str, session, codecs = None) -> asyncio.Server:
+	"""
+	Listens at the address "host:port" and runs the session coroutine for every peer that connects.
+
+	As with SocketPeer, the host "host" means localhost, and codecs are only negotiated if codecs are given.
+	"""
+	match = addressPattern.match(config)
+	host = match[1]
+	if host.startswith("host"):
+		host = "localhost"
+
+	async def accept(reader, writer):
+		peer = AsyncPeer(reader, writer)
+		try:
+			if codecs is not None:
+				await peer.handshake(codecs)
+			await session(peer)
+		finally:
+			await peer.close()
+
+	return await asyncio.start_server(accept, host, match[2])
+
+def protocol(function):
+	"""
+	The counterpart of basic.protocol for coroutines taking an AsyncPeer as the first argument.
+
+	When the outermost protocol returns, everything agreed on during it
+	is checked with a single exchange of transcript digests, as with basic.protocol.
+	"""
+	@functools.wraps(function)
+	async def wrapper(peer : AsyncPeer, *args, **kwargs):
+		peer.transcript.depth = peer.transcript.depth + 1
+		try:
+			result = await function(peer, *args, **kwargs)
+		finally:
+			peer.transcript.depth = peer.transcript.depth - 1
+		if peer.transcript.depth == 0:
+			await checkpoint(peer)
+		return result
+	return wrapper
+
+async def checkpoint(peer : AsyncPeer):
+	"""
+	Verify that the peer agrees with us on everything agreed on since the last checkpoint. See basic.checkpoint.
+	"""
+	if peer.transcript.pending == 0:
+		return
+	await peer.send(peer.transcript.digest())
+	o = await peer.recv(str)
+	assert o == peer.transcript.expectedDigest(), "The peer disagrees on something agreed on since the last checkpoint"
+	peer.transcript.pending = 0
+
+def fromSteps(blocking):
+	"""
+	The async protocol of a blocking protocol written as steps, see basic.stepped.
+	It sends exactly what the blocking protocol sends, so the two interoperate.
+
+	It runs on the event loop. The Compute steps run in the executor if one is given,
+	which may be a process pool, otherwise in a thread that spreads batches over mglib.engine.parallel.
+	"""
+	@protocol
+	@functools.wraps(blocking)
+	async def wrapper(peer : AsyncPeer, *args, executor = None, **kwargs):
+		loop = asyncio.get_running_loop()
+		steps = blocking.steps(peer, *args, **kwargs)
+		result = None
+		while True:
+			try:
+				step = steps.send(result)
+			except StopIteration as e:
+				return e.value
+			if isinstance(step, basic.Send):
+				result = await peer.send(step.data)
+			elif isinstance(step, basic.Recv):
+				result = await peer.recv(*step.typePattern)
+			elif isinstance(step, basic.Agree):
+				result = agreeOn(peer, *step.data)
+			elif isinstance(step, basic.Checkpoint):
+				result = await checkpoint(peer)
+			elif step.threaded or executor is None:
+				result = await loop.run_in_executor(None, step.function, *step.args)
+			else:
+				# The pool may be a process pool. Its workers must not start one of their own.
+				result = await loop.run_in_executor(executor, parallel.inline, step.function, *step.args)
+	return wrapper
+
+def agreeOn(peer : AsyncPeer, *data):
+	"""
+	Records an agreement with the peer, as basic.agreeOn does. Meant for use inside a protocol.
+	"""
+	for d in data:
+		if isinstance(d,basic.AsymmetricAgreement):
+			peer.transcript.agree(d.send, d.recv)
+		else:
+			peer.transcript.agree(d, d)
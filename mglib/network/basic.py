@@ -1,39 +1,110 @@
 
-from hashlib import sha256
 from mglib.network.peer import Peer
 from typing import Iterable
-import json
+import contextlib
+import functools
+import threading
 
 class AsymmetricAgreement:
 	def __init__(self, send, recv) -> None:
 		self.send = send
 		self.recv = recv
 
+def protocol(function):
+	"""
+	Decorator for protocol functions taking the peer (or peers) as the first argument.
+
+	The peers are corked for the duration of the protocol, so the messages of a round
+	go out together, right before we wait for the answer.
+
+	When the outermost protocol returns, everything agreed on during it
+	is checked with a single exchange of transcript digests.
+	"""
+	@functools.wraps(function)
+	def wrapper(peers : Peer | Iterable[Peer], *args, **kwargs):
+		if not isinstance(peers,Peer):
+			peers = list(peers)
+		peerList = [peers] if isinstance(peers,Peer) else peers
+		with contextlib.ExitStack() as stack:
+			for p in peerList:
+				stack.enter_context(p.corked())
+			for p in peerList:
+				p.transcript.depth = p.transcript.depth + 1
+			try:
+				result = function(peers, *args, **kwargs)
+			finally:
+				for p in peerList:
+					p.transcript.depth = p.transcript.depth - 1
+			checkpoint([p for p in peerList if p.transcript.depth == 0])
+			return result
+	return wrapper
+
+def checkpoint(peers : Peer | Iterable[Peer]):
+	"""
+	Verify that the peers agree with us on everything agreed on since the last checkpoint.
+	"""
+	if isinstance(peers,Peer):
+		peers = [peers]
+	peers = [p for p in peers if p.transcript.pending > 0]
+	for p in peers:
+		p.send(p.transcript.digest())
+	for p in peers:
+		o = p.recv(str)
+		e = p.transcript.expectedDigest()
+		assert o == e, "The peer disagrees on something agreed on since the last checkpoint"
+		p.transcript.pending = 0
+
+def concurrently(peer : Peer, *protocols):
+	"""
+	Runs the protocol functions at the same time, each in a thread of its own
+	on a channel of its own, and returns their results in order.
+
+	Each function is called with its channel as the only argument.
+	The peer must run the matching protocols, in the same order.
+	The channels are closed even if a protocol fails, so the peer learns of it.
+	"""
+	results = [None] * len(protocols)
+	errors = []
+
+	def run(i, function, channel):
+		try:
+			results[i] = function(channel)
+		except BaseException as e:
+			errors.append(e)
+
+	try:
+		threads = [threading.Thread(target = run, args = (i, f, peer.channel(i))) for (i, f) in enumerate(protocols)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+	finally:
+		peer.closeChannels()
+	if len(errors) > 0:
+		raise errors[0]
+	return results
+
+@protocol
 def agreeOn(peers : Peer | Iterable[Peer],*data):
 	"""
 	Cooperatively agree with a peer on some data.
 	This is meant for data that both peers must be aware of,
 	such as a public input, a public result, or the next step in a protocol.
+
+	Nothing is sent right away, the agreement is recorded in the transcript
+	and verified at the next checkpoint. If the agreed data decides what is sent next,
+	such as roles or counts, call checkpoint right after, so a disagreement is caught
+	before the peers start talking past each other.
 	"""
 	if isinstance(peers,Peer):
 		peers = [peers]
 	for d in data:
-		e = None
-		if isinstance(d,AsymmetricAgreement):
-			e = d.send
-		else:
-			e = d
-		for p in peers:
-			p.send(e)
-	for d in data:
-		e = None
 		if isinstance(d,AsymmetricAgreement):
-			e = d.recv
+			(mine, theirs) = (d.send, d.recv)
 		else:
-			e = d
+			(mine, theirs) = (d, d)
 		for p in peers:
-			o = p.recv()
-			assert o == e, f"Expected {e} but received {o}"
+			p.transcript.agree(mine, theirs)
 
 def sender():
 	"""
@@ -45,4 +116,75 @@ def receiver():
 	"""
 	Indicate that we intend to be the receiving party in an asymmetric protocol.
 	"""
-	return AsymmetricAgreement("Receiver","Sender")
\ No newline at end of file
+	return AsymmetricAgreement("Receiver","Sender")
+
+# The steps of a protocol written with stepped. Each runs against a blocking peer with run,
+# the async protocols of mglib.network.aio run them on the event loop.
+
+class Send:
+	def __init__(self, data) -> None:
+		self.data = data
+
+	def run(self, peer : Peer):
+		peer.send(self.data)
+
+class Recv:
+	def __init__(self, *typePattern) -> None:
+		self.typePattern = typePattern
+
+	def run(self, peer : Peer):
+		return peer.recv(*self.typePattern)
+
+class Agree:
+	"""
+	Records an agreement, see agreeOn.
+	"""
+	def __init__(self, *data) -> None:
+		self.data = data
+
+	def run(self, peer : Peer):
+		agreeOn(peer, *self.data)
+
+class Checkpoint:
+	def run(self, peer : Peer):
+		checkpoint(peer)
+
+class Compute:
+	"""
+	Computes function(*args), without the peer. The async protocols run it off the event loop,
+	in their executor if they have one. If threaded, always in a thread of this process instead,
+	for functions that use the state of the process, such as precompute.draw.
+	"""
+	def __init__(self, function, *args, threaded : bool = False) -> None:
+		self.function = function
+		self.args = args
+		self.threaded = threaded
+
+	def run(self, peer : Peer):
+		return self.function(*self.args)
+
+def stepped(function):
+	"""
+	Decorator for protocols written once for both blocking and async peers.
+
+	The function is a generator taking the peer as the first argument. It yields the steps
+	Send, Recv, Agree, Checkpoint and Compute, is sent the result of each, and returns the result
+	of the protocol. It must not use the peer other than through the steps, and its transcript and primePool.
+
+	The decorated function is the blocking protocol, see protocol. The generator stays available as
+	its steps attribute, for other protocols written as steps to call with yield from, and for
+	mglib.network.aio.fromSteps, which makes the async protocol of it.
+	"""
+	@protocol
+	@functools.wraps(function)
+	def wrapper(peer : Peer, *args, **kwargs):
+		steps = function(peer, *args, **kwargs)
+		result = None
+		while True:
+			try:
+				step = steps.send(result)
+			except StopIteration as e:
+				return e.value
+			result = step.run(peer)
+	wrapper.steps = function
+	return wrapper
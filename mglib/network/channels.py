@@ -0,0 +1,191 @@
+
+import queue
+import threading
+from mglib.network.peer import Peer, typeCheck
+
+# Envelope kinds. Every message on the shared peer is [kind, channel name, payload].
+# The payload of DATA is [size, message], of CREDIT the number of bytes consumed.
+DATA = 0
+CREDIT = 1
+END = 2
+
+closed = object()
+
+def messageSize(data) -> int:
+	"""
+	A cheap estimate of the number of bytes the message takes on the wire.
+	"""
+	if isinstance(data,int):
+		return data.bit_length() // 8 + 1
+	if isinstance(data,str):
+		return len(data) + 1
+	if isinstance(data,list | tuple):
+		if len(data) == 0:
+			return 1
+		if set(map(type, data)) == {int}:
+			# Vectors of ints, without a Python call per element.
+			return len(data) * (max(data).bit_length() // 8 + 1)
+		return sum(messageSize(v) for v in data)
+	if isinstance(data,dict):
+		return sum(messageSize(k) + messageSize(v) for (k,v) in data.items())
+	return 1
+
+class Channel():
+	def __init__(self, window : int) -> None:
+		self.inbox = queue.Queue()
+		self.window = window
+		self.outstanding = 0
+		self.credited = threading.Condition()
+		self.consumed = 0
+		# Why nothing more arrives, once the reader stopped.
+		self.failure : BaseException | None = None
+
+	def acquire(self, size : int):
+		"""
+		Waits until the receiving side has room for size more bytes.
+		A message larger than the window may go once nothing else is outstanding.
+		"""
+		with self.credited:
+			room = lambda: self.outstanding == 0 or self.outstanding + size <= self.window
+			self.credited.wait_for(lambda: room() or self.failure is not None)
+			if not room():
+				# No credit can come anymore.
+				raise self.failure
+			self.outstanding = self.outstanding + size
+
+	def release(self, size : int):
+		with self.credited:
+			self.outstanding = self.outstanding - size
+			self.credited.notify_all()
+
+	def fail(self, failure : BaseException):
+		"""
+		Wakes everyone waiting on the channel, they raise the failure.
+		"""
+		with self.credited:
+			self.failure = failure
+			self.credited.notify_all()
+		self.inbox.put((0, closed))
+
+class ChannelPeer(Peer):
+	"""
+	One logical message stream over a shared peer. See Multiplexer.
+	"""
+	def __init__(self, mux : 'Multiplexer', name) -> None:
+		super().__init__()
+		self.__mux = mux
+		self.__name = name
+		self.__pending = []
+		self.primePool = mux.primePool
+
+	def send(self, data):
+		self.__pending.append(data)
+		if not self.isCorked():
+			self.flush()
+
+	def flush(self):
+		pending = self.__pending
+		self.__pending = []
+		for data in pending:
+			self.__mux.sendData(self.__name, data)
+
+	def recv(self, *typePattern):
+		self.flush()
+		data = self.__mux.recvData(self.__name)
+		if len(typePattern) > 0:
+			assert typeCheck(data,typePattern)
+		return data
+
+class Multiplexer():
+	"""
+	Carries any number of named channels over a single peer, so independent
+	sub-protocols can run at the same time from different threads.
+
+	Messages of different channels interleave on the shared peer. Every channel has its own
+	flow control: a sender may have at most window bytes of messages not yet consumed
+	by the receiving side, so a slow channel cannot fill memory with unread messages.
+
+	Both sides must create the multiplexer at the same point of the conversation.
+	While it is open, the shared peer must not be used directly. Closing is a barrier,
+	after it the shared peer can be used again.
+	"""
+	def __init__(self, peer : Peer, window : int = 16 << 20) -> None:
+		self.__peer = peer
+		self.__window = window
+		# Channels share the prime pool of the session.
+		self.primePool = peer.primePool
+		self.__channels = dict()
+		self.__channelsLock = threading.Lock()
+		self.__sendLock = threading.Lock()
+		self.__failure : BaseException | None = None
+		self.__reader = threading.Thread(target = self.__read, daemon = True)
+		self.__reader.start()
+
+	def __channel(self, name) -> Channel:
+		with self.__channelsLock:
+			if name not in self.__channels:
+				self.__channels[name] = Channel(self.__window)
+				if self.__failure is not None:
+					self.__channels[name].fail(self.__failure)
+			return self.__channels[name]
+
+	def channel(self, name) -> ChannelPeer:
+		self.__channel(name)
+		return ChannelPeer(self, name)
+
+	def __send(self, kind, name, payload):
+		with self.__sendLock:
+			self.__peer.send([kind, name, payload])
+			self.__peer.flush()
+
+	def sendData(self, name, data):
+		size = messageSize(data)
+		self.__channel(name).acquire(size)
+		self.__send(DATA, name, [size, data])
+
+	def recvData(self, name):
+		c = self.__channel(name)
+		if c.inbox.empty() and c.consumed > 0:
+			# Return all credit before we wait, so the sender is never stuck waiting on us.
+			self.__send(CREDIT, name, c.consumed)
+			c.consumed = 0
+		(size, data) = c.inbox.get()
+		if data is closed:
+			c.inbox.put((size, closed))
+			raise c.failure
+		c.consumed = c.consumed + size
+		if c.consumed * 2 >= c.window:
+			self.__send(CREDIT, name, c.consumed)
+			c.consumed = 0
+		return data
+
+	def __read(self):
+		failure : BaseException = ConnectionError("Connection closed by peer")
+		try:
+			while True:
+				(kind, name, payload) = self.__peer.recv(list)
+				if kind == DATA:
+					(size, data) = payload
+					self.__channel(name).inbox.put((size, data))
+				elif kind == CREDIT:
+					self.__channel(name).release(payload)
+				elif kind == END:
+					break
+				else:
+					raise ValueError("Unknown envelope kind " + repr(kind))
+		except BaseException as e:
+			# A broken connection, or a malformed message. The callers raise it, not this thread.
+			failure = e
+		finally:
+			# Nothing more comes from the peer, wake anyone still waiting.
+			with self.__channelsLock:
+				self.__failure = failure
+				for c in self.__channels.values():
+					c.fail(failure)
+
+	def close(self):
+		"""
+		Ends multiplexing. Waits until the peer ends it as well.
+		"""
+		self.__send(END, None, None)
+		self.__reader.join()
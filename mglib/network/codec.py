@@ -0,0 +1,223 @@
+import json
+import mglib.network.schema as schema
+
+class Codec():
+	"""
+	Converts messages to and from the raw bytes that travel between peers.
+
+	Messages are built from None, bools, ints, strings, lists and dicts.
+	Tuples are sent as lists. Dict keys arrive as strings, as JSON has no other keys:
+	ints become their decimal digits, and True, False and None become "true", "false" and "null".
+	"""
+	name = None
+
+	def encode(self, data) -> bytes:
+		raise Exception("Not implemented")
+
+	def decode(self, raw):
+		raise Exception("Not implemented")
+
+	def decodeChecked(self, raw, check : schema.Schema):
+		"""
+		Decodes the message and asserts that it passes the check.
+		"""
+		value = self.decode(raw)
+		assert check(value), "Message does not match the pattern"
+		return value
+
+class JsonCodec(Codec):
+	"""
+	The original wire format. Every peer understands it.
+	"""
+	name = "json"
+
+	def encode(self, data) -> bytes:
+		return json.dumps(data).encode()
+
+	def decode(self, raw):
+		return json.loads(bytes(raw).decode())
+
+TAG_NONE = 0x00
+TAG_FALSE = 0x01
+TAG_TRUE = 0x02
+TAG_INT = 0x03
+TAG_NEGATIVE_INT = 0x04
+TAG_STR = 0x05
+TAG_LIST = 0x06
+TAG_INT_VECTOR = 0x07
+TAG_DICT = 0x08
+
+def writeLength(out : bytearray, v : int):
+	"""
+	Appends a non-negative integer as a little-endian base 128 varint.
+	"""
+	while v >= 0x80:
+		out.append((v & 0x7f) | 0x80)
+		v = v >> 7
+	out.append(v)
+
+def jsonKey(key) -> str:
+	"""
+	The dict key as JSON sends it. See Codec.
+	"""
+	if isinstance(key,str):
+		return key
+	if key is True or key is False or key is None:
+		return json.dumps(key)
+	if isinstance(key,int):
+		return str(key)
+	raise Exception(f"Cannot encode a dict key of {type(key)}")
+
+def isIntVector(data) -> bool:
+	"""
+	True if the sequence is a non-empty list of non-negative ints, that can be sent as fixed width limbs.
+	"""
+	return len(data) > 0 and all(type(v) is int and v >= 0 for v in data)
+
+class BinaryCodec(Codec):
+	"""
+	A tagged binary format.
+
+	Every value starts with a single tag byte. Lengths and counts are varints.
+	Ints are sent as big-endian magnitudes, and lists of non-negative ints are sent as
+	a single vector of fixed width big-endian limbs, so a list of ciphertexts costs
+	about as many bytes as the ciphertexts themselves.
+	"""
+	name = "binary"
+
+	def encode(self, data) -> bytes:
+		out = bytearray()
+		self.__encode(data, out)
+		return out
+
+	def __encode(self, data, out : bytearray):
+		if data is None:
+			out.append(TAG_NONE)
+		elif data is False:
+			out.append(TAG_FALSE)
+		elif data is True:
+			out.append(TAG_TRUE)
+		elif isinstance(data,int):
+			if data < 0:
+				out.append(TAG_NEGATIVE_INT)
+				data = -data
+			else:
+				out.append(TAG_INT)
+			width = (data.bit_length() + 7) // 8
+			writeLength(out, width)
+			out += data.to_bytes(width, "big")
+		elif isinstance(data,str):
+			raw = data.encode()
+			out.append(TAG_STR)
+			writeLength(out, len(raw))
+			out += raw
+		elif isinstance(data,list | tuple):
+			if isIntVector(data):
+				width = max((max(data).bit_length() + 7) // 8, 1)
+				out.append(TAG_INT_VECTOR)
+				writeLength(out, len(data))
+				writeLength(out, width)
+				out += b"".join(v.to_bytes(width, "big") for v in data)
+			else:
+				out.append(TAG_LIST)
+				writeLength(out, len(data))
+				for v in data:
+					self.__encode(v, out)
+		elif isinstance(data,dict):
+			out.append(TAG_DICT)
+			writeLength(out, len(data))
+			for (k,v) in data.items():
+				self.__encode(jsonKey(k), out)
+				self.__encode(v, out)
+		else:
+			raise Exception(f"Cannot encode {type(data)}")
+
+	def decode(self, raw):
+		raw = memoryview(raw)
+		(value, end) = self.__decode(raw, 0)
+		assert end == len(raw), "Trailing bytes in message"
+		return value
+
+	def decodeChecked(self, raw, check : schema.Schema):
+		raw = memoryview(raw)
+		if isinstance(check,schema.IntVector) and len(raw) > 0 and raw[0] == TAG_INT_VECTOR:
+			# The header tells the length before anything is decoded, and the width
+			# often shows that every element is within the bounds.
+			(count, i) = self.__readLength(raw, 1)
+			(width, i) = self.__readLength(raw, i)
+			assert check.length is None or count == check.length, "Message does not match the pattern"
+			value = self.decode(raw)
+			if not (check.lower <= 0 and (1 << (8 * width)) <= check.upper):
+				assert check(value), "Message does not match the pattern"
+			return value
+		return super().decodeChecked(raw, check)
+
+	def __readLength(self, raw : memoryview, i : int):
+		v = 0
+		shift = 0
+		while True:
+			b = raw[i]
+			i = i + 1
+			v = v | ((b & 0x7f) << shift)
+			if b < 0x80:
+				return (v, i)
+			shift = shift + 7
+
+	def __decode(self, raw : memoryview, i : int):
+		tag = raw[i]
+		i = i + 1
+		if tag == TAG_NONE:
+			return (None, i)
+		if tag == TAG_FALSE:
+			return (False, i)
+		if tag == TAG_TRUE:
+			return (True, i)
+		if tag == TAG_INT or tag == TAG_NEGATIVE_INT:
+			(width, i) = self.__readLength(raw, i)
+			end = i + width
+			assert end <= len(raw), "Truncated message"
+			v = int.from_bytes(raw[i:end], "big")
+			return (-v if tag == TAG_NEGATIVE_INT else v, end)
+		if tag == TAG_STR:
+			(length, i) = self.__readLength(raw, i)
+			end = i + length
+			assert end <= len(raw), "Truncated message"
+			return (str(raw[i:end], "utf-8"), end)
+		if tag == TAG_INT_VECTOR:
+			(count, i) = self.__readLength(raw, i)
+			(width, i) = self.__readLength(raw, i)
+			end = i + count * width
+			assert width > 0 and end <= len(raw), "Truncated message"
+			# Slicing bytes is about twice as fast as slicing a memoryview, so we pay for one copy of the vector.
+			limbs = bytes(raw[i:end])
+			return ([int.from_bytes(limbs[k:k + width], "big") for k in range(0, end - i, width)], end)
+		if tag == TAG_LIST:
+			(count, i) = self.__readLength(raw, i)
+			result = []
+			for _ in range(count):
+				(v, i) = self.__decode(raw, i)
+				result.append(v)
+			return (result, i)
+		if tag == TAG_DICT:
+			(count, i) = self.__readLength(raw, i)
+			result = dict()
+			for _ in range(count):
+				(k, i) = self.__decode(raw, i)
+				(v, i) = self.__decode(raw, i)
+				result[k] = v
+			return (result, i)
+		raise Exception(f"Unknown tag {tag}")
+
+codecs = {c.name : c for c in (BinaryCodec(), JsonCodec())}
+
+def negotiate(mine : list, theirs : list) -> Codec:
+	"""
+	Picks the codec to use with a peer, given the codec names each side is willing to use.
+
+	Both sides pick the same codec: the first one in our global preference order that both
+	sides support. If the peers disagree on everything, JSON is used.
+	"""
+	for name in codecs:
+		if name in mine and name in theirs:
+			return codecs[name]
+	return codecs[JsonCodec.name]
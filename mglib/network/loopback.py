@@ -0,0 +1,158 @@
+
+import queue
+import threading
+import time
+import mglib.network.codec as codec
+from mglib.network.peer import Peer, typeCheck
+import mglib.network.schema as schema
+
+from typing import Tuple
+
+def copyMessage(data):
+	"""
+	Copies a message the way the wire would, turning tuples into lists.
+	"""
+	if isinstance(data,list | tuple):
+		return [copyMessage(v) for v in data]
+	if isinstance(data,dict):
+		return {k : copyMessage(v) for (k,v) in data.items()}
+	return data
+
+class Link():
+	"""
+	One direction of a loopback connection.
+
+	Delivery is modelled on a simulated clock: a batch of messages arrives latency seconds
+	after it was flushed, plus the time to push its bytes through the bandwidth, queueing
+	behind earlier batches still on the link.
+	"""
+	def __init__(self, latency : float, bandwidth : float | None) -> None:
+		self.queue = queue.Queue()
+		self.latency = latency
+		self.bandwidth = bandwidth
+		self.free = 0.0
+
+	def arrival(self, sent : float, size : int) -> float:
+		start = max(sent, self.free)
+		self.free = start + (size / self.bandwidth if self.bandwidth else 0.0)
+		return self.free + self.latency
+
+closed = object()
+
+class LoopbackPeer(Peer):
+	"""
+	A peer connected to another LoopbackPeer in the same process through in-memory queues.
+
+	Each side keeps a simulated clock that advances only when it waits for a message
+	that has not arrived yet, so the reported network time does not depend on the host.
+	With realtime, the delays are also really slept.
+	"""
+	def __init__(self, inbox : Link, outbox : Link, wireCodec : codec.Codec | None, realtime : bool) -> None:
+		super().__init__()
+		self.__inbox = inbox
+		self.__outbox = outbox
+		self.__codec = wireCodec
+		self.__realtime = realtime
+		self.__pending = []
+		self.__pendingSize = 0
+		self.clock = 0.0
+		self.bytesSent = 0
+		self.messagesSent = 0
+		self.flushes = 0
+		self.stalls = 0
+
+	@staticmethod
+	def pair(wireCodec : codec.Codec | str | None = codec.BinaryCodec.name, latency : float = 0.0, bandwidth : float | None = None, realtime : bool = False) -> Tuple['LoopbackPeer','LoopbackPeer']:
+		"""
+		Two connected peers.
+
+		Messages are serialized with the codec, so byte counts are realistic, unless it is None.
+		Latency is one way, in seconds. Bandwidth is in bytes per second, None for unlimited.
+		"""
+		if isinstance(wireCodec,str):
+			wireCodec = codec.codecs[wireCodec]
+		ab = Link(latency, bandwidth)
+		ba = Link(latency, bandwidth)
+		return (LoopbackPeer(ba, ab, wireCodec, realtime), LoopbackPeer(ab, ba, wireCodec, realtime))
+
+	def getCodec(self) -> codec.Codec | None:
+		return self.__codec
+
+	def send(self, data):
+		if self.__codec is None:
+			message = copyMessage(data)
+		else:
+			message = self.__codec.encode(data)
+		with self.sendLock:
+			if self.__codec is not None:
+				self.__pendingSize = self.__pendingSize + len(message) + 4
+			self.__pending.append(message)
+			self.messagesSent = self.messagesSent + 1
+			if not self.isCorked():
+				self.flush()
+
+	def flush(self):
+		with self.sendLock:
+			if len(self.__pending) > 0:
+				arrival = self.__outbox.arrival(self.clock, self.__pendingSize)
+				for message in self.__pending:
+					self.__outbox.queue.put((arrival, message))
+				self.bytesSent = self.bytesSent + self.__pendingSize
+				self.flushes = self.flushes + 1
+				self.__pending = []
+				self.__pendingSize = 0
+
+	def recv(self, *typePattern):
+		self.flush()
+		(arrival, message) = self.__inbox.queue.get()
+		if message is closed:
+			self.__inbox.queue.put((arrival, message))
+			raise ConnectionError("Connection closed by peer")
+		if arrival > self.clock:
+			if self.__realtime:
+				time.sleep(arrival - self.clock)
+			self.clock = arrival
+			self.stalls = self.stalls + 1
+		if self.__codec is not None and len(typePattern) > 0:
+			return self.__codec.decodeChecked(message, schema.compile(typePattern))
+		data = message if self.__codec is None else self.__codec.decode(message)
+		if len(typePattern) > 0:
+			assert typeCheck(data,typePattern)
+		return data
+
+	def close(self):
+		self.flush()
+		self.__outbox.queue.put((self.clock, closed))
+
+def runPair(sideA, sideB, **pairOptions):
+	"""
+	Runs two protocol functions against each other, each in a thread of its own,
+	and returns their results along with the two peers for inspection.
+
+	Each side is called with its peer as the only argument.
+	If either side raises, the exception is raised here after both sides have stopped.
+	"""
+	peers = LoopbackPeer.pair(**pairOptions)
+	results = [None, None]
+	errors = [None, None]
+
+	def run(i, side):
+		try:
+			results[i] = side(peers[i])
+		except BaseException as e:
+			errors[i] = e
+		finally:
+			peers[i].close()
+
+	threads = [threading.Thread(target = run, args = (i, side)) for (i, side) in enumerate((sideA, sideB))]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	for e in errors:
+		if e is not None and not isinstance(e, ConnectionError):
+			raise e
+	for e in errors:
+		if e is not None:
+			raise e
+	return (results[0], results[1], peers[0], peers[1])
@@ -1,39 +1,159 @@
 
 import socket
-import json
+from hashlib import sha256
+import contextlib
+import threading
 import re
-import types
 import itertools
+import mglib.network.codec as codec
+import mglib.network.schema as schema
+
+# Most systems refuse gather writes of more than 1024 buffers.
+maxGather = 1024
+
+# Messages are framed with a 4 byte length, as they always were.
+maxMessageSize = (1 << 32) - 1
+
+def frameLength(count : int) -> bytes:
+	"""
+	The length prefix of a message of count bytes.
+	"""
+	assert 0 <= count <= maxMessageSize, f"Message of {count} bytes is too large to send"
+	return count.to_bytes(length = 4, byteorder = "big",signed = False)
 
 addressPattern = re.compile(r"\A(?:(?:\[(?=.*\])|(?!.*\]))([^\[\]:]+|[^\[\]]+)\]?)??(?:(?:\A|(?!\A):)(\d{1,5}))?\Z")
 
 def typeCheck(value,pattern):
-	if pattern is ... or pattern is value: # Handles None, True, False
-		return True
-	if isinstance(pattern,tuple):
-		return any(typeCheck(value,p) for p in pattern)
-	if isinstance(pattern,type | types.UnionType):
-		return isinstance(value,pattern)
-	if isinstance(pattern,list):
-		return isinstance(value,list) and len(pattern) == len(value) and all(typeCheck(v,p) for (v,p) in zip(value,pattern))
-	if isinstance(pattern,dict):
-		return isinstance(value,dict) and all(k in pattern and typeCheck(v,pattern[k]) for (k,v) in value.items())
-	if isinstance(pattern,range) or isinstance(value,set):
-		return isinstance(value,int) and value in pattern
-	return False
+	"""
+	Tests the value against a message pattern. See schema.compile for the pattern syntax.
+	"""
+	return schema.compile(pattern)(value)
+
+class Transcript():
+	"""
+	A running hash of everything agreed with a peer during the session.
+
+	We keep two hashes: one of what we would have told the peer, and one of what we
+	expect the peer to tell us. For symmetric agreements the two are the same.
+	Comparing our expectations with the peer's digest checks all the agreements since the
+	start of the session at once, in place of sending every agreed value back and forth.
+	"""
+	def __init__(self) -> None:
+		self.__mine = sha256()
+		self.__theirs = sha256()
+		self.pending = 0
+		self.depth = 0
+
+	def agree(self, mine, theirs):
+		# Binary encodings are self delimiting, so concatenating them is unambiguous.
+		self.__mine.update(canonical.encode(mine))
+		self.__theirs.update(canonical.encode(theirs))
+		self.pending = self.pending + 1
+
+	def digest(self) -> str:
+		return self.__mine.hexdigest()
+
+	def expectedDigest(self) -> str:
+		return self.__theirs.hexdigest()
+
+canonical = codec.BinaryCodec()
 
 class Peer():
 
+	def __init__(self) -> None:
+		self.__corkDepth = 0
+		self.__multiplexer = None
+		self.transcript = Transcript()
+		# Shared primes kept for the session, see mglib.engine.primes. None to always generate new ones.
+		self.primePool = None
+		# Sending, including flushing, must be safe from several threads. See channel.
+		self.sendLock = threading.RLock()
+
 	def send(self,data):
 		raise Exception("Not implemented")
 	
 	def recv(self,t = None):
 		raise Exception("Not implemented")
 
+	def flush(self):
+		"""
+		Sends all messages held back while corked.
+		"""
+		pass
+
+	def isCorked(self) -> bool:
+		return self.__corkDepth > 0
+
+	@contextlib.contextmanager
+	def corked(self):
+		"""
+		While corked, sent messages are held back until we wait for the peer,
+		or until flush is called, and then they go out together.
+
+		Corking nests, messages are flushed when the outermost cork is released.
+		"""
+		self.__corkDepth = self.__corkDepth + 1
+		try:
+			yield self
+		finally:
+			self.__corkDepth = self.__corkDepth - 1
+			if self.__corkDepth == 0:
+				self.flush()
+
+	def channel(self, name) -> 'Peer':
+		"""
+		A sub-peer with a message stream of its own, multiplexed over this connection.
+
+		The peer must open channels at the same point of the conversation.
+		Until closeChannels, this peer must only be used through its channels.
+		"""
+		if self.__multiplexer is None:
+			# Imported here, the channels module builds on this one.
+			from mglib.network.channels import Multiplexer
+			self.__multiplexer = Multiplexer(self)
+		return self.__multiplexer.channel(name)
+
+	def closeChannels(self):
+		"""
+		Waits until both we and the peer are done with the channels, then resumes direct use.
+		"""
+		if self.__multiplexer is not None:
+			self.__multiplexer.close()
+			self.__multiplexer = None
+
 class SocketPeer(Peer):
-	def __init__(self, config : str) -> None:
+	def __init__(self, config : str | socket.socket, codecs = None) -> None:
+		"""
+		Connects to, or if the host is "host", waits for a peer at the address "host:port".
+		An already connected socket may be passed instead of an address.
+
+		The codecs argument lists the wire formats we are willing to use.
+		The peers use the most preferred one they both support, or JSON if there is none.
+		Agreeing on a codec takes a hello message, that a peer without codec support would take
+		for a protocol message. So by default there is no hello and we speak JSON, as such a peer does.
+		Only pass codecs if the peer passes them too.
+		"""
 		super().__init__()
 
+		if isinstance(config,socket.socket):
+			self.__socket = config
+		else:
+			self.__connect(config)
+
+		if self.__socket.family in (socket.AF_INET, socket.AF_INET6):
+			# We do our own coalescing, see corked. Nagle would only add delays.
+			self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+		self.__pending = []
+
+		# The hello is always sent as JSON, since we do not yet know what the peer speaks.
+		self.__codec = codec.codecs[codec.JsonCodec.name]
+		if codecs is not None:
+			self.send({"codecs" : list(codecs)})
+			hello = self.recv(dict)
+			self.__codec = codec.negotiate(codecs, hello.get("codecs", []))
+
+	def __connect(self, config : str):
 		match = addressPattern.match(config)
 
 		host = match[1]
@@ -54,25 +174,74 @@ class SocketPeer(Peer):
 			self.__socket = socket.socket(family,socketType,protocol)
 			self.__socket.connect(address)
 	
-	def __recvexact(self, count):
-		buf = bytes()
-		while len(buf) < count:
-			buf = buf + self.__socket.recv(count - len(buf))
-		return buf
+	def getCodec(self) -> codec.Codec:
+		return self.__codec
+	
+	def __recvexact(self, count) -> memoryview:
+		"""
+		Receives exactly count bytes straight into a preallocated buffer.
+		"""
+		view = memoryview(bytearray(count))
+		received = 0
+		while received < count:
+			k = self.__socket.recv_into(view[received:], count - received)
+			if k == 0:
+				raise ConnectionError("Connection closed by peer")
+			received = received + k
+		return view
+	
+	def __sendall(self, buffers):
+		"""
+		Sends all the buffers, using as few system calls as possible.
+		"""
+		buffers = [memoryview(b).cast("B") for b in buffers]
+		if not hasattr(self.__socket,"sendmsg"):
+			# No gather writes on this platform. (Windows)
+			for b in buffers:
+				self.__socket.sendall(b)
+			return
+		start = 0
+		while start < len(buffers):
+			sent = self.__socket.sendmsg(buffers[start:start + maxGather])
+			while start < len(buffers) and sent >= len(buffers[start]):
+				sent = sent - len(buffers[start])
+				start = start + 1
+			if sent > 0:
+				buffers[start] = buffers[start][sent:]
+	
+	def sendBytes(self, raw):
+		"""
+		Sends one message of raw bytes, bypassing the codec.
+		"""
+		with self.sendLock:
+			self.__pending.append(frameLength(len(raw)))
+			self.__pending.append(raw)
+			if not self.isCorked():
+				self.flush()
+	
+	def flush(self):
+		with self.sendLock:
+			if len(self.__pending) > 0:
+				pending = self.__pending
+				self.__pending = []
+				self.__sendall(pending)
+	
+	def recvBytes(self) -> memoryview:
+		"""
+		Receives one message of raw bytes, bypassing the codec.
+		"""
+		self.flush()
+		count = int.from_bytes(bytes = self.__recvexact(4), byteorder = "big", signed = False)
+		return self.__recvexact(count)
 	
 	def send(self,data):
-		raw = json.dumps(data).encode()
-		self.__socket.send(len(raw).to_bytes(length = 4, byteorder = "big",signed = False))
-		self.__socket.send(raw)
+		self.sendBytes(self.__codec.encode(data))
 	
 	def recv(self,*typePattern):
-		count = int.from_bytes(bytes = self.__recvexact(4), byteorder = "big", signed = False)
-		raw = self.__recvexact(count)
-		data = json.loads(raw.decode())
-		t = tuple(typePattern)
 		if len(typePattern) > 0:
-			assert typeCheck(data,typePattern)
-		return data
+			return self.__codec.decodeChecked(self.recvBytes(), schema.compile(typePattern))
+		return self.__codec.decode(self.recvBytes())
 
 	def close(self):
+		self.flush()
 		self.__socket.close()
\ No newline at end of file
@@ -0,0 +1,161 @@
+
+import collections
+import functools
+import threading
+import types
+
+# Ints as decoded from the wire. Bools count as ints, as in a range pattern and in Python.
+intTypes = {int, bool}
+
+def intsWithin(values : list, lower : int, upper : int) -> bool:
+	"""
+	True if every value is an int with lower <= value < upper.
+
+	All the work is done by builtins, without a Python call per element.
+	"""
+	if len(values) == 0:
+		return True
+	return set(map(type, values)) <= intTypes and lower <= min(values) and max(values) < upper
+
+class Schema():
+	"""
+	A compiled message pattern. Calling it with a value tells whether the value matches.
+	"""
+	def __call__(self, value) -> bool:
+		raise Exception("Not implemented")
+
+class IntVector(Schema):
+	"""
+	A list of ints in range(bound), or within the range if a range is given.
+
+	If length is given, the list must have exactly that many elements.
+	"""
+	def __init__(self, bound : int | range, length : int | None = None) -> None:
+		if isinstance(bound,int):
+			bound = range(bound)
+		assert bound.step == 1
+		self.lower = bound.start
+		self.upper = bound.stop
+		self.length = length
+
+	def __call__(self, value) -> bool:
+		return isinstance(value,list) \
+			and (self.length is None or len(value) == self.length) \
+			and intsWithin(value, self.lower, self.upper)
+
+class Matrix(Schema):
+	"""
+	A list of rows, each of them an IntVector of the specified bound and column count.
+	"""
+	def __init__(self, bound : int | range, rows : int | None = None, columns : int | None = None) -> None:
+		self.rows = rows
+		self.row = IntVector(bound, columns)
+
+	def __call__(self, value) -> bool:
+		return isinstance(value,list) \
+			and (self.rows is None or len(value) == self.rows) \
+			and all(map(self.row, value))
+
+# Compiled unhashable patterns, such as lists, by identity. The pattern is kept, so its id stays unique.
+recent : collections.OrderedDict = collections.OrderedDict()
+recentLock = threading.Lock()
+recentSize = 64
+
+def compile(pattern) -> Schema:
+	"""
+	Compiles a message pattern into a validator.
+
+	Hashable patterns are compiled once. Other patterns are remembered by identity for a while,
+	so a pattern object kept and reused compiles once as well. It must not be changed after use.
+
+	Patterns are built from:
+		...            matches anything
+		None, True...  match themselves
+		types          match instances
+		range          matches ints in the range
+		tuple          matches if any of its patterns matches
+		list           matches lists of the same length, element by element
+		dict           matches dicts whose keys are in the pattern, value by value
+		Schema         already compiled
+
+	A list repeating the same pattern, such as [range(m)] * n, compiles into a single
+	check over the whole value. Prefer IntVector and Matrix for those, they skip the compilation.
+	"""
+	if isinstance(pattern,Schema):
+		return pattern
+	try:
+		return compileHashable(typedKey(pattern), pattern)
+	except TypeError:
+		pass
+	with recentLock:
+		hit = recent.get(id(pattern))
+		if hit is not None and hit[0] is pattern:
+			recent.move_to_end(id(pattern))
+			return hit[1]
+	compiled = compilePattern(pattern)
+	with recentLock:
+		recent[id(pattern)] = (pattern, compiled)
+		while len(recent) > recentSize:
+			recent.popitem(last = False)
+	return compiled
+
+def typedKey(pattern):
+	"""
+	The pattern with the type of every part next to it, so that patterns equal
+	in Python but not as patterns, such as (1,) and (True,), stay apart.
+	"""
+	if isinstance(pattern,list | tuple):
+		return (type(pattern), tuple(typedKey(p) for p in pattern))
+	if isinstance(pattern,dict):
+		return (dict, tuple((typedKey(k), typedKey(v)) for (k,v) in pattern.items()))
+	return (type(pattern), pattern)
+
+def repeats(pattern : list) -> bool:
+	"""
+	True if the list is one pattern repeated, with the same types throughout.
+	"""
+	first = pattern[0]
+	if pattern.count(first) != len(pattern):
+		return False
+	if isinstance(first,range):
+		# Only a range equals a range, and range cannot be subclassed. The common large case.
+		return True
+	key = typedKey(first)
+	return all(typedKey(p) == key for p in pattern)
+
+@functools.lru_cache(maxsize = 1024)
+def compileHashable(key, pattern) -> Schema:
+	# Cached by the typed key, the pattern itself only comes along to be compiled.
+	return compilePattern(pattern)
+
+def compilePattern(pattern) -> Schema:
+	if isinstance(pattern,Schema):
+		return pattern
+	if pattern is ...:
+		return lambda value: True
+	if isinstance(pattern,tuple):
+		options = [compile(p) for p in pattern]
+		if len(options) == 1:
+			return options[0]
+		return lambda value: any(o(value) for o in options)
+	if isinstance(pattern,type | types.UnionType):
+		return lambda value: isinstance(value,pattern)
+	if isinstance(pattern,range):
+		return lambda value: isinstance(value,int) and value in pattern
+	if isinstance(pattern,list):
+		length = len(pattern)
+		if length > 0 and repeats(pattern):
+			first = pattern[0]
+			if isinstance(first,range) and first.step == 1:
+				return IntVector(first, length)
+			if isinstance(first,list) and len(first) > 0 and isinstance(first[0],range) \
+					and first[0].step == 1 and repeats(first):
+				return Matrix(first[0], length, len(first))
+			element = compile(first)
+			return lambda value: isinstance(value,list) and len(value) == length and all(map(element, value))
+		elements = [compile(p) for p in pattern]
+		return lambda value: isinstance(value,list) and len(value) == length and all(e(v) for (e,v) in zip(elements,value))
+	if isinstance(pattern,dict):
+		fields = {k : compile(p) for (k,p) in pattern.items()}
+		return lambda value: isinstance(value,dict) and all(k in fields and fields[k](v) for (k,v) in value.items())
+	return lambda value: value is pattern
@@ -1,5 +1,8 @@
 
-from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+import collections
+import contextlib
 
 def progressTick(value,max):
 	dmax = min(50,max)
@@ -14,26 +17,58 @@ def progressInit(max):
 def progressEnd():
 	print("",end="\n")
 
-def filterThenSlice(source : Iterable,filter,count : int):
+def mapInOrder(source : Iterable,function,workers : int = 1) -> Iterator:
+	"""
+	Yields (elem, function(elem)) for the elements of the source, in order.
+
+	With more than one worker, the calls run in that many threads, at most workers of them
+	ahead of the element yielded last. Closing the iterator early drops the calls not yet started,
+	so no more than workers calls are wasted.
+	"""
+	if workers <= 1:
+		for elem in source:
+			yield (elem, function(elem))
+		return
+	with ThreadPoolExecutor(max_workers = workers) as executor:
+		pending = collections.deque()
+		try:
+			for elem in source:
+				pending.append((elem, executor.submit(function, elem)))
+				if len(pending) >= workers:
+					(first, future) = pending.popleft()
+					yield (first, future.result())
+			while len(pending) > 0:
+				(first, future) = pending.popleft()
+				yield (first, future.result())
+		finally:
+			for (_, future) in pending:
+				future.cancel()
+
+def filterThenSlice(source : Iterable,filter,count : int,workers : int = 1):
+	"""
+	The first count elements of the source that pass the filter.
+	With more than one worker, up to that many elements are filtered at the same time. See mapInOrder.
+	"""
 
 	found = 0
 	result = []
 
 	progressInit(count)
 
-	for elem in source:
-		if filter(elem):
-			result.append(elem)
-			found = found + 1
-			progressTick(found,count)
-		if found == count:
-			break
+	with contextlib.closing(mapInOrder(source,filter,workers)) as filtered:
+		for (elem, keep) in filtered:
+			if keep:
+				result.append(elem)
+				found = found + 1
+				progressTick(found,count)
+			if found == count:
+				break
 	
 	progressEnd()
 
 	return result
 
-def filterAll(source : Iterable,filter):
+def filterAll(source : Iterable,filter,workers : int = 1):
 
 	count = len(source)
 	found = 0
@@ -41,8 +76,8 @@ def filterAll(source : Iterable,filter):
 
 	progressInit(count)
 
-	for elem in source:
-		if filter(elem):
+	for (elem, keep) in mapInOrder(source,filter,workers):
+		if keep:
 			result.append(elem)
 		found = found + 1
 		progressTick(found,count)
@@ -0,0 +1,35 @@
+from mglib.network.aio import AsyncPeer
+import mglib.network.aio as aio
+import mglib.protocol.random as random
+import mglib.protocol.tpp as tpp
+import mglib.protocol.choices as choices
+
+from typing import List, Set
+
+# Async protocols, for use with an AsyncPeer. They interoperate with a peer using the blocking
+# protocols of the same name.
+# The primitives are written once, as steps, and run on the event loop. See aio.fromSteps.
+# The rest run the blocking protocol in a thread. See AsyncPeer.run.
+
+sharedSeed = aio.fromSteps(random.sharedSeed)
+sharedRandom = aio.fromSteps(random.sharedRandom)
+sharedRandomProbablePrime = aio.fromSteps(random.sharedRandomProbablePrime)
+coinFlip = aio.fromSteps(random.coinFlip)
+obliviousSend = aio.fromSteps(tpp.obliviousSend)
+obliviousReceive = aio.fromSteps(tpp.obliviousReceive)
+psi = aio.fromSteps(tpp.psi)
+
+async def fillPrimePool(peer : AsyncPeer, security : int, size : int, executor = None):
+	return await peer.run(random.fillPrimePool, security, size, executor = executor)
+
+async def sharedShuffle(peer : AsyncPeer, elements : List, security : int, executor = None):
+	return await peer.run(random.sharedShuffle, elements, security, executor = executor)
+
+async def secretChoice(peer : AsyncPeer, elementCount : int, finalCount : int, myChoices : Set[int], peerChoices : int, security : int, opening : bool = False, executor = None):
+	return await peer.run(choices.secretChoice, elementCount, finalCount, myChoices, peerChoices, security, opening, executor = executor)
+
+async def secretChoiceA(peer : AsyncPeer, elementCount : int, finalCount : int, myChoices : Set[int], peerChoices : int, security : int, opening : bool = False, executor = None):
+	return await peer.run(choices.secretChoiceA, elementCount, finalCount, myChoices, peerChoices, security, opening, executor = executor)
+
+async def secretChoiceB(peer : AsyncPeer, elementCount : int, finalCount : int, myChoices : Set[int], peerChoices : int, security : int, opening : bool = False, executor = None):
+	return await peer.run(choices.secretChoiceB, elementCount, finalCount, myChoices, peerChoices, security, opening, executor = executor)
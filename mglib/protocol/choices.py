@@ -1,6 +1,8 @@
 
 from mglib.network.peer import Peer
+import mglib.network.schema as schema
 import mglib.engine.numbers as numbers
+import mglib.engine.precompute as precompute
 import mglib.engine.shamir as shamir
 import mglib.engine.exponents as exponents
 import mglib.engine.commitment as commitment
@@ -9,27 +11,71 @@ import mglib.network.basic as basic
 import mglib.protocol.random as random
 import mglib.protocol.tpp as tpp
 import mglib.progress as progress
+import itertools
+import secrets
 
-from typing import Set, List
+from typing import Iterator, Set, List
 
-def secretChoice(peer : Peer,elementCount : int,finalCount : int,myChoices : Set[int],peerChoices : int,security : int):
+# Shared primes of the security level drawn by every secretChoice: the Diffie Hellman prime
+# and the modulus of the PSI. This many per call are worth putting in the prime pool ahead.
+primesPerSecretChoice = 2
+
+def shardLocations(seed : bytes, count : int, modulus : int) -> Iterator[int]:
+	"""
+	The x values of the shards of items 0 to count - 1 in a secretChoice with opening, derived from the seed.
+	The values are distinct: a draw repeating an earlier one is skipped, as shatterMany does.
+	"""
+	assert count < modulus - 1
+	seen = set()
+	for x in numbers.expandSeed(seed, itertools.repeat(modulus - 1)):
+		if len(seen) == count:
+			return
+		if x + 1 not in seen:
+			seen.add(x + 1)
+			yield x + 1
+
+def prepareSecretChoice(elementCount : int,finalCount : int,myChoiceCount : int,peerChoices : int,security : int):
+	"""
+	Starts computing what a secretChoice with these arguments will need, in a background thread.
+	Keys, blinds, salts and shuffles are prepared for either role, as the role is only decided by the coinflip.
+
+	Can be called before the peer is connected. Whatever is not ready in time is computed inline.
+	"""
+	precompute.prepare(numbers.randomProbablePrime, security // 2 - 1)
+	precompute.prepare(tpp.obliviousSendSetup, security, elementCount)
+	precompute.prepare(commitment.randomSalt, security)
+	for count in {elementCount, finalCount, elementCount - myChoiceCount, finalCount - peerChoices}:
+		precompute.prepare(utils.shuffleDraws, count)
+
+@basic.protocol
+def secretChoice(peer : Peer,elementCount : int,finalCount : int,myChoices : Set[int],peerChoices : int,security : int,opening : bool = False):
 	"""
 
 	The Secret Choice protocol.
 
+	If opening, the sender commits to its shard map with a Merkle tree, and in the end opens
+	only the shards of the result, in place of sending the whole map. See commitment.MerkleTree.
+	The x value of each shard is derived from a seed the sender reveals with the tree, so every
+	location names exactly one item. The receiver learns the result as soon as it decrypts it,
+	before the sender does, as without opening. The opening then only confirms the result:
+	if the sender aborts instead, the receiver knows the result but cannot verify it.
+
 	"""
 	if random.coinFlip(peer, security):
 		print("Secret Choice Protocol as the Sender party")
-		return secretChoiceA(peer, elementCount, finalCount, myChoices, peerChoices, security)
+		return secretChoiceA(peer, elementCount, finalCount, myChoices, peerChoices, security, opening)
 	else:
 		print("Secret Choice Protocol as the Receiver party")
-		return secretChoiceB(peer, elementCount, finalCount, myChoices, peerChoices, security)
+		return secretChoiceB(peer, elementCount, finalCount, myChoices, peerChoices, security, opening)
 
-def secretChoiceA(peer : Peer,elementCount : int,finalCount : int,myChoices : Set[int],peerChoices : int,security : int):
+@basic.protocol
+def secretChoiceA(peer : Peer,elementCount : int,finalCount : int,myChoices : Set[int],peerChoices : int,security : int,opening : bool = False):
 	
 	assert finalCount < elementCount
 	assert len(myChoices) + peerChoices < finalCount
-	basic.agreeOn(peer, "Secret Choice", elementCount, finalCount, basic.AsymmetricAgreement(len(myChoices),peerChoices), basic.sender())
+	basic.agreeOn(peer, "Secret Choice", elementCount, finalCount, basic.AsymmetricAgreement(len(myChoices),peerChoices), basic.sender(), opening)
+	# The roles, counts and opening decide every message that follows.
+	basic.checkpoint(peer)
 
 	phases = 11
 
@@ -40,7 +86,7 @@ def secretChoiceA(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 
 	dhCipher = exponents.commutative(dhPrime).keygen()
 
-	shamirModulus = numbers.randomProbablePrime(security // 2 - 1)
+	shamirModulus = precompute.draw(numbers.randomProbablePrime, security // 2 - 1)
 
 	assert shamirModulus * shamirModulus < dhPrime
 
@@ -50,26 +96,34 @@ def secretChoiceA(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 
 	proofOfResult = numbers.randomBelow(shamirContext.getModulus())
 
-	shards = [((a * shamirModulus) + b) for (a,b) in shamirContext.shatter(proofOfResult, elementCount)]
+	if opening:
+		locationSeed = secrets.token_bytes(random.seedBits // 8)
+		locations = shardLocations(locationSeed, elementCount, shamirModulus)
+	else:
+		locations = None
+
+	shards = [((a * shamirModulus) + b) for (a,b) in zip(*shamirContext.shatterMany(proofOfResult, elementCount, locations))]
 
 	progress.progressTick(1,phases)
 # Phase 2: Lock in the shard map
 
-	shardCommitment = commitment.commit(" ".join(hex(k) for k in shards), security)
+	if opening:
+		shardCommitment = commitment.MerkleTree(shards, security)
+	else:
+		shardCommitment = commitment.commitInts(shards, security)
 
 	peer.send(shardCommitment.phaseOne())
+	if opening:
+		peer.send(locationSeed.hex())
 
 	progress.progressTick(2,phases)
 # Phase 3: Send encrypted shards
 
-	shardIndices = utils.shuffle(list(range(elementCount)))
+	shardIndices = utils.shuffle(utils.Permutation(elementCount))
 
-	shardPermutation = [None for _ in shardIndices]
+	shardPermutation = shardIndices.inverse()
 
-	for (i,v) in enumerate(shardIndices):
-		shardPermutation[v] = i
-
-	peer.send([dhCipher.encrypt(shards[i]) for i in shardIndices])
+	peer.send(dhCipher.encryptMany([shards[i] for i in shardIndices]))
 
 	progress.progressTick(3,phases)
 # Phase 4: Send a subset of permutation mappings
@@ -79,7 +133,7 @@ def secretChoiceA(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 	progress.progressTick(4,phases)
 # Phase 5: Receive doubly-encrypted shards
 
-	doubleShards : List[int] = peer.recv([range(dhPrime)] * elementCount)
+	doubleShards : List[int] = peer.recv(schema.IntVector(dhPrime, elementCount))
 
 	progress.progressTick(5,phases)
 # Phase 6: Receive a subset of permutation mappings
@@ -98,7 +152,7 @@ def secretChoiceA(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 	progress.progressTick(6,phases)
 # Phase 7: Send single-encrypted result
 
-	peer.send([dhCipher.decrypt(doubleShards[k]) for k in bucket])
+	peer.send(dhCipher.decryptMany([doubleShards[k] for k in bucket]))
 
 	progress.progressTick(7,phases)
 # Phase 8: Receive commitment of final result
@@ -121,22 +175,34 @@ def secretChoiceA(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 	progress.progressTick(9,phases)
 # Phase 10: Send shard mapping to the peer and allow them to verify it
 
-	peer.send(shards)
-	peer.send(shardCommitment.phaseTwo())
+	if not opening:
+		peer.send(shards)
+		peer.send(shardCommitment.phaseTwo())
 
 	progress.progressTick(10,phases)
 # Phase 11: Receive final list of shards from the peer and verify it
 
-	finalShards = peer.recv([range(dhPrime)] * finalCount)
+	finalShards = peer.recv(schema.IntVector(dhPrime, finalCount))
+	finalShardsVerifier = finalShardsCommitment.verifier().update(finalShards)
 	finalShardsCommitment.update(**peer.recv(dict))
-	finalShardsCommitment.verify(" ".join(hex(k) for k in finalShards))
+	finalShardsVerifier.finalize()
+
+	shardIndex = utils.IndexedSequence(shards)
+	finalItems = set(shardIndex.index(shard) for shard in finalShards)
+
+	if opening:
+		# Now that we know the result, open the shards in it, and only those.
+		peer.send(shardCommitment.open(finalItems))
 
 	progress.progressTick(11,phases)
 	progress.progressEnd()
-	return set(shards.index(shard) for shard in finalShards)
+	return finalItems
 
-def secretChoiceB(peer : Peer,elementCount : int,finalCount : int,myChoices : Set[int],peerChoices : int,security : int):
-	basic.agreeOn(peer, "Secret Choice", elementCount, finalCount, basic.AsymmetricAgreement(len(myChoices),peerChoices), basic.receiver())
+@basic.protocol
+def secretChoiceB(peer : Peer,elementCount : int,finalCount : int,myChoices : Set[int],peerChoices : int,security : int,opening : bool = False):
+	basic.agreeOn(peer, "Secret Choice", elementCount, finalCount, basic.AsymmetricAgreement(len(myChoices),peerChoices), basic.receiver(), opening)
+	# The roles, counts and opening decide every message that follows.
+	basic.checkpoint(peer)
 
 	phases = 11
 
@@ -156,13 +222,19 @@ def secretChoiceB(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 	progress.progressTick(1,phases)
 # Phase 2: Receive peer's lock in
 
-	shardCommitment = commitment.Commitment(**peer.recv(dict))
-	shardCommitment.verifyHasProof()
+	if opening:
+		shardCommitment = commitment.MerkleCommitment(**peer.recv(dict))
+		assert shardCommitment.count == elementCount
+		locationSeed = bytes.fromhex(peer.recv(str))
+		assert len(locationSeed) == random.seedBits // 8
+	else:
+		shardCommitment = commitment.Commitment(**peer.recv(dict))
+		shardCommitment.verifyHasProof()
 
 	progress.progressTick(2,phases)
 # Phase 3: Receive encrypted shards
 
-	encryptedShards = peer.recv([range(dhPrime)] * elementCount)
+	encryptedShards = peer.recv(schema.IntVector(dhPrime, elementCount))
 
 	progress.progressTick(3,phases)
 # Phase 4: Receive a subset of permutation mappings
@@ -171,7 +243,8 @@ def secretChoiceB(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 
 	assert len(myIndices) == len(myChoices)
 	
-	randomIndices = [k for k in range(0,elementCount) if k not in myIndices]
+	myIndexSet = set(myIndices)
+	randomIndices = [k for k in range(0,elementCount) if k not in myIndexSet]
 
 	utils.shuffle(randomIndices)
 
@@ -181,15 +254,12 @@ def secretChoiceB(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 
 	shardIndices.extend(randomIndices[randomChoices:])
 
-	shardPermutation = [None for _ in shardIndices]
-
-	for (i,v) in enumerate(shardIndices):
-		shardPermutation[v] = i
+	shardPermutation = utils.Permutation(shardIndices).inverse()
 
 	progress.progressTick(4,phases)
 # Phase 5: Send doubly-encrypted shards
 
-	peer.send([dhCipher.encrypt(encryptedShards[k]) for k in shardIndices])
+	peer.send(dhCipher.encryptMany([encryptedShards[k] for k in shardIndices]))
 
 	progress.progressTick(5,phases)
 # Phase 6: Send a subset of permutation mappings
@@ -199,18 +269,32 @@ def secretChoiceB(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 	progress.progressTick(6,phases)
 # Phase 7: Receive single-encrypted result
 
-	encryptedShards = peer.recv([range(dhPrime)] * finalCount)
+	encryptedShards = peer.recv(schema.IntVector(dhPrime, finalCount))
 
-	finalShards = [dhCipher.decrypt(s) for s in encryptedShards]
+	finalShards = dhCipher.decryptMany(encryptedShards)
 	
 	proofOfResult = shamirContext.recover((s // shamirModulus,s % shamirModulus) for s in finalShards)
 
 	utils.shuffle(finalShards)
 
+	if opening:
+		# The locations name the items, so we learn the result here, before the peer does.
+		finalLocations = set(s // shamirModulus for s in finalShards)
+		assert len(finalLocations) == finalCount
+		itemOf = dict()
+		for (i,x) in enumerate(shardLocations(locationSeed, elementCount, shamirModulus)):
+			if x in finalLocations:
+				assert x not in itemOf, "The peer repeated a shard location"
+				itemOf[x] = i
+		assert len(itemOf) == finalCount, "A shard of the result belongs to no item"
+		finalItems = set(itemOf.values())
+
+		assert all(m in finalItems for m in myChoices)
+
 	progress.progressTick(7,phases)
 # Phase 8: Lock in the encrypted result
 
-	finalShardsCommitment = commitment.commit(" ".join(hex(k) for k in finalShards), security)
+	finalShardsCommitment = commitment.commitInts(finalShards, security)
 	peer.send(finalShardsCommitment.phaseOne())
 
 	progress.progressTick(8,phases)
@@ -224,22 +308,36 @@ def secretChoiceB(peer : Peer,elementCount : int,finalCount : int,myChoices : Se
 	progress.progressTick(9,phases)
 # Phase 10: Receive shard mapping from the peer, and verify it
 
-	shards : List = peer.recv([range(dhPrime)] * elementCount)
-	assert len(shards) == elementCount
-	assert all(isinstance(k,int) for k in shards)
+	if opening:
+		# We know the result already, the peer opens its shards to confirm it in phase 11.
+		peer.send(finalShards)
+		peer.send(finalShardsCommitment.phaseTwo())
+	else:
+		shards : List = peer.recv(schema.IntVector(dhPrime, elementCount))
+		assert len(shards) == elementCount
+		assert all(isinstance(k,int) for k in shards)
 
-	shardCommitment.update(**peer.recv(dict))
-	shardCommitment.verify(" ".join(hex(k) for k in shards))
+		# The shards are hashed a chunk at a time, the committed string is never built.
+		shardVerifier = shardCommitment.verifier().update(shards)
+		shardCommitment.update(**peer.recv(dict))
+		shardVerifier.finalize()
 
-	finalItems = set(shards.index(shard) for shard in finalShards)
+		shardIndex = utils.IndexedSequence(shards)
+		finalItems = set(shardIndex.index(shard) for shard in finalShards)
 
-	assert all(m in finalItems for m in myChoices)
+		assert all(m in finalItems for m in myChoices)
 
 	progress.progressTick(10,phases)
 # Phase 11: Send the encrypted result and allow the peer to verify it
 
-	peer.send(finalShards)
-	peer.send(finalShardsCommitment.phaseTwo())
+	if opening:
+		opened = shardCommitment.verifyOpening(**peer.recv(dict))
+		assert set(opened) == finalItems
+		assert all(itemOf[s // shamirModulus] == i for (i,s) in opened.items())
+		assert set(opened.values()) == set(finalShards)
+	else:
+		peer.send(finalShards)
+		peer.send(finalShardsCommitment.phaseTwo())
 
 	progress.progressTick(11,phases)
 	progress.progressEnd()
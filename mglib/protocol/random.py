@@ -3,34 +3,67 @@ from mglib.engine.numbers import *
 import mglib.engine.utils as utils
 from mglib.network.peer import Peer
 import mglib.network.basic as basic
-from mglib.engine.commitment import Commitment, commit
+import mglib.network.schema as schema
+from mglib.engine.commitment import Commitment, commit, commitInts
 
 from typing import Iterable, List
+import secrets
 
-def sharedRandom(peer : Peer, limits : int | Iterable[int], security):
+# Bits of the seed each party contributes to sharedSeed.
+seedBits = 256
+
+@basic.stepped
+def sharedSeed(peer : Peer, security) -> bytes:
+	"""
+	Generate a random seed for numbers.expandSeed, cooperating with the specified peer.
+
+	Both participants will learn the result, and both participants will be assured that it is random.
+	"""
+	yield basic.Agree("Shared Seed",seedBits)
+	mySeed = secrets.randbits(seedBits)
+
+	myC = commit(mySeed.to_bytes(seedBits // 8, "big"), security)
+	yield basic.Send(myC.toJson(includeSalt=False,includeProof=True))
+	peerC = Commitment(**(yield basic.Recv(dict)))
+	peerC.verifyHasProof()
+	yield basic.Send(mySeed)
+	peerSeed = yield basic.Recv(range(1 << seedBits))
+	yield basic.Send(myC.toJson(includeSalt=True,includeProof=False))
+	peerC.update(**(yield basic.Recv(dict)))
+	peerC.verify(peerSeed.to_bytes(seedBits // 8, "big"))
+
+	return (mySeed ^ peerSeed).to_bytes(seedBits // 8, "big")
+
+@basic.stepped
+def sharedRandom(peer : Peer, limits : int | Iterable[int], security, seeded : bool = False):
 	"""
 	Generate one or more random integers, cooperating with the specified peer.
 
 	Both participants will learn the result, and both participants will be assured that it is random.
+
+	If seeded, the integers are expanded from a shared seed, see sharedSeed. This sends the same
+	few messages however many integers there are. Otherwise both of us send an integer per limit.
 	"""
 	returnAsInt = isinstance(limits,int)
 	if returnAsInt:
 		limits = [limits]
-	basic.agreeOn(peer,"Shared Random Batch",limits)
+	yield basic.Agree("Shared Random Batch",limits,seeded)
+	yield basic.Checkpoint()
+	if seeded:
+		result = tuple(expandSeed((yield from sharedSeed.steps(peer, security)), limits))
+		return result[0] if returnAsInt else result
 	myResults = tuple(randomBelow(d) for d in limits)
-	mySign = " ".join(hex(r) for r in myResults)
 
-	myC = commit(mySign, security)
-	peer.send(myC.toJson(includeSalt=False,includeProof=True))
-	peerC = Commitment(**peer.recv(dict))
+	myC = commitInts(myResults, security)
+	yield basic.Send(myC.toJson(includeSalt=False,includeProof=True))
+	peerC = Commitment(**(yield basic.Recv(dict)))
 	peerC.verifyHasProof()
-	peer.send(myResults)
-	peerResults = peer.recv([range(k) for k in limits])
+	yield basic.Send(myResults)
+	peerResults = yield basic.Recv([range(k) for k in limits])
 	assert len(peerResults) == len(limits)
-	peer.send(myC.toJson(includeSalt=True,includeProof=False))
-	peerSign = " ".join(hex(r) for r in peerResults)
-	peerC.update(**peer.recv(dict))
-	peerC.verify(peerSign)
+	yield basic.Send(myC.toJson(includeSalt=True,includeProof=False))
+	peerC.update(**(yield basic.Recv(dict)))
+	peerC.verifyInts(peerResults)
 
 	result = tuple((myR + peerR) % limit for (myR,peerR,limit) in zip(myResults,peerResults,limits))
 	
@@ -39,49 +72,122 @@ def sharedRandom(peer : Peer, limits : int | Iterable[int], security):
 	else:
 		return result
 
-def sharedRandomProbablePrime(peer : Peer, security : int):
+@basic.stepped
+def sharedRandomProbablePrime(peer : Peer, security : int, pooled : bool = True):
 	"""
 	Generate a random probable big prime number, cooperating with the specified peer.
 
 	Both participants will learn the result, and both participants will be assured that it is random.
+
+	If both we and the peer have a prime pool with the same prime of the agreed size in it,
+	that prime is used up instead of generating a new one. See fillPrimePool.
 	"""
-	basic.agreeOn(peer,"Shared Random Probable Prime")
-	peer.send(security)
-	peerSecurity = peer.recv(int)
+	yield basic.Agree("Shared Random Probable Prime")
+	pool = peer.primePool if pooled else None
+	myOffer = [] if pool is None else pool.offer(security)
+	yield basic.Send(security)
+	yield basic.Send(myOffer)
+	peerSecurity = yield basic.Recv(int)
 	maxSecurity = max(security,peerSecurity)
 
 	assert 8 <= maxSecurity
 
-	number = sharedRandom(peer,leastWithBits(maxSecurity),security) | 1 << maxSecurity | 0x1
+	peerOffer = yield basic.Recv(schema.IntVector(1 << (maxSecurity + 1)))
+	prime = commonPooledPrime(pool, myOffer, peerOffer, maxSecurity)
+	if prime is not None:
+		return prime
 
-	backlog = 0
+	number = (yield from sharedRandom.steps(peer,leastWithBits(maxSecurity),security)) | 1 << maxSecurity | 0x1
+
+	# The candidates are random, neither party can pick them, so the average case error bound applies.
+	rounds = millerRabinRounds(maxSecurity + 1)
+	# Odd candidates per window. Usually holds a few primes.
+	count = max(64, maxSecurity)
 
 	while True:
-		# Cooperative testing with proofs.
-		# We use the first value where neither party can prove compositeness.
-		witness = millerRabin(number, security * 2)
-		peer.send(witness)
+		# Cooperative testing with proofs, a window at a time. See windowVerdicts.
+		candidates = sievedCandidates(number, count)
+		verdicts = yield basic.Compute(windowVerdicts, candidates, rounds)
+		yield basic.Send(verdicts)
+		peerVerdicts = yield basic.Recv(schema.IntVector(number + 2 * count))
+		(prime, number) = windowOutcome(number, count, candidates, verdicts, peerVerdicts)
+		if prime is not None:
+			return prime
+
+def commonPooledPrime(pool, myOffer : List[int], peerOffer : List[int], security : int) -> int | None:
+	"""
+	The prime both we and the peer offered for the security level, taken out of our pool, if there is one.
+	"""
+	# Both of us compute this from the two offers, so we pick the same prime.
+	common = [p for p in set(myOffer).intersection(peerOffer) if p.bit_length() == security + 1]
+	if len(common) == 0:
+		return None
+	prime = min(common)
+	assert pool.take(prime), "The prime pool was used by another protocol at the same time"
+	return prime
+
+def windowVerdicts(candidates : List[int], rounds : int) -> List[int]:
+	"""
+	Our part of testing a window of candidates for sharedRandomProbablePrime.
+
+	Both parties sieve the same window, so candidates with a small factor need no proof.
+	For the rest, we give a witness of compositeness each, up to and including the first
+	candidate we could not refute, marked with 0.
+	"""
+	verdicts = []
+	for c in candidates:
+		witness = millerRabin(c, rounds)
+		verdicts.append(0 if witness is None else witness)
 		if witness is None:
-			for _ in range(backlog):
-				peer.recv(int | None)
-			backlog = 0
-			peerWitness = peer.recv(int | None)
-			if peerWitness is None:
-				return number
-			assert testCompositeWitness(number, peerWitness)
-		else:
-			# We know the number is composite. Instead of waiting for the peer's message,
-			# we "remember" we have unread messages.
-			backlog = backlog + 1
-		number = number + 2
+			break
+	return verdicts
 
+def windowOutcome(number : int, count : int, candidates : List[int], verdicts : List[int], peerVerdicts : List[int]):
+	"""
+	The first candidate where neither party can prove compositeness, or None, and where the next window starts.
+	"""
+	assert len(peerVerdicts) <= len(candidates)
+	for (c, mine, theirs) in zip(candidates, verdicts, peerVerdicts):
+		if mine == 0 and theirs == 0:
+			return (c, number)
+		if mine == 0:
+			assert testCompositeWitness(c, theirs)
+	# Every candidate tested by both of us is composite. Continue after them.
+	tested = min(len(verdicts), len(peerVerdicts))
+	if tested < len(candidates):
+		return (None, candidates[tested - 1] + 2)
+	return (None, number + 2 * count)
+
+@basic.protocol
+def fillPrimePool(peer : Peer, security : int, size : int):
+	"""
+	Generate shared primes with the peer until both of our prime pools hold at least
+	size primes of the security level.
+
+	Meant to run in the background of other protocols, on a channel of its own. See basic.concurrently.
+	"""
+	basic.agreeOn(peer,"Fill Prime Pool",size)
+	basic.checkpoint(peer)
+	pool = peer.primePool
+	assert pool is not None
+	myMissing = max(0, size - pool.count(security))
+	peer.send(myMissing)
+	missing = max(myMissing, peer.recv(range(size + 1)))
+	for _ in range(missing):
+		pool.add(sharedRandomProbablePrime(peer, security, pooled = False))
+
+@basic.protocol
 def sharedFisherYates(peer : Peer, elementCount, security : int):
-	return sharedRandom(peer, list(range(2,elementCount + 1)), security)
+	# The limits follow from the element count, agreeing on the count is enough.
+	basic.agreeOn(peer,"Shared Fisher Yates",elementCount)
+	return list(expandSeed(sharedSeed(peer, security), range(2,elementCount + 1)))
 
+@basic.protocol
 def sharedShuffle(peer : Peer, elements : List, security : int):
 	count = len(elements)
 	return utils.performSwaps(elements,zip(range(1,count),sharedFisherYates(peer, count, security)))
 
+@basic.stepped
 def coinFlip(peer : Peer, security : int):
 	"""
 	Performs a coinflip with the peer. Either we or them win the coinflip.
@@ -89,20 +195,20 @@ def coinFlip(peer : Peer, security : int):
 
 	This is a symmetric protocol, which yields asymmetric results.
 	"""
-	basic.agreeOn(peer,"Coinflip")
+	yield basic.Agree("Coinflip")
 	while True:
 		myResult = randomBelow(1 << security)
 
 		myC = commit(hex(myResult), security)
-		peer.send(myC.toJson(includeSalt=False,includeProof=True))
-		peerC = Commitment(**peer.recv(dict))
+		yield basic.Send(myC.toJson(includeSalt=False,includeProof=True))
+		peerC = Commitment(**(yield basic.Recv(dict)))
 		peerC.verifyHasProof()
-		peer.send(myResult)
+		yield basic.Send(myResult)
 
-		peerResult = peer.recv(int)
+		peerResult = yield basic.Recv(int)
 		assert 0 <= peerResult # The integer is not actually bounded.
-		peer.send(myC.toJson(includeSalt=True,includeProof=False))
-		peerC.update(**peer.recv(dict))
+		yield basic.Send(myC.toJson(includeSalt=True,includeProof=False))
+		peerC.update(**(yield basic.Recv(dict)))
 		peerC.verify(hex(peerResult))
 
 		if myResult == peerResult:
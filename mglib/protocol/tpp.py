@@ -2,13 +2,27 @@
 import mglib.network.basic as basic
 import mglib.engine.exponents as exponents
 import mglib.engine.numbers as numbers
+import mglib.engine.precompute as precompute
 import mglib.engine.utils as utils
 import mglib.protocol.random as random
 from mglib.network.peer import Peer
+import mglib.network.schema as schema
 from hashlib import sha256
-from typing import List, Set
+from typing import List, Sequence, Set
 
-def obliviousSend(peer : Peer, messages : List[int], sendCount : int, security) -> None:
+def obliviousSendSetup(security : int, messageCount : int, workers : int = 1):
+	"""
+	The key and the blinds of an obliviousSend. They do not depend on the peer or the messages,
+	so they can be prepared ahead of time with mglib.engine.precompute.
+
+	With more than one worker, the primes of the key are raced for in that many processes.
+	"""
+	cipher : exponents.Cipher = exponents.asymmetric(security, workers).keygen()
+	modulus = cipher.getModulus()
+	return (cipher, [numbers.randomBelow(modulus) for _ in range(messageCount)])
+
+@basic.stepped
+def obliviousSend(peer : Peer, messages : Sequence[int], sendCount : int, security) -> None:
 	"""
 	Send the peer a subset of the messages.
 
@@ -17,18 +31,24 @@ def obliviousSend(peer : Peer, messages : List[int], sendCount : int, security)
 	The sender will not learn any information whatsoever.
 	"""
 	passCount = sendCount
-	basic.agreeOn(peer,"Oblivious Transfer",len(messages),passCount,basic.sender())
-	cipher : exponents.Cipher = exponents.asymmetric(security).keygen()
+	yield basic.Agree("Oblivious Transfer",len(messages),passCount,basic.sender())
+	yield basic.Checkpoint()
+	# May have to generate the key right away.
+	(cipher, blinds) = yield basic.Compute(precompute.draw, obliviousSendSetup, security, len(messages), threaded = True)
 	modulus = cipher.getModulus()
-	blinds = [numbers.randomBelow(modulus) for _ in messages]
 
-	peer.send(cipher.toJson(includePrivate = False))
-	peer.send(blinds)
+	yield basic.Send(cipher.toJson(includePrivate = False))
+	yield basic.Send(blinds)
 
-	vs = peer.recv([range(modulus)] * passCount)
+	vs = yield basic.Recv(schema.IntVector(modulus, passCount))
 
-	peer.send([[(m + cipher.decrypt((v - x) % modulus)) % modulus for (m,x) in zip(messages,blinds)] for v in vs])
+	rows = []
+	for v in vs:
+		keys = yield basic.Compute(cipher.decryptMany, [(v - x) % modulus for x in blinds])
+		rows.append([(m + d) % modulus for (m,d) in zip(messages,keys)])
+	yield basic.Send(rows)
 
+@basic.stepped
 def obliviousReceive(peer : Peer, messageCount : int, wantedMessages : Set[int] | int, security : int = 0) -> int:
 	"""
 	Receive a subset of a total number of messages from the peer.
@@ -44,19 +64,21 @@ def obliviousReceive(peer : Peer, messageCount : int, wantedMessages : Set[int]
 	else:
 		wantedMessages = list(wantedMessages)
 	passCount = len(wantedMessages)
-	basic.agreeOn(peer, "Oblivious Transfer", messageCount, passCount, basic.receiver())
+	yield basic.Agree("Oblivious Transfer", messageCount, passCount, basic.receiver())
+	yield basic.Checkpoint()
 
-	cipher = exponents.Cipher(**peer.recv(dict))
+	cipher = exponents.Cipher(**(yield basic.Recv(dict)))
 	modulus = cipher.getModulus()
-	blinds = peer.recv([range(modulus)] * messageCount)
+	blinds = yield basic.Recv(schema.IntVector(modulus, messageCount))
 
 	assert cipher.getSecurity() >= security
 
 	keys = [numbers.randomBelow(modulus) for _ in wantedMessages]
+	encrypted = yield basic.Compute(cipher.encryptMany, keys)
 
-	peer.send([(cipher.encrypt(keys[i]) + blinds[w]) % modulus for (i,w) in enumerate(wantedMessages)])
+	yield basic.Send([(c + blinds[w]) % modulus for (c,w) in zip(encrypted,wantedMessages)])
 
-	dataMatrix = peer.recv([[range(modulus)] * messageCount] * passCount)
+	dataMatrix = yield basic.Recv(schema.Matrix(modulus, passCount, messageCount))
 
 	data = [(dataMatrix[i][w] - keys[i]) for (i,w) in enumerate(wantedMessages)]
 	
@@ -72,6 +94,7 @@ def toBytes(elem):
 		return elem.encode()
 	return str(elem).encode()
 
+@basic.stepped
 def psi(peer : Peer,
 		myElements : Set[bytes],
 		peerElementCount : int,
@@ -83,32 +106,35 @@ def psi(peer : Peer,
 
 	Either or both participants will learn the elements within the intersection, and nothing else.
 	"""
-	basic.agreeOn(peer,
+	yield basic.Agree(
 		"Private set intersection",
 		basic.AsymmetricAgreement(len(myElements),peerElementCount),
 		basic.AsymmetricAgreement(needResult,peerNeedsResult))
+	# Who needs the result decides what is sent.
+	yield basic.Checkpoint()
 	
 	if not (needResult or peerNeedsResult):
 		return None # Duh don't do anything then.
 	
-	modulus = random.sharedRandomProbablePrime(peer, security)
+	modulus = yield from random.sharedRandomProbablePrime.steps(peer, security)
 
 	cipher = exponents.commutative(modulus).keygen()
 
-	myHashes = list(cipher.encrypt(int.from_bytes(sha256(toBytes(elem)).digest(),"big")) for elem in myElements)
+	myElements = list(myElements)
+	myHashes = yield basic.Compute(cipher.encryptMany, [int.from_bytes(sha256(toBytes(elem)).digest(),"big") for elem in myElements])
 
 	myPerm = list(utils.shufflingSwaps(len(myHashes)))
 
-	peer.send(utils.performSwaps(list(myHashes),myPerm))
+	yield basic.Send(utils.performSwaps(list(myHashes),myPerm))
 	
-	peerHashes = [cipher.encrypt(k) for k in peer.recv([range(modulus)] * peerElementCount)]
+	peerHashes = yield basic.Compute(cipher.encryptMany, (yield basic.Recv(schema.IntVector(modulus, peerElementCount))))
 
 	if peerNeedsResult:
-		peer.send(peerHashes)
+		yield basic.Send(peerHashes)
 	
 	if needResult:
 		peerHashes = set(peerHashes)
-		myHashes = utils.performSwaps(peer.recv([range(modulus)] * len(myElements)),reversed(myPerm))
+		myHashes = utils.performSwaps((yield basic.Recv(schema.IntVector(modulus, len(myElements)))),reversed(myPerm))
 
 		return set(elem for (elem,h) in zip(myElements,myHashes) if h in peerHashes)
 	else:
@@ -0,0 +1,108 @@
+
+import asyncio
+import socket
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+import mglib.network.aio as aio
+import mglib.network.codec as codec
+import mglib.protocol.aio as paio
+import mglib.protocol.random as random
+import mglib.protocol.tpp as tpp
+from mglib.network.peer import SocketPeer
+
+security = 64
+
+def blockingSide(peer):
+	return (random.coinFlip(peer, security),
+		random.sharedRandom(peer, [1000, 7], security),
+		random.sharedRandom(peer, [5, 9], security, True),
+		random.sharedRandomProbablePrime(peer, security),
+		tpp.obliviousReceive(peer, 4, {1, 3}, 128),
+		tpp.obliviousSend(peer, [20, 21, 22], 2, 128),
+		tpp.psi(peer, {b"a", b"b", b"c"}, 3, True, True, security))
+
+async def asyncSide(peer, executor):
+	return (await paio.coinFlip(peer, security, executor = executor),
+		await paio.sharedRandom(peer, [1000, 7], security, executor = executor),
+		await paio.sharedRandom(peer, [5, 9], security, True, executor = executor),
+		await paio.sharedRandomProbablePrime(peer, security, executor = executor),
+		await paio.obliviousSend(peer, [10, 11, 12, 13], 2, 128, executor = executor),
+		await paio.obliviousReceive(peer, 3, [0, 2], 128, executor = executor),
+		await paio.psi(peer, {b"b", b"c", b"d"}, 3, True, True, security, executor = executor))
+
+async def asyncPeers():
+	(a, b) = socket.socketpair()
+	peers = []
+	for s in (a, b):
+		(reader, writer) = await asyncio.open_connection(sock = s)
+		peers.append(aio.AsyncPeer(reader, writer))
+	return peers
+
+class AsyncProtocolTest(unittest.TestCase):
+
+	def interoperate(self, executor):
+		async def main():
+			(a, b) = socket.socketpair()
+			results = []
+			thread = threading.Thread(target = lambda: results.append(blockingSide(SocketPeer(b))))
+			thread.start()
+			(reader, writer) = await asyncio.open_connection(sock = a)
+			mine = await asyncSide(aio.AsyncPeer(reader, writer), executor)
+			await asyncio.get_running_loop().run_in_executor(None, thread.join)
+			return (mine, results[0])
+		(mine, theirs) = asyncio.run(main())
+		self.assertNotEqual(mine[0], theirs[0])
+		self.assertEqual(mine[1:4], theirs[1:4])
+		self.assertEqual(theirs[4], [11, 13])
+		self.assertEqual(mine[5], [20, 22])
+		self.assertEqual(mine[6], {b"b", b"c"})
+		self.assertEqual(theirs[6], {b"b", b"c"})
+
+	def testWithBlockingPeer(self):
+		self.interoperate(None)
+
+	def testWithProcessPool(self):
+		with ProcessPoolExecutor(max_workers = 2) as executor:
+			self.interoperate(executor)
+
+	def testManySessionsInOneLoop(self):
+		async def session():
+			(a, b) = await asyncPeers()
+			return await asyncio.gather(
+				paio.psi(a, {b"x", b"y"}, 2, True, True, security),
+				paio.psi(b, {b"y", b"z"}, 2, True, True, security))
+		async def main():
+			return await asyncio.gather(*(session() for _ in range(24)))
+		threads = threading.active_count()
+		for (x, y) in asyncio.run(main()):
+			self.assertEqual(x, {b"y"})
+			self.assertEqual(y, {b"y"})
+		self.assertLessEqual(threading.active_count(), threads + 1)
+
+	def testLargeMessageDecodedOffTheLoop(self):
+		json = codec.codecs[codec.JsonCodec.name]
+		threads = []
+		def decode(raw):
+			threads.append(threading.get_ident())
+			return codec.JsonCodec.decode(json, raw)
+		async def main():
+			(a, b) = await asyncPeers()
+			async def send():
+				await a.send(list(range(100)))
+				await a.send(list(range(100000)))
+			async def recv():
+				return (await b.recv(list), await b.recv(list))
+			(_, received) = await asyncio.gather(send(), recv())
+			return (threading.get_ident(),) + received
+		json.decode = decode
+		try:
+			(loop, small, large) = asyncio.run(main())
+		finally:
+			del json.decode
+		self.assertEqual((small, large), (list(range(100)), list(range(100000))))
+		self.assertEqual(threads[0], loop)
+		self.assertNotEqual(threads[1], loop)
+
+if __name__ == "__main__":
+	unittest.main()
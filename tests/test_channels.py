@@ -0,0 +1,77 @@
+import socket
+import threading
+import time
+import unittest
+import mglib.network.channels as channels
+from mglib.network.peer import SocketPeer
+
+def pairOfPeers():
+	(a, b) = socket.socketpair()
+	return (SocketPeer(a), SocketPeer(b))
+
+class Call():
+	"""
+	Runs a function in a thread. raised gives what it raised, and fails if it hangs.
+	"""
+	def __init__(self, function, *args) -> None:
+		self.error = None
+		self.thread = threading.Thread(target = self.run, args = (function, args), daemon = True)
+		self.thread.start()
+
+	def run(self, function, args):
+		try:
+			function(*args)
+		except BaseException as e:
+			self.error = e
+
+	def raised(self):
+		self.thread.join(10)
+		assert not self.thread.is_alive(), "Hangs instead of raising"
+		return self.error
+
+class MultiplexerTest(unittest.TestCase):
+
+	def connect(self, window = 16 << 20):
+		(a, b) = pairOfPeers()
+		self.addCleanup(a.close)
+		self.addCleanup(b.close)
+		self.peer = b
+		return channels.Multiplexer(a, window)
+
+	def feed(self, message):
+		# The peer speaks the envelope format directly.
+		self.peer.send(message)
+		self.peer.flush()
+
+	def testRoundTrip(self):
+		mux = self.connect()
+		self.feed([channels.DATA, "x", [2, 7]])
+		self.assertEqual(mux.channel("x").recv(int), 7)
+		self.feed([channels.END, None, None])
+		self.assertIsInstance(Call(mux.channel("x").recv).raised(), ConnectionError)
+
+	def testMalformedFrame(self):
+		for frame in ([channels.DATA, "x", 5], [channels.DATA, "x"], [7, "x", None], "no envelope"):
+			mux = self.connect()
+			waiting = Call(mux.channel("x").recv)
+			self.feed(frame)
+			error = waiting.raised()
+			self.assertIsNotNone(error, frame)
+			self.assertNotIsInstance(error, ConnectionError, frame)
+			# Later calls, also on channels opened later, fail the same way.
+			self.assertIs(Call(mux.channel("x").recv).raised(), error)
+			self.assertIs(Call(mux.channel("y").recv).raised(), error)
+
+	def testBlockedSenderWakes(self):
+		mux = self.connect(window = 10)
+		sender = mux.channel("x")
+		sender.send(1 << 60)
+		# No credit comes back, so the second one waits until the reader fails.
+		blocked = Call(sender.send, 1 << 60)
+		time.sleep(0.2)
+		self.assertTrue(blocked.thread.is_alive())
+		self.feed([channels.CREDIT, "x", "many"])
+		self.assertIsInstance(blocked.raised(), TypeError)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,63 @@
+
+import socket
+import threading
+import unittest
+import mglib.network.codec as codec
+from mglib.network.peer import SocketPeer
+
+messages = [
+	None, True, False, 0, 1, -1, 255, 256, 1 << 2048, -(1 << 300), "", "text", "ünicode",
+	[], [0], [1, 2, 3], [1 << 200, 0, 5], [True, 1], [1, -1], [None, "a", [1, [2]]],
+	{}, {"a" : 1, "b" : [1, 2]}, {1 : "one", 2 : [3]}, {True : 1, None : 2},
+	{"p" : "cHJvb2Y=", "n" : 5, "nested" : {"x" : [{"y" : None}]}},
+]
+
+def pairOfPeers(codecsA, codecsB):
+	(a, b) = socket.socketpair()
+	peers = [None, None]
+	connectB = threading.Thread(target = lambda: peers.__setitem__(1, SocketPeer(b, codecsB)))
+	connectB.start()
+	peers[0] = SocketPeer(a, codecsA)
+	connectB.join()
+	return peers
+
+class CodecTest(unittest.TestCase):
+
+	def testCodecsAgree(self):
+		for m in messages:
+			results = [c.decode(c.encode(m)) for c in codec.codecs.values()]
+			for r in results:
+				self.assertEqual(r, results[0], m)
+
+	def testIntKeysBecomeStrings(self):
+		for c in codec.codecs.values():
+			self.assertEqual(c.decode(c.encode({1 : 2, None : 3})), {"1" : 2, "null" : 3})
+
+	def testNegotiation(self):
+		cases = [
+			((tuple(codec.codecs), tuple(codec.codecs)), codec.BinaryCodec.name),
+			((("json",), tuple(codec.codecs)), codec.JsonCodec.name),
+			((None, None), codec.JsonCodec.name),
+		]
+		for ((codecsA, codecsB), expected) in cases:
+			(a, b) = pairOfPeers(codecsA, codecsB)
+			self.assertEqual(a.getCodec().name, expected)
+			self.assertEqual(b.getCodec().name, expected)
+			for m in messages:
+				a.send(m)
+				self.assertEqual(b.recv(), codec.codecs[codec.JsonCodec.name].decode(codec.codecs[codec.JsonCodec.name].encode(m)))
+			a.close()
+			b.close()
+
+	def testNoHelloByDefault(self):
+		# A peer without codec support reads the first message as a protocol message.
+		(a, b) = socket.socketpair()
+		peer = SocketPeer(a)
+		peer.send(["first"])
+		count = int.from_bytes(b.recv(4), "big")
+		self.assertEqual(b.recv(count), b'["first"]')
+		peer.close()
+		b.close()
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,85 @@
+import base64
+import random
+import unittest
+import mglib.engine.commitment as commitment
+
+security = 64
+
+def flipped(data : str, position : int) -> str:
+	raw = bytearray(base64.b64decode(data))
+	raw[position] ^= 1
+	return base64.b64encode(bytes(raw)).decode()
+
+class MerkleTest(unittest.TestCase):
+
+	def setUp(self):
+		generator = random.Random(23)
+		# An odd count, so some nodes are unpaired on their level.
+		self.values = [generator.randrange(1 << 64) for _ in range(13)]
+		self.tree = commitment.MerkleTree(self.values, security)
+		self.commitment = commitment.MerkleCommitment(**self.tree.phaseOne())
+
+	def testValidOpening(self):
+		for indices in ([0], [12], [3, 4], [1, 6, 11, 12], range(13)):
+			opening = self.tree.open(indices)
+			self.assertEqual(self.commitment.verifyOpening(**opening), {i : self.values[i] for i in indices})
+		single = commitment.MerkleTree([5], security)
+		self.assertEqual(commitment.MerkleCommitment(**single.phaseOne()).verifyOpening(**single.open([0])), {0 : 5})
+
+	def testChangedValue(self):
+		opening = self.tree.open([2, 9])
+		opening["v"] = [opening["v"][0], opening["v"][1] + 1]
+		with self.assertRaises(AssertionError):
+			self.commitment.verifyOpening(**opening)
+
+	def testChangedIndex(self):
+		opening = self.tree.open([2, 9])
+		opening["i"] = [2, 8]
+		with self.assertRaises(AssertionError):
+			self.commitment.verifyOpening(**opening)
+		# Another entry with the same value and salt is no better.
+		opening = self.tree.open([9])
+		opening["i"] = [10]
+		with self.assertRaises(AssertionError):
+			self.commitment.verifyOpening(**opening)
+
+	def testChangedPath(self):
+		opening = self.tree.open([2, 9])
+		for position in range(0, len(base64.b64decode(opening["h"])), 32):
+			changed = dict(opening, h = flipped(opening["h"], position))
+			with self.assertRaises(AssertionError):
+				self.commitment.verifyOpening(**changed)
+		changed = dict(opening, s = flipped(opening["s"], 0))
+		with self.assertRaises(AssertionError):
+			self.commitment.verifyOpening(**changed)
+		# A hash dropped from the path, or one too many.
+		path = base64.b64decode(opening["h"])
+		for h in (path[32:], path + path[:32]):
+			with self.assertRaises(AssertionError):
+				self.commitment.verifyOpening(**dict(opening, h = base64.b64encode(h).decode()))
+
+class CommitterTest(unittest.TestCase):
+
+	def setUp(self):
+		generator = random.Random(24)
+		self.values = [generator.randrange(1 << 200) for _ in range(commitment.chunkSize + 10)]
+		committer = commitment.Committer(security)
+		for k in range(0, len(self.values), 1000):
+			committer.update(self.values[k:k + 1000])
+		sent = committer.finalize()
+		# The peer gets the proof first and the salt with the reveal.
+		self.received = commitment.Commitment(**sent.phaseOne())
+		self.received.update(**sent.phaseTwo())
+
+	def testRoundTrip(self):
+		verifier = self.received.verifier()
+		for k in range(0, len(self.values), 3000):
+			verifier.update(self.values[k:k + 3000])
+		verifier.finalize()
+		self.received.verifyInts(self.values)
+		commitment.commitInts(self.values, security).verifyInts(self.values)
+
+	def testWrongReveal(self):
+		for wrong in (self.values[:-1], self.values + [0], self.values[:5] + [self.values[5] + 1] + self.values[6:]):
+			with self.assertRaises(AssertionError):
+				self.received.verifyInts(wrong)
@@ -0,0 +1,38 @@
+import unittest
+import mglib.engine.exponents as exponents
+import mglib.engine.numbers as numbers
+
+class CrtTest(unittest.TestCase):
+
+	def checkAgainstPlain(self, cipher, values):
+		key = cipher.toJson()
+		(m, e, d) = (key["m"], key["e"], key["d"])
+		signatures = [pow(v, d, m) for v in values]
+		self.assertEqual([cipher.decrypt(v) for v in values], signatures)
+		self.assertEqual(cipher.decryptMany(values), signatures)
+		self.assertEqual([cipher.encrypt(s) for s in signatures], values)
+		self.assertEqual(cipher.encryptMany(values), [pow(v, e, m) for v in values])
+
+	def testRandomKeys(self):
+		for security in (64, 256, 512, 1024):
+			for _ in range(2):
+				cipher = exponents.asymmetric(security).keygen()
+				values = [numbers.randomBelow(cipher.getModulus()) for _ in range(20)] + [0, 1, cipher.getModulus() - 1]
+				self.checkAgainstPlain(cipher, values)
+
+				# Through JSON, with the factors and so CRT, and without them.
+				self.checkAgainstPlain(exponents.Cipher(**cipher.toJson()), values)
+				key = cipher.toJson()
+				del key["f"]
+				self.checkAgainstPlain(exponents.Cipher(**key), values)
+
+				# A public copy verifies what the private key signed.
+				self.assertEqual(set(cipher.toJson(includePrivate = False)), {"m", "e"})
+				public = exponents.Cipher(**cipher.toJson(includePrivate = False))
+				self.assertEqual([public.encrypt(cipher.decrypt(v)) for v in values], values)
+
+	def testKeygenThroughJson(self):
+		keygen = exponents.asymmetric(256)
+		cipher = exponents.Keygen(**keygen.toJson()).keygen()
+		values = [numbers.randomBelow(cipher.getModulus()) for _ in range(20)]
+		self.checkAgainstPlain(cipher, values)
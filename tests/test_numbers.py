@@ -0,0 +1,92 @@
+import unittest
+from mglib.network.loopback import runPair
+import mglib.engine.numbers as numbers
+import mglib.engine.utils as utils
+import mglib.protocol.random as random
+
+# Known answers of expandSeed, as (seed, limits, result).
+# Peers on other versions must draw the same, so these must never change.
+seedVectors = (
+	(bytes(32), [6] * 8, [1, 3, 0, 2, 0, 3, 2, 1]),
+	(bytes(range(32)), [2, 3, 1, 1000, 1 << 64, 257, 65536, 7], [0, 1, 0, 669, 16569396537055491915, 190, 58517, 1]),
+	(b"\xff" * 32, list(range(2, 12)), [1, 2, 3, 3, 2, 4, 7, 0, 8, 7]),
+)
+
+# Known answers of the shuffle of range(10) that sharedShuffle makes from a seed, as (seed, result).
+shuffleVectors = (
+	(bytes(32), [6, 2, 5, 9, 1, 8, 4, 3, 0, 7]),
+	(bytes(range(32)), [1, 2, 6, 0, 8, 9, 5, 4, 3, 7]),
+)
+
+class ExpandSeedTest(unittest.TestCase):
+
+	def testKnownAnswers(self):
+		for (seed, limits, result) in seedVectors:
+			self.assertEqual(list(numbers.expandSeed(seed, limits)), result)
+
+	def testFisherYatesKnownAnswers(self):
+		for (seed, result) in shuffleVectors:
+			draws = numbers.expandSeed(seed, range(2, 11))
+			self.assertEqual(utils.performSwaps(list(range(10)), zip(range(1, 10), draws)), result)
+
+	def testAcrossBlocks(self):
+		# Wide limits use up more than one block.
+		limits = [1 << 4096] * (2 * numbers.seedBlockSize // 512)
+		values = list(numbers.expandSeed(bytes(32), limits))
+		self.assertEqual(values[:4], list(numbers.expandSeed(bytes(32), limits[:4])))
+		self.assertEqual(len(set(values)), len(values))
+
+	def testSharedShuffle(self):
+		(a, b, _, _) = runPair(lambda p: random.sharedShuffle(p, list(range(1000)), 64),
+			lambda p: random.sharedShuffle(p, list(range(1000)), 64))
+		self.assertEqual(a, b)
+		self.assertEqual(sorted(a), list(range(1000)))
+
+class PrimalityTest(unittest.TestCase):
+
+	def testMillerRabinRounds(self):
+		# The table in the docstring.
+		self.assertEqual([numbers.millerRabinRounds(bits) for bits in (256, 512, 1024, 2048, 4096)], [17, 8, 4, 3, 3])
+		self.assertEqual(numbers.millerRabinRounds(16), 50)
+
+	def testDeterministicWitnesses(self):
+		# The least strong pseudoprime to all the bases is just beyond their bound.
+		pseudoprime = 318665857834031151167461
+		self.assertIsNone(numbers.millerRabinWitnesses(pseudoprime, numbers.deterministicWitnesses))
+		self.assertIsNotNone(numbers.millerRabinWitnesses(pseudoprime, (41,)))
+
+	def testSieveWindow(self):
+		def trialDivision(v):
+			return all(v % d != 0 for d in range(3, 1 << 14, 2))
+		for start in (numbers.smallPrimes[-1] + 2, (1 << 100) + 1, (1 << 521) - 1):
+			flags = numbers.sieveWindow(start, 3000)
+			self.assertEqual(list(flags), [int(trialDivision(start + 2 * i)) for i in range(3000)])
+			self.assertEqual(numbers.sievedCandidates(start, 3000), [start + 2 * i for i in range(3000) if flags[i]])
+		# Windows reaching below the sieve primes are trial divided.
+		self.assertEqual(numbers.sievedCandidates(3, 20), [v for v in range(3, 43, 2) if numbers.smallFactor(v) is None])
+
+class BackendTest(unittest.TestCase):
+
+	def testSelfTest(self):
+		# With a single backend installed, the known answers below are what catches a wrong one.
+		saved = numbers.backend
+		try:
+			for name in numbers.backends:
+				numbers.setBackend(name)
+				self.assertTrue(numbers.selfTest(rounds = 3, bits = (64, 256)), name)
+		finally:
+			numbers.backend = saved
+
+	def testKnownAnswers(self):
+		m = (1 << 127) - 1
+		for (name, backend) in numbers.backends.items():
+			self.assertEqual(backend.powmod(3, 1 << 100, m), pow(3, 1 << 100, m), name)
+			self.assertEqual(backend.invert(12345, m), pow(12345, -1, m), name)
+			self.assertIsNone(backend.invert(6, 9), name)
+			self.assertEqual(backend.gcd(2 ** 40 * 3 ** 5, 2 ** 10 * 3 ** 20 * 7), 2 ** 10 * 3 ** 5, name)
+			self.assertTrue(backend.isProbablePrime(m, 40), name)
+			for carmichael in (561, 1105, 1729, 41041, 825265):
+				self.assertFalse(backend.isProbablePrime(carmichael, 40), name)
+			self.assertFalse(backend.isProbablePrime(m * ((1 << 61) - 1), 40), name)
+			self.assertEqual(backend.nextPrime(m - 1, 40), m, name)
+			self.assertEqual(backend.nextPrime(1 << 64, 40), (1 << 64) + 13, name)
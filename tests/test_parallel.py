@@ -0,0 +1,61 @@
+import time
+import unittest
+import mglib.engine.exponents as exponents
+import mglib.engine.numbers as numbers
+import mglib.engine.parallel as parallel
+
+class ParallelTest(unittest.TestCase):
+
+	def setUp(self):
+		self.workers = parallel.workers
+		parallel.setWorkers(2)
+
+	def tearDown(self):
+		parallel.setWorkers(self.workers)
+
+	def testArgsReachTheWorkers(self):
+		values = list(range(parallel.minimumBatch * 3))
+		for modulus in (1000003, 1000033):
+			self.assertEqual(parallel.mapInts(pow, values, 65537, modulus),
+				[pow(v, 65537, modulus) for v in values])
+
+	def testSwitchingKeysKeepsThePool(self):
+		# As in secretChoice: one key, another, then the first again.
+		(first, second) = (exponents.asymmetric(256).keygen(), exponents.asymmetric(256).keygen())
+		values = [numbers.randomBelow(min(first.getModulus(), second.getModulus())) for _ in range(parallel.minimumBatch * 2)]
+		first.decryptMany(values)
+		pool = parallel.getExecutor()
+		for cipher in (second, first, second):
+			self.assertEqual(cipher.encryptMany(cipher.decryptMany(values)), values)
+			self.assertIs(parallel.getExecutor(), pool)
+
+	def testCipherBatches(self):
+		cipher = exponents.asymmetric(256).keygen()
+		values = [numbers.randomBelow(cipher.getModulus()) for _ in range(parallel.minimumBatch * 2)]
+		encrypted = cipher.encryptMany(values)
+		self.assertEqual(encrypted, [cipher.encrypt(m) for m in values])
+		self.assertEqual(cipher.decryptMany(encrypted), values)
+
+	def testRaceStopsTheLosers(self):
+		# The first window takes many seconds at 4096 bits, the second finds a small prime at once.
+		slow = (numbers.randomBetween(1 << 4095, 1 << 4096) | 1, 1 << 20, 40)
+		fast = (1000001, 64, 20)
+		found = parallel.race(numbers.primeInWindow, [slow, fast], 2)
+		self.assertTrue(numbers.isProbablePrime(next(found), 20))
+		started = time.monotonic()
+		found.close()
+		self.assertLess(time.monotonic() - started, 5)
+
+	def testRacesShareThePool(self):
+		pool = parallel.getExecutor()
+		for _ in range(3):
+			found = parallel.race(numbers.primeInWindow, [(1000001, 64, 20)] * 2, 2)
+			self.assertTrue(numbers.isProbablePrime(next(found), 20))
+			found.close()
+			self.assertIs(parallel.getExecutor(), pool)
+		# A race asking for more workers than the pool has grows it, once.
+		found = parallel.race(numbers.primeInWindow, [(1000001, 64, 20)] * 3, 3)
+		next(found)
+		found.close()
+		self.assertIsNot(parallel.getExecutor(), pool)
+		self.assertIs(parallel.getExecutor(3), parallel.getExecutor())
@@ -0,0 +1,50 @@
+
+import os
+import socket
+import threading
+import unittest
+import mglib.network.peer as peer
+from mglib.network.peer import SocketPeer
+
+def pairOfPeers():
+	(a, b) = socket.socketpair()
+	return (SocketPeer(a), SocketPeer(b))
+
+class SocketPeerTest(unittest.TestCase):
+
+	def testLargeMessage(self):
+		(a, b) = pairOfPeers()
+		raw = os.urandom(64 << 20)
+		sender = threading.Thread(target = a.sendBytes, args = (raw,))
+		sender.start()
+		received = b.recvBytes()
+		sender.join()
+		self.assertEqual(len(received), len(raw))
+		self.assertTrue(received == raw)
+		a.close()
+		b.close()
+
+	def testCorkedMessagesKeepOrder(self):
+		# More messages than a single gather write takes.
+		(a, b) = pairOfPeers()
+		count = peer.maxGather * 3
+		def send():
+			with a.corked():
+				for k in range(count):
+					a.send([k, "x" * (k % 7)])
+		sender = threading.Thread(target = send)
+		sender.start()
+		received = [b.recv(list) for _ in range(count)]
+		sender.join()
+		self.assertEqual(received, [[k, "x" * (k % 7)] for k in range(count)])
+		a.close()
+		b.close()
+
+	def testFrameLength(self):
+		self.assertEqual(peer.frameLength(0), bytes(4))
+		self.assertEqual(peer.frameLength(peer.maxMessageSize), b"\xff" * 4)
+		with self.assertRaises(AssertionError):
+			peer.frameLength(1 << 32)
+
+if __name__ == "__main__":
+	unittest.main()
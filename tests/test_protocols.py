@@ -0,0 +1,88 @@
+import unittest
+from mglib.network.loopback import runPair
+import mglib.network.basic as basic
+from mglib.engine.primes import PrimePool
+import mglib.protocol.choices as choices
+import mglib.protocol.random as random
+import mglib.protocol.tpp as tpp
+
+disagreement = "The peer disagrees"
+
+class AgreementTest(unittest.TestCase):
+
+	def testOpeningMismatchFailsAtAgreement(self):
+		with self.assertRaisesRegex(AssertionError, disagreement):
+			runPair(lambda p: choices.secretChoice(p, 8, 4, {1}, 1, 64, True),
+				lambda p: choices.secretChoice(p, 8, 4, {5}, 1, 64, False))
+
+	def testTransferCountMismatchFailsAtAgreement(self):
+		with self.assertRaisesRegex(AssertionError, disagreement):
+			runPair(lambda p: tpp.obliviousSend(p, [1, 2, 3], 1, 64),
+				lambda p: tpp.obliviousReceive(p, 4, {0}, 64))
+
+	def testSeededMismatchFailsAtAgreement(self):
+		with self.assertRaisesRegex(AssertionError, disagreement):
+			runPair(lambda p: random.sharedRandom(p, [10, 20], 64, seeded = True),
+				lambda p: random.sharedRandom(p, [10, 20], 64, seeded = False))
+
+class ConcurrentlyTest(unittest.TestCase):
+
+	def testFailureReleasesThePeer(self):
+		# One side fails before sending, the other waits for a message that never comes.
+		def fail(channel):
+			raise ValueError("failed")
+		def wait(channel):
+			return channel.recv(int)
+		def sideA(p):
+			with self.assertRaises(ValueError):
+				basic.concurrently(p, fail, lambda c: 1)
+			p.send("after")
+		def sideB(p):
+			with self.assertRaises(ConnectionError):
+				basic.concurrently(p, wait, lambda c: 1)
+			return p.recv(str)
+		(_, b, _, _) = runPair(sideA, sideB)
+		self.assertEqual(b, "after")
+
+class PrimePoolTest(unittest.TestCase):
+
+	def testSecretChoiceUsesItsPrimes(self):
+		# One spare, so drawing fewer or more primes than declared shows.
+		def side(p, wanted):
+			p.primePool = PrimePool()
+			random.fillPrimePool(p, 64, choices.primesPerSecretChoice + 1)
+			choices.secretChoice(p, 8, 4, wanted, 1, 64)
+			return p.primePool.count(64)
+		(a, b, _, _) = runPair(lambda p: side(p, {1}), lambda p: side(p, {5}))
+		self.assertEqual((a, b), (1, 1))
+
+class SecretChoiceTest(unittest.TestCase):
+
+	def testBothModesAgree(self):
+		for opening in (False, True):
+			(a, b, _, _) = runPair(lambda p: choices.secretChoice(p, 64, 8, {1, 2}, 2, 64, opening),
+				lambda p: choices.secretChoice(p, 64, 8, {5, 9}, 2, 64, opening))
+			self.assertEqual(a, b)
+			self.assertEqual(len(a), 8)
+			self.assertTrue({1, 2, 5, 9} <= a)
+
+	def testLocationsNameOneItemEach(self):
+		modulus = (1 << 127) - 1
+		locations = list(choices.shardLocations(bytes(32), 1000, modulus))
+		self.assertEqual(len(set(locations)), 1000)
+		self.assertTrue(all(0 < x < modulus for x in locations))
+		# Both parties derive the same locations from the seed.
+		self.assertEqual(locations, list(choices.shardLocations(bytes(32), 1000, modulus)))
+
+	def testLocationsAreDistinctForSmallModuli(self):
+		# 250 draws below 257 repeat many times, the repeats are skipped.
+		locations = list(choices.shardLocations(bytes(32), 250, 257))
+		self.assertEqual(len(set(locations)), 250)
+		self.assertTrue(all(0 < x < 257 for x in locations))
+
+	def testOpeningWithSmallModulus(self):
+		# At security 20 the Shamir modulus has 9 bits, so drawn locations would repeat.
+		(a, b, _, _) = runPair(lambda p: choices.secretChoice(p, 100, 8, {1, 2}, 2, 20, True),
+			lambda p: choices.secretChoice(p, 100, 8, {5, 9}, 2, 20, True))
+		self.assertEqual(a, b)
+		self.assertTrue({1, 2, 5, 9} <= a)
@@ -0,0 +1,60 @@
+
+import unittest
+import mglib.network.codec as codec
+import mglib.network.schema as schema
+from mglib.network.peer import typeCheck
+
+class SchemaTest(unittest.TestCase):
+
+	def testBoolsAreInts(self):
+		# As in the original typeCheck, a range pattern takes True and False.
+		self.assertTrue(typeCheck(True, range(2)))
+		self.assertTrue(typeCheck([True, 0], [range(2)] * 2))
+		self.assertTrue(schema.IntVector(2)([True, False]))
+		self.assertFalse(schema.IntVector(2)([2]))
+
+	def testCompiledOnce(self):
+		pattern = [range(10)] * 1000
+		self.assertIs(schema.compile(pattern), schema.compile(pattern))
+		self.assertIs(schema.compile((int, None)), schema.compile((int, None)))
+		self.assertIsNot(schema.compile(1), schema.compile(True))
+		self.assertFalse(schema.compile(1)(True))
+
+	def testEqualPatternsOfOtherTypes(self):
+		# Equal and equally hashed in Python, but different patterns.
+		self.assertIsNot(schema.compile((True,)), schema.compile((1,)))
+		self.assertTrue(schema.compile((1,))(1))
+		self.assertFalse(schema.compile((1,))(True))
+		self.assertTrue(schema.compile((True,))(True))
+		self.assertTrue(schema.compile((0, None))(0))
+		self.assertFalse(schema.compile((False, None))(0))
+		self.assertTrue(schema.compile((False, None))(False))
+
+	def testMixedListIsNotRepeated(self):
+		self.assertTrue(schema.compile([1, True])([1, True]))
+		self.assertFalse(schema.compile([1, True])([1, 1]))
+		self.assertFalse(schema.compile([True, 1])([True, True]))
+		self.assertTrue(schema.compile([[1], [True]])([[1], [True]]))
+		self.assertFalse(schema.compile([[1], [True]])([[1], [1]]))
+
+	def testCheckedDecoding(self):
+		cases = [
+			([1, 2, 300], schema.IntVector(1 << 16, 3), True),
+			([1, 2, 300], schema.IntVector(1 << 16, 2), False),
+			([1, 2, 300], schema.IntVector(300, 3), False),
+			([1, 2, 300], schema.IntVector(range(2, 1000)), False),
+			([[1, 2], [3, 4]], schema.Matrix(5, 2, 2), True),
+			({"a" : 1}, schema.compile({"a" : int}), True),
+			({"a" : "x"}, schema.compile({"a" : int}), False),
+		]
+		for c in codec.codecs.values():
+			for (value, check, valid) in cases:
+				raw = c.encode(value)
+				if valid:
+					self.assertEqual(c.decodeChecked(raw, check), value)
+				else:
+					with self.assertRaises(AssertionError):
+						c.decodeChecked(raw, check)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,110 @@
+import random
+import unittest
+import mglib.engine.shamir as shamir
+
+# A prime modulus, 2 ** 61 - 1.
+modulus = (1 << 61) - 1
+
+def horner(coefficents, x, m):
+	result = 0
+	for c in reversed(coefficents):
+		result = (result * x + c) % m
+	return result
+
+class RecoverTest(unittest.TestCase):
+
+	def setUp(self):
+		self.random = random.Random(17)
+		self.context = shamir.Shamir(modulus, 5)
+		self.secret = self.random.randrange(modulus)
+		self.shards = list(self.context.shatter(self.secret, 12))
+
+	def testThresholdShards(self):
+		self.assertEqual(self.context.recover(self.shards[:5]), self.secret)
+		self.assertEqual(self.context.recover(self.shards[7:]), self.secret)
+
+	def testMoreShards(self):
+		self.assertEqual(self.context.recover(self.shards), self.secret)
+		self.assertEqual(self.context.recover(self.shards, exact = True), self.secret)
+		self.random.shuffle(self.shards)
+		self.assertEqual(self.context.recover(self.shards), self.secret)
+
+	def testArbitraryLocations(self):
+		coefficents = [self.random.randrange(modulus) for _ in range(5)]
+		xs = [3, 1000, 7, 1 << 40, modulus - 1, 99, 123456789]
+		points = [(x, horner(coefficents, x, modulus)) for x in xs]
+		self.assertEqual(self.context.recover(points), coefficents[0])
+		interpolator = shamir.Interpolator(modulus, points[:5])
+		self.assertEqual(interpolator.coefficents(), coefficents)
+		self.assertEqual(shamir.lagrange(modulus, points[:5], 5), horner(coefficents, 5, modulus))
+		self.assertEqual(interpolator.evaluateMany([0, 3, 42]), [horner(coefficents, x, modulus) for x in (0, 3, 42)])
+
+	def testTamperedShard(self):
+		(x, y) = self.shards[8]
+		self.shards[8] = (x, (y + 1) % modulus)
+		with self.assertRaises(AssertionError):
+			self.context.recover(self.shards)
+		with self.assertRaises(AssertionError):
+			self.context.recover(self.shards, exact = True)
+		# Among the first threshold shards nothing can be checked, they define the polynom.
+		self.assertEqual(self.context.recover(self.shards[:5]), self.secret)
+
+class PolynomManyTest(unittest.TestCase):
+
+	def check(self, m):
+		generator = random.Random(18)
+		# Coefficents are not reduced, the secret may be anything, even beyond 64 bits.
+		coefficents = [(1 << 70) + 3, m, m + 5] + [generator.randrange(1 << 80) for _ in range(6)]
+		locations = [generator.randrange(1, m) for _ in range(shamir.chunkSize + 100)]
+		self.assertEqual(shamir.polynomMany(m, coefficents, locations), [horner(coefficents, x, m) for x in locations])
+		self.assertEqual(shamir.polynomMany(m, coefficents[:4], locations[:10]), [horner(coefficents[:4], x, m) for x in locations[:10]])
+
+	def testPython(self):
+		saved = shamir.numpy
+		shamir.numpy = None
+		try:
+			for m in (4294967291, modulus):
+				self.check(m)
+		finally:
+			shamir.numpy = saved
+
+	@unittest.skipIf(shamir.numpy is None, "numpy is not installed")
+	def testNumpy(self):
+		# Below 2 ** 32, where numpy is used.
+		self.check(4294967291)
+
+class ContainsTest(unittest.TestCase):
+
+	def setUp(self):
+		generator = random.Random(19)
+		# More coefficents than one block of powers.
+		self.coefficents = [generator.randrange(modulus) for _ in range(shamir.powerBlock * 2 + 3)]
+		xs = [generator.randrange(1, modulus) for _ in range(40)]
+		self.points = [(x, horner(self.coefficents, x, modulus)) for x in xs]
+		(x, y) = self.points[23]
+		self.tampered = list(self.points)
+		self.tampered[23] = (x, (y + 1) % modulus)
+		self.interpolator = shamir.Interpolator(modulus, self.points[:len(self.coefficents)])
+
+	def seededWeights(self, limit, count):
+		# Both sides draw the same weights, so only the tampered shard can change the outcome.
+		generator = random.Random(20)
+		return [generator.randrange(limit) for _ in range(count)]
+
+	def testCombination(self):
+		weights = self.seededWeights(modulus, len(self.points))
+		xs = [x for (x,_) in self.points]
+		combination = shamir.polynomCombination(modulus, self.coefficents, xs, weights)
+		self.assertEqual(combination, sum(w * y for (w,(_,y)) in zip(weights, self.points)) % modulus)
+		self.assertNotEqual(combination, sum(w * y for (w,(_,y)) in zip(weights, self.tampered)) % modulus)
+
+	def testContains(self):
+		saved = shamir.numbers.randomsBelow
+		shamir.numbers.randomsBelow = self.seededWeights
+		try:
+			self.assertTrue(self.interpolator.contains(self.points))
+			self.assertFalse(self.interpolator.contains(self.tampered))
+		finally:
+			shamir.numbers.randomsBelow = saved
+		self.assertTrue(self.interpolator.contains(self.points, exact = True))
+		self.assertFalse(self.interpolator.contains(self.tampered, exact = True))
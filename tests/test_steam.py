@@ -0,0 +1,63 @@
+import http.server
+import threading
+import unittest
+import interface.steam as steam
+
+class FlakyStore(http.server.BaseHTTPRequestHandler):
+	"""
+	Answers the first failures requests with the code, then every app exists.
+	"""
+	protocol_version = "HTTP/1.1"
+	failures = 0
+	code = 429
+	requests = 0
+
+	def do_GET(self):
+		FlakyStore.requests = FlakyStore.requests + 1
+		if FlakyStore.requests <= FlakyStore.failures:
+			self.send_response(FlakyStore.code)
+			self.send_header("Retry-After", "0")
+		else:
+			self.send_response(200)
+		self.send_header("Content-Length", "0")
+		self.end_headers()
+
+	def log_message(self, format, *args):
+		pass
+
+class StoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlakyStore)
+		self.server.daemon_threads = True
+		threading.Thread(target = self.server.serve_forever, daemon = True).start()
+		self.client = steam.StoreClient("127.0.0.1", self.server.server_address[1], https = False, retries = 3, backoff = 0)
+		FlakyStore.requests = 0
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def testResponses(self):
+		self.assertTrue(steam.appExistsFromResponse(1, 200, None))
+		self.assertTrue(steam.appExistsFromResponse(1, 302, "https://store.steampowered.com/app/2/"))
+		self.assertFalse(steam.appExistsFromResponse(1, 302, "https://store.steampowered.com/"))
+		for code in (429, 500, 503):
+			with self.assertRaises(ConnectionError):
+				steam.appExistsFromResponse(1, code, None)
+
+	def testRetriesRateLimits(self):
+		(FlakyStore.failures, FlakyStore.code) = (2, 429)
+		self.assertTrue(self.client.appExists(10))
+		self.assertEqual(FlakyStore.requests, 3)
+
+	def testGivesUpOnFailingStore(self):
+		(FlakyStore.failures, FlakyStore.code) = (100, 503)
+		with self.assertRaises(ConnectionError):
+			self.client.appExists(10)
+		self.assertEqual(FlakyStore.requests, 4)
+
+	def testRetryDelay(self):
+		self.assertEqual(steam.retryDelay(0, "7", 1), 7)
+		self.assertEqual(steam.retryDelay(3, None, 1), 8)
+		self.assertEqual(steam.retryDelay(10, "Wed, 21 Oct 2015 07:28:00 GMT", 1), 60)
@@ -0,0 +1,102 @@
+import random
+import unittest
+from array import array
+import mglib.engine.utils as utils
+
+def swapsOf(generator, count):
+	# The swaps of a Fisher Yates shuffle, as shufflingSwaps gives them.
+	return [(i, generator.randrange(i + 1)) for i in range(1, count)]
+
+class PermutationTest(unittest.TestCase):
+
+	def setUp(self):
+		self.generator = random.Random(20)
+		self.p = utils.Permutation(self.shuffled(300))
+		self.q = utils.Permutation(self.shuffled(300))
+
+	def shuffled(self, count):
+		values = list(range(count))
+		self.generator.shuffle(values)
+		return values
+
+	def testInverse(self):
+		for p in (self.p, self.q, utils.Permutation(50)):
+			inverse = p.inverse()
+			self.assertEqual([inverse[p[i]] for i in range(len(p))], list(range(len(p))))
+			self.assertEqual([p[inverse[i]] for i in range(len(p))], list(range(len(p))))
+			self.assertEqual(list(inverse.inverse()), list(p))
+			self.assertEqual([p.index(v) for v in range(len(p))], list(inverse))
+
+	def testCompose(self):
+		# (p after q)[i] == p[q[i]]. Its inverse is q's inverse after p's.
+		composed = utils.Permutation([self.p[self.q[i]] for i in range(len(self.q))])
+		(pInverse, qInverse) = (self.p.inverse(), self.q.inverse())
+		self.assertEqual(list(composed.inverse()), [qInverse[pInverse[i]] for i in range(len(self.p))])
+		self.assertEqual([composed.inverse()[composed[i]] for i in range(len(composed))], list(range(len(composed))))
+		self.assertEqual(list(utils.Permutation([self.p[pInverse[i]] for i in range(len(self.p))])), list(range(len(self.p))))
+
+	def testWithoutNumpy(self):
+		saved = utils.numpy
+		utils.numpy = None
+		try:
+			values = self.shuffled(300)
+			self.assertEqual(list(utils.Permutation(values).positions), [values.index(v) for v in range(300)])
+			with self.assertRaises(AssertionError):
+				utils.Permutation([0, 1, 1])
+		finally:
+			utils.numpy = saved
+
+	def testNotAPermutation(self):
+		with self.assertRaises(AssertionError):
+			utils.Permutation([0, 2, 2])
+		self.assertNotIn(300, self.p)
+		self.assertNotIn("1", self.p)
+		with self.assertRaises(ValueError):
+			self.p.index(300)
+
+	def testInverseStaysAnArray(self):
+		# secretChoice hands the inverse of the shuffled shard indices to obliviousSend as it is.
+		shardIndices = utils.shuffle(utils.Permutation(1000))
+		shardPermutation = shardIndices.inverse()
+		for p in (shardIndices, shardPermutation):
+			self.assertIsInstance(p, utils.Permutation)
+			self.assertIsInstance(p.values, array)
+			self.assertIsInstance(p.positions, array)
+			self.assertEqual(p.values.typecode, utils.indexType)
+		self.assertEqual(sorted(shardPermutation), list(range(1000)))
+		self.assertIsInstance(shardPermutation[0], int)
+
+class PerformSwapsTest(unittest.TestCase):
+
+	def testMatchesAList(self):
+		generator = random.Random(21)
+		for count in (1, 2, 7, 500):
+			swaps = swapsOf(generator, count)
+			plain = utils.performSwaps(list(range(count)), swaps)
+			permutation = utils.performSwaps(utils.Permutation(count), swaps)
+			indexed = utils.performSwaps(utils.IndexedSequence(range(count)), swaps)
+			self.assertEqual(list(permutation), plain)
+			self.assertEqual(list(indexed), plain)
+			self.assertEqual([permutation.index(v) for v in range(count)], [plain.index(v) for v in range(count)])
+			self.assertEqual([indexed.index(v) for v in range(count)], [plain.index(v) for v in range(count)])
+			# Undone by the same swaps in reverse.
+			self.assertEqual(utils.performSwaps(plain, reversed(swaps)), list(range(count)))
+
+	def testIndexedSequence(self):
+		sequence = utils.IndexedSequence(["a", "b", "c", "d"])
+		utils.performSwaps(sequence, [(0, 3), (1, 2)])
+		self.assertEqual(list(sequence), ["d", "c", "b", "a"])
+		self.assertEqual(sequence.index("a"), 3)
+		# One element at a time, the old value is gone only where it was.
+		(sequence[0], sequence[3]) = (sequence[3], sequence[0])
+		self.assertEqual([sequence.index(v) for v in "abcd"], [0, 2, 1, 3])
+		sequence[1] = "e"
+		self.assertNotIn("c", sequence)
+		self.assertIn("e", sequence)
+		with self.assertRaises(ValueError):
+			sequence.index("c")
+		with self.assertRaises(AssertionError):
+			utils.IndexedSequence(["a", "a"])
+
+if __name__ == "__main__":
+	unittest.main()